@@ -1,6 +1,16 @@
 from flask import Flask, render_template
 from database import db, init_db
 from routes import register_routes
+from services.background_jobs import init_background_jobs, start_background_jobs
+from services.backup import backup_scheduler
+from services.balance import init_balance
+from services.conditional_get import init_conditional_get
+from services.invoices import init_invoices
+from services.ledger import init_ledger
+from services.notification_retention import notification_retention
+from services.notification_scheduler import notification_scheduler
+from services.recurrence_scheduler import recurrence_scheduler
+from services.response_cache import calendar_events_cache
 import os
 
 # Importa models ANTES de criar o app/banco para garantir que o SQLAlchemy
@@ -20,16 +30,103 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Recorrência: leituras calculam as ocorrências mensais sem gravar filhos no banco.
+# Um filho só é gravado quando o usuário edita/consolida a ocorrência.
+# False volta ao comportamento antigo (materializar durante GETs).
+app.config['RECURRENCE_VIRTUAL'] = True
+
+# Agendador em background: mantém os filhos gravados do mês atual até +N meses.
+app.config['RECURRENCE_SCHEDULER_ENABLED'] = True
+app.config['RECURRENCE_HORIZON_MONTHS'] = 12
+app.config['RECURRENCE_SCHEDULER_INTERVAL'] = 3600  # segundos
+
+# Dashboard: janela padrão (em meses) da tendência mensal; ?months=N sobrescreve até o máximo.
+app.config['DASHBOARD_TREND_MONTHS'] = 6
+app.config['DASHBOARD_TREND_MAX_MONTHS'] = 120
+
+# Faturas: meses antes/depois do mês atual na timeline; ?before=N&after=M sobrescrevem até o máximo.
+app.config['INVOICE_TIMELINE_MONTHS_BEFORE'] = 6
+app.config['INVOICE_TIMELINE_MONTHS_AFTER'] = 5
+app.config['INVOICE_TIMELINE_MAX_MONTHS'] = 60
+
+# Cache em memória de /calendar/api/events (entradas LRU e validade em segundos).
+# A chave inclui a versão dos dados, então commits invalidam na hora; o TTL cobre
+# o que muda só com o tempo (ex.: boleto passando a "Vencido").
+app.config['CALENDAR_CACHE_SIZE'] = 256
+app.config['CALENDAR_CACHE_TTL'] = 60
+
+# SSE de notificações: intervalo (segundos) dos comentários de keep-alive
+app.config['NOTIFICATION_STREAM_KEEPALIVE'] = 25
+
+# Agendador de notificações: dispara alertas de vencimento/limite no horário
+# (heap de prazos atualizado a cada commit), sem depender de POST /generate.
+app.config['NOTIFICATION_SCHEDULER_ENABLED'] = True
+
+# Lista de notificações paginada por cursor (?limit=N até o máximo, ?cursor=...)
+app.config['NOTIFICATIONS_PAGE_SIZE'] = 50
+app.config['NOTIFICATIONS_PAGE_MAX'] = 200
+
+# Retenção: lidas com mais de N dias vão para notifications_archive, em lotes, 1x por dia
+app.config['NOTIFICATION_RETENTION_ENABLED'] = True
+app.config['NOTIFICATION_RETENTION_DAYS'] = 90
+app.config['NOTIFICATION_RETENTION_BATCH'] = 500
+app.config['NOTIFICATION_RETENTION_INTERVAL'] = 86400  # segundos
+
+# Importação em lote de compras (/cards/api/transactions/bulk): máximo de linhas por envio
+app.config['CARD_IMPORT_MAX_ROWS'] = 5000
+
+# Importação de extratos (/accounts/api/accounts/import): linhas gravadas por commit
+app.config['ACCOUNT_IMPORT_CHUNK_SIZE'] = 1000
+
+# Backup a quente do banco (API de backup online do SQLite) em backups/, 1x por dia.
+# Cópia em passos de N páginas com pausa entre eles: o lock de leitura dura só um passo.
+app.config['BACKUP_ENABLED'] = True
+app.config['BACKUP_DIR'] = os.path.join(BASE_DIR, 'backups')
+app.config['BACKUP_INTERVAL'] = 86400  # segundos
+app.config['BACKUP_KEEP'] = 7  # snapshots mantidos (os mais antigos são apagados)
+app.config['BACKUP_PAGES_PER_STEP'] = 256
+app.config['BACKUP_STEP_SLEEP'] = 0.01  # segundos entre passos
+app.config['BACKUP_MAX_RESTARTS'] = 5  # recomeços (banco alterado) antes do passo único (WAL) ou de desistir
+app.config['BACKUP_RETRY_INTERVAL'] = 300  # segundos até nova tentativa quando o backup é adiado
+
+# Jobs de background em flask run / servidor WSGI: iniciados na primeira requisição
+# (python app.py inicia já no boot, no bloco __main__). False = não iniciar.
+app.config['BACKGROUND_JOBS_AUTOSTART'] = True
+
 # Inicializar banco de dados
 init_db(app)
+init_ledger(app)
+init_invoices(app)
+init_balance(app)
+
+# Jobs de background: init_app só configura; as threads sobem em start_background_jobs
+# (bloco __main__ ou primeira requisição), nunca ao importar o app (scripts, testes, migrações).
+recurrence_scheduler.init_app(app)
+
+calendar_events_cache.init_app(app)
+
+# Agendador de notificações (carrega os prazos e dorme até o próximo)
+notification_scheduler.init_app(app)
+notification_retention.init_app(app)
+
+# Snapshots periódicos do banco com rotação (restauração: backup_db.py --restore)
+backup_scheduler.init_app(app)
+
+# flask run / WSGI: inicia os jobs na primeira requisição (BACKGROUND_JOBS_AUTOSTART)
+init_background_jobs(app)
 
 # Registrar rotas
 register_routes(app)
 
+# ETag / 304 nos GETs das APIs (versão dos dados por grupo de tabelas)
+init_conditional_get(app)
+
 @app.route('/')
 def index():
     """Página inicial"""
     return render_template('index.html')
 
 if __name__ == '__main__':
+    # Com debug=True o reloader executa este bloco no pai e no filho: jobs só no filho
+    start_background_jobs(app, use_reloader=True)
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Backup, listagem e restauração do banco gestor_gastos.db.
+
+Uso:
+  python backup_db.py                      # gera um snapshot agora em backups/ (com rotação)
+  python backup_db.py --list               # lista os snapshots (mais recente primeiro)
+  python backup_db.py --restore ARQUIVO    # restaura um snapshot (pare o app antes!)
+
+Com o app rodando os snapshots já são gerados automaticamente (BACKUP_* em app.py).
+Não importa o app: restaurar não pode disputar o banco com as threads de background.
+"""
+
+import os
+import sys
+
+from services.backup import DEFAULT_KEEP, create_backup, list_backups, restore_backup
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DB_PATH = os.path.join(BASE_DIR, 'gestor_gastos.db')
+BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
+
+
+def show_list():
+    backups = list_backups(DB_PATH, BACKUP_DIR)
+    if not backups:
+        print(f"Nenhum snapshot em {BACKUP_DIR}")
+        return
+
+    for b in backups:
+        print(f"  {b['name']}  {b['size'] / 1024 / 1024:8.1f} MB  {b['created_at']}")
+
+
+def restore(name: str):
+    path = name if os.path.exists(name) else os.path.join(BACKUP_DIR, name)
+    if not os.path.exists(path):
+        print(f"✗ Snapshot não encontrado: {name}")
+        sys.exit(1)
+
+    try:
+        m = restore_backup(path, DB_PATH)
+    except Exception as e:
+        print(f"✗ Falha ao restaurar: {e}")
+        sys.exit(1)
+
+    print(f"✓ {DB_PATH} restaurado de {os.path.basename(path)} em {m['seconds']}s ({m['pages']} páginas).")
+    if m['safety_copy']:
+        print(f"  Banco anterior salvo em {m['safety_copy']}")
+
+
+def main():
+    if '--list' in sys.argv:
+        show_list()
+        return
+
+    if '--restore' in sys.argv:
+        index = sys.argv.index('--restore')
+        if index + 1 >= len(sys.argv):
+            print("✗ Informe o snapshot: python backup_db.py --restore ARQUIVO")
+            sys.exit(1)
+        restore(sys.argv[index + 1])
+        return
+
+    if not os.path.exists(DB_PATH):
+        print(f"✗ Banco não encontrado: {DB_PATH}")
+        sys.exit(1)
+
+    m = create_backup(DB_PATH, BACKUP_DIR, DEFAULT_KEEP)
+    print(
+        f"✓ Snapshot {m['name']} ({m['size'] / 1024 / 1024:.1f} MB) em {m['seconds']}s: "
+        f"{m['steps']} passos, maior passo {m['max_step_seconds']}s, {m['restarts']} recomeços."
+    )
+    for name in m['rotated']:
+        print(f"  Removido (rotação): {name}")
+
+
+if __name__ == '__main__':
+    main()
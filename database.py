@@ -8,8 +8,14 @@ def init_db(app):
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        _ensure_wal_mode()
         _ensure_accounts_recurrence_columns()
         _ensure_credit_cards_optional_columns()
+        _ensure_period_columns()
+        _ensure_notifications_period_column()
+        _ensure_recurrence_watermark_triggers()
+        _ensure_indexes()
+        _print_index_report()
 
 def _table_exists(table_name: str) -> bool:
     row = db.session.execute(
@@ -18,9 +24,24 @@ def _table_exists(table_name: str) -> bool:
     ).fetchone()
     return row is not None
 
+def _ensure_wal_mode():
+    """
+    Liga o journal WAL (fica gravado no arquivo do banco).
+    Com WAL, leitores (ex.: backup online em services/backup.py) não bloqueiam
+    gravações e gravações não bloqueiam leitores.
+    """
+    try:
+        mode = db.session.execute(text("PRAGMA journal_mode=WAL")).scalar()
+        db.session.commit()
+        if mode not in ('wal', 'memory'):
+            print(f"⚠️ Journal WAL não disponível (modo atual: {mode}); backups podem esperar gravações")
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Falha ao ativar WAL: {e}")
+
 def _ensure_accounts_recurrence_columns():
     """
-    Garante colunas necessárias para recorrência em 'accounts' (SQLite).
+    Garante colunas necessárias para recorrência (e importação de extratos) em 'accounts' (SQLite).
     Idempotente: se já existir, não faz nada.
     """
     try:
@@ -42,6 +63,11 @@ def _ensure_accounts_recurrence_columns():
             changed = True
             print("🛠️ Auto-migração: adicionada coluna accounts.recurring_day")
 
+        if "import_hash" not in cols:
+            db.session.execute(text("ALTER TABLE accounts ADD COLUMN import_hash VARCHAR(40)"))
+            changed = True
+            print("🛠️ Auto-migração: adicionada coluna accounts.import_hash")
+
         if changed:
             db.session.commit()
 
@@ -83,3 +109,319 @@ def _ensure_credit_cards_optional_columns():
     except Exception as e:
         db.session.rollback()
         print(f"⚠️ Falha ao checar/aplicar auto-migração em credit_cards: {e}")
+
+
+def _ensure_period_columns():
+    """Garante as chaves de período (year*100+month) em 'accounts' e 'installments' (SQLite).
+
+    - accounts.period: derivada de accounts.date
+    - installments.statement_period: derivada de statement_year/statement_month
+
+    Idempotente: adiciona as colunas se faltarem e preenche apenas linhas sem valor
+    ou com valor divergente. Depois disso os models mantêm as colunas em dia.
+    """
+    try:
+        changed = False
+
+        if _table_exists('accounts'):
+            if "period" not in _table_columns('accounts'):
+                db.session.execute(text("ALTER TABLE accounts ADD COLUMN period INTEGER"))
+                changed = True
+                print("🛠️ Auto-migração: adicionada coluna accounts.period")
+
+            result = db.session.execute(text(
+                "UPDATE accounts "
+                "SET period = CAST(strftime('%Y', date) AS INTEGER) * 100 + CAST(strftime('%m', date) AS INTEGER) "
+                "WHERE date IS NOT NULL AND (period IS NULL OR period != "
+                "CAST(strftime('%Y', date) AS INTEGER) * 100 + CAST(strftime('%m', date) AS INTEGER))"
+            ))
+            if result.rowcount:
+                changed = True
+                print(f"🛠️ Auto-migração: accounts.period preenchida em {result.rowcount} linhas")
+
+        if _table_exists('installments'):
+            if "statement_period" not in _table_columns('installments'):
+                db.session.execute(text("ALTER TABLE installments ADD COLUMN statement_period INTEGER"))
+                changed = True
+                print("🛠️ Auto-migração: adicionada coluna installments.statement_period")
+
+            result = db.session.execute(text(
+                "UPDATE installments "
+                "SET statement_period = statement_year * 100 + statement_month "
+                "WHERE statement_year IS NOT NULL AND statement_month IS NOT NULL "
+                "AND (statement_period IS NULL OR statement_period != statement_year * 100 + statement_month)"
+            ))
+            if result.rowcount:
+                changed = True
+                print(f"🛠️ Auto-migração: installments.statement_period preenchida em {result.rowcount} linhas")
+
+        if changed:
+            db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Falha ao checar/aplicar auto-migração de períodos: {e}")
+
+
+def _ensure_notifications_period_column():
+    """Garante notifications.period, parte da chave de deduplicação (SQLite).
+
+    Ao criar a coluna, preenche as notificações existentes: fatura -> statement
+    (year*100+month), boleto -> mês do vencimento, demais -> mês de created_at.
+    Duplicatas legadas da mesma chave ficam com period NULL (exceto a mais
+    recente) para que o índice único ux_notifications_dedupe possa ser criado.
+    """
+    try:
+        if not _table_exists('notifications') or "period" in _table_columns('notifications'):
+            return
+
+        db.session.execute(text("ALTER TABLE notifications ADD COLUMN period INTEGER"))
+        print("🛠️ Auto-migração: adicionada coluna notifications.period")
+
+        def month_of(col):
+            return f"CAST(strftime('%Y', {col}) AS INTEGER) * 100 + CAST(strftime('%m', {col}) AS INTEGER)"
+
+        rows = db.session.execute(text(
+            "SELECT n.id, n.type, n.reference_type, n.reference_id, COALESCE("
+            "CASE n.reference_type "
+            "WHEN 'invoice' THEN (SELECT i.year * 100 + i.month FROM invoices i WHERE i.id = n.reference_id) "
+            f"WHEN 'bill' THEN (SELECT {month_of('b.due_date')} FROM bills b WHERE b.id = n.reference_id) "
+            f"END, {month_of('n.created_at')}) "
+            "FROM notifications n WHERE n.reference_id IS NOT NULL ORDER BY n.id DESC"
+        )).fetchall()
+
+        seen = set()
+        params = []
+        for notification_id, type_, reference_type, reference_id, period in rows:
+            key = (type_, reference_type, reference_id, period)
+            if period is None or key in seen:
+                continue
+            seen.add(key)
+            params.append({'id': notification_id, 'period': period})
+
+        if params:
+            db.session.execute(text("UPDATE notifications SET period = :period WHERE id = :id"), params)
+            print(f"🛠️ Auto-migração: notifications.period preenchida em {len(params)} linhas")
+
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Falha ao checar/aplicar auto-migração em notifications: {e}")
+
+
+# Triggers que invalidam recurrence_watermark (models.RecurrenceWatermark): a
+# marca só vale enquanto nenhuma origem nova/alterada precisar de filhos e
+# nenhum filho gravado sumir. Ficam no banco para valer também para outros
+# processos, scripts e migrações.
+_RECURRENCE_WATERMARK_TRIGGERS = (
+    ('tr_accounts_watermark_insert',
+     "AFTER INSERT ON accounts WHEN NEW.recurring = 1 AND NEW.parent_id IS NULL"),
+    ('tr_accounts_watermark_update',
+     "AFTER UPDATE OF date, recurring, parent_id, period ON accounts "
+     "WHEN (NEW.recurring = 1 AND NEW.parent_id IS NULL) OR OLD.parent_id IS NOT NULL"),
+    ('tr_accounts_watermark_delete',
+     "AFTER DELETE ON accounts WHEN OLD.parent_id IS NOT NULL"),
+)
+
+
+def _ensure_recurrence_watermark_triggers():
+    """Cria os triggers de _RECURRENCE_WATERMARK_TRIGGERS (SQLite). Idempotente."""
+    try:
+        if not _table_exists('accounts') or not _table_exists('recurrence_watermark'):
+            return
+
+        for name, definition in _RECURRENCE_WATERMARK_TRIGGERS:
+            db.session.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {name} {definition} "
+                "BEGIN DELETE FROM recurrence_watermark; END"
+            ))
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Falha ao criar triggers de recurrence_watermark: {e}")
+
+
+# Índices compostos dos caminhos quentes (fatura/statement, vencimentos, recorrência).
+# (nome, tabela, colunas). Colunas extras no fim tornam o índice "covering"
+# para os SUM(amount) mais frequentes, evitando ir na tabela.
+_INDEXES = (
+    # CreditCard.get_bill_for_month / get_open_bill_for_month, pagar/despagar fatura
+    ('ix_installments_statement', 'installments',
+     ('statement_period', 'paid', 'transaction_id', 'amount')),
+    # CreditCard.get_total_used (parcelas em aberto por transação)
+    ('ix_installments_paid_tx', 'installments', ('paid', 'transaction_id', 'amount')),
+    # Join Installment -> Transaction e cascade de delete
+    ('ix_installments_transaction', 'installments', ('transaction_id',)),
+    # Calendário: parcelas por vencimento
+    ('ix_installments_due_date', 'installments', ('due_date', 'paid')),
+    # Join Transaction -> CreditCard e gastos de cartão por período
+    ('ix_transactions_card_date', 'transactions', ('card_id', 'date', 'amount')),
+    ('ix_transactions_date', 'transactions', ('date', 'card_id', 'amount')),
+    # Boletos por status + vencimento; só por vencimento usa skip-scan em paid (2 valores)
+    ('ix_bills_paid_due', 'bills', ('paid', 'due_date', 'amount')),
+    # Faturas por cartão + statement e por vencimento (calendário/notificações)
+    ('ix_invoices_card_period', 'invoices', ('card_id', 'year', 'month')),
+    ('ix_invoices_due_date', 'invoices', ('due_date', 'status')),
+    # Saldo projetado: faturas pagas/abertas por período
+    ('ix_invoices_status_period', 'invoices', ('status', 'year', 'month', 'amount')),
+    # Recorrência: filhos existentes de vários meses de uma vez (materialização em lote)
+    ('ix_accounts_period_parent', 'accounts', ('period', 'parent_id')),
+    # Resumos/dashboard: lançamentos por tipo e período; só por data usa skip-scan em type
+    ('ix_accounts_type_date', 'accounts', ('type', 'date', 'consolidated', 'amount')),
+    # Notificações: paginação por cursor (created_at, id), com e sem filtro de lidas;
+    # o primeiro também atende o job de retenção (lidas mais antigas que X)
+    ('ix_notifications_read_created', 'notifications', ('read', 'created_at', 'id')),
+    ('ix_notifications_created', 'notifications', ('created_at', 'id')),
+)
+
+# Índices únicos (mesmo formato). Se houver duplicatas legadas no banco, o índice
+# não é criado e o relatório mostra o problema; o restante segue normalmente.
+_UNIQUE_INDEXES = (
+    # Recorrência: no máximo um filho por origem por mês (parent_id + period).
+    # Também atende a busca "filho da origem X no mês Y".
+    ('ux_accounts_parent_period', 'accounts', ('parent_id', 'period')),
+    # Importação de extratos: dedupe por hash do conteúdo (NULLs não conflitam)
+    ('ux_accounts_import_hash', 'accounts', ('import_hash',)),
+    # Notificações: uma por referência por período (INSERT ... ON CONFLICT DO NOTHING)
+    ('ux_notifications_dedupe', 'notifications', ('type', 'reference_type', 'reference_id', 'period')),
+)
+
+
+# Índices que não fazem mais parte do esquema (renomeados ou redundantes com os
+# acima): removidos na inicialização, já que só custam nas gravações.
+_DROPPED_INDEXES = (
+    'ix_accounts_parent_date',    # virou ux_accounts_parent_period (parent_id, period)
+    'ix_accounts_parent_period',  # idem, antes da versão única
+    'ix_bills_due_paid',          # coberto por ix_bills_paid_due
+    'ix_accounts_date',           # coberto por ix_accounts_type_date
+)
+
+
+def _all_indexes():
+    for name, table, columns in _INDEXES:
+        yield name, table, columns, False
+    for name, table, columns in _UNIQUE_INDEXES:
+        yield name, table, columns, True
+
+
+def _table_columns(table_name: str) -> set:
+    rows = db.session.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
+    return {row[1] for row in rows}
+
+
+def _existing_indexes() -> set:
+    rows = db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type='index'")
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def _index_definition(name: str) -> tuple[str, tuple, bool] | None:
+    """(tabela, colunas, único) de um índice existente no banco, ou None."""
+    row = db.session.execute(
+        text("SELECT tbl_name, sql FROM sqlite_master WHERE type='index' AND name=:name"),
+        {"name": name}
+    ).fetchone()
+    if row is None:
+        return None
+
+    columns = tuple(
+        info[2] for info in sorted(db.session.execute(text(f"PRAGMA index_info({name})")).fetchall())
+    )
+    unique = (row[1] or '').upper().startswith('CREATE UNIQUE')
+    return row[0], columns, unique
+
+
+def _ensure_indexes():
+    """Cria os índices de _INDEXES/_UNIQUE_INDEXES que ainda não existem (SQLite).
+
+    Idempotente. Índice existente com o mesmo nome mas outra definição (colunas
+    ou unicidade mudaram) é recriado; os de _DROPPED_INDEXES são removidos.
+    Índices cujas tabelas/colunas ainda não existem são ignorados e ficam para a
+    próxima inicialização.
+    """
+    try:
+        existing = _existing_indexes()
+        created = []
+        recreated = []
+        dropped = []
+
+        for name in _DROPPED_INDEXES:
+            if name in existing:
+                db.session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+                dropped.append(name)
+
+        for name, table, columns, unique in _all_indexes():
+            if not _table_exists(table):
+                continue
+
+            outdated = False
+            if name in existing:
+                if _index_definition(name) == (table, tuple(columns), unique):
+                    continue
+                outdated = True
+
+            missing = [c for c in columns if c not in _table_columns(table)]
+            if missing:
+                print(f"⚠️ Índice {name} ignorado: colunas ausentes em {table}: {', '.join(missing)}")
+                continue
+
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            try:
+                # Se a criação falhar, o savepoint devolve o índice antigo
+                with db.session.begin_nested():
+                    if outdated:
+                        db.session.execute(text(f"DROP INDEX {name}"))
+                    db.session.execute(text(
+                        f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+                    ))
+            except Exception as e:
+                print(f"⚠️ Índice {name} não criado (dados duplicados?): {e}")
+                continue
+            (recreated if outdated else created).append(name)
+
+        if created or recreated or dropped:
+            if created or recreated:
+                db.session.execute(text("ANALYZE"))
+            db.session.commit()
+            for name in created:
+                print(f"🛠️ Auto-migração: criado índice {name}")
+            for name in recreated:
+                print(f"🛠️ Auto-migração: índice {name} recriado (definição mudou)")
+            for name in dropped:
+                print(f"🛠️ Auto-migração: removido índice obsoleto {name}")
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Falha ao checar/criar índices: {e}")
+
+
+def get_index_report() -> list[dict]:
+    """Relatório dos índices esperados: nome, tabela, colunas e se existe no banco (com essa definição)."""
+    return [
+        {
+            'name': name,
+            'table': table,
+            'columns': list(columns),
+            'unique': unique,
+            'exists': _index_definition(name) == (table, tuple(columns), unique),
+        }
+        for name, table, columns, unique in _all_indexes()
+    ]
+
+
+def _print_index_report():
+    try:
+        report = get_index_report()
+    except Exception as e:
+        print(f"⚠️ Falha ao gerar relatório de índices: {e}")
+        return
+
+    ok = sum(1 for item in report if item['exists'])
+    print(f"📇 Índices: {ok}/{len(report)} presentes")
+    for item in report:
+        mark = '✓' if item['exists'] else '✗'
+        unique = 'UNIQUE ' if item['unique'] else ''
+        print(f"  {mark} {unique}{item['name']} ON {item['table']}({', '.join(item['columns'])})")
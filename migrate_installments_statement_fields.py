@@ -9,14 +9,11 @@ Notas:
 - Para tornar mais robusto, ele garante db.create_all() antes de tentar ALTER.
 """
 
-from datetime import datetime
-from calendar import monthrange
-
 from app import app
 from database import db
 from models import Transaction, CreditCard
 from sqlalchemy import text
-from dateutil.relativedelta import relativedelta
+from services import statement_calendar
 import sys
 
 
@@ -29,23 +26,6 @@ def _add_column_if_missing(table: str, col: str, col_type_sql: str, existing_col
     return True
 
 
-def _compute_first_statement_for_transaction(card: CreditCard, tx_date: datetime):
-    closing_day = min(card.closing_day, monthrange(tx_date.year, tx_date.month)[1])
-    closing_date = datetime(tx_date.year, tx_date.month, closing_day)
-
-    if tx_date >= closing_date:
-        first = datetime(tx_date.year, tx_date.month, 1) + relativedelta(months=1)
-    else:
-        first = datetime(tx_date.year, tx_date.month, 1)
-
-    return first.month, first.year
-
-
-def _invoice_due_date(card: CreditCard, month: int, year: int) -> datetime:
-    due_day = min(card.due_day, monthrange(year, month)[1])
-    return datetime(year, month, due_day)
-
-
 def migrate():
     print("=" * 60)
     print("MIGRAÇÃO: Colunas statement e auditoria em installments")
@@ -96,22 +76,23 @@ def migrate():
                 if not card or not tx.date:
                     continue
 
-                first_m, first_y = _compute_first_statement_for_transaction(card, tx.date)
+                total = max([tx.installments_total or 1] + [inst.installment_number for inst in tx.installments])
+                statements = statement_calendar.statements_from_date(card, tx.date, total)
 
                 for inst in tx.installments:
                     if inst.statement_month and inst.statement_year:
                         continue
 
-                    ref = datetime(first_y, first_m, 1) + relativedelta(months=(inst.installment_number - 1))
-                    inst.statement_month = ref.month
-                    inst.statement_year = ref.year
+                    stmt = statements[inst.installment_number - 1]
+                    inst.statement_month = stmt.month
+                    inst.statement_year = stmt.year
 
                     if not inst.original_statement_month:
                         inst.original_statement_month = inst.statement_month
                     if not inst.original_statement_year:
                         inst.original_statement_year = inst.statement_year
 
-                    inst.due_date = _invoice_due_date(card, inst.statement_month, inst.statement_year)
+                    inst.due_date = stmt.due_date
 
                     backfilled += 1
 
@@ -1,9 +1,17 @@
 from database import db
-from datetime import datetime, timedelta
-from sqlalchemy import func
+from datetime import datetime
+from sqlalchemy import func, event
 from calendar import monthrange
 from dateutil.relativedelta import relativedelta
 
+from services import statement_calendar
+
+
+def period_key(year: int, month: int) -> int:
+    """Chave inteira de mês/ano (ex.: 2026, 10 -> 202610), indexável e ordenável."""
+    return int(year) * 100 + int(month)
+
+
 class CreditCard(db.Model):
     """Modelo para Cartões de Crédito"""
     __tablename__ = 'credit_cards'
@@ -33,8 +41,7 @@ class CreditCard(db.Model):
         """Calcula o valor total da fatura para um mês/ano específico (total do ciclo, mesmo se já tiver sido pago)."""
         total = db.session.query(func.sum(Installment.amount)).join(Transaction).filter(
             Transaction.card_id == self.id,
-            Installment.statement_month == month,
-            Installment.statement_year == year
+            Installment.statement_period == period_key(year, month)
         ).scalar() or 0.0
         return total
 
@@ -42,8 +49,7 @@ class CreditCard(db.Model):
         """Calcula o valor em aberto da fatura (apenas parcelas não pagas) para um mês/ano."""
         total = db.session.query(func.sum(Installment.amount)).join(Transaction).filter(
             Transaction.card_id == self.id,
-            Installment.statement_month == month,
-            Installment.statement_year == year,
+            Installment.statement_period == period_key(year, month),
             Installment.paid == False
         ).scalar() or 0.0
         return total
@@ -65,18 +71,29 @@ class CreditCard(db.Model):
         ).scalar() or 0.0
         return total
 
-    def to_dict(self):
-        today = datetime.now()
+    def to_dict(self, stats=None):
+        """Serializa o cartão.
+
+        stats: mapa pré-calculado por services.card_stats.compute_card_stats (evita
+        4 SUMs por cartão em listagens). Sem ele, calcula só para este cartão.
+        """
+        from services.card_stats import compute_card_stats, get_card_stats
+
+        if stats is None:
+            stats = compute_card_stats([self.id])
+        card_stats = get_card_stats(stats, self.id)
+
+        total = float(self.limit_total or 0.0)
         return {
             'id': self.id,
             'name': self.name,
-            'limit_total': float(self.limit_total or 0.0),
-            'limit_available': float(self.get_available_limit()),
+            'limit_total': total,
+            'limit_available': total - card_stats['total_used'],
             # Compat: current_bill agora significa "em aberto" (zera quando pagar)
-            'current_bill': float(self.get_current_bill_amount()),
+            'current_bill': card_stats['current_bill'],
             # Extra (não quebra front antigo): total do mês atual (mesmo se pago)
-            'current_bill_total': float(self.get_bill_for_month(today.month, today.year)),
-            'total_used': float(self.get_total_used()),
+            'current_bill_total': card_stats['current_bill_total'],
+            'total_used': card_stats['total_used'],
             'closing_day': self.closing_day,
             'due_day': self.due_day,
             'flag': self.flag,
@@ -86,6 +103,32 @@ class CreditCard(db.Model):
             'active': self.active
         }
 
+def plan_installments(card, tx_date: datetime, amount: float, installments_total: int) -> list[dict]:
+    """Parcelas de uma compra calculadas em memória (colunas de Installment, sem transaction_id).
+
+    Usado por Transaction.create_installments e pela importação em lote, que
+    insere as linhas sem passar pelo ORM. Statements e vencimentos vêm do
+    calendário memorizado (services/statement_calendar.py).
+    """
+    installments_total = installments_total or 1
+    amount_per_installment = amount if installments_total == 1 else amount / installments_total
+
+    rows = []
+    for i, stmt in enumerate(statement_calendar.statements_from_date(card, tx_date, installments_total), start=1):
+        rows.append({
+            'installment_number': i,
+            'total_installments': installments_total,
+            'amount': amount_per_installment,
+            'due_date': stmt.due_date,
+            'statement_month': stmt.month,
+            'statement_year': stmt.year,
+            'original_statement_month': stmt.month,
+            'original_statement_year': stmt.year,
+            'paid': False,
+        })
+    return rows
+
+
 class Transaction(db.Model):
     """Modelo para Transações de Cartão"""
     __tablename__ = 'transactions'
@@ -103,33 +146,12 @@ class Transaction(db.Model):
 
     def _first_statement_month_year(self):
         """Define em qual fatura a compra cai (parcela 1)."""
-        card = self.card
-        tx_date = self.date
-
-        closing_day = min(card.closing_day, monthrange(tx_date.year, tx_date.month)[1])
-        closing_date = datetime(tx_date.year, tx_date.month, closing_day)
-
-        if tx_date >= closing_date:
-            ref = datetime(tx_date.year, tx_date.month, 1) + relativedelta(months=1)
-        else:
-            ref = datetime(tx_date.year, tx_date.month, 1)
-
-        return ref.month, ref.year
+        stmt = statement_calendar.statement_for_date(self.card, self.date)
+        return stmt.month, stmt.year
 
     def _invoice_due_date(self, month: int, year: int) -> datetime:
-        """Calcula vencimento da fatura do cartão para um statement (mês/ano).
-
-        Suporta due_day > último dia do mês (ex.: default fechamento + 7 dias).
-        """
-        card = self.card
-        due_day = card.due_day or ((card.closing_day or 1) + 7)
-
-        days_in_month = monthrange(year, month)[1]
-        if due_day <= days_in_month:
-            return datetime(year, month, due_day)
-
-        overflow = due_day - days_in_month
-        return datetime(year, month, days_in_month) + timedelta(days=overflow)
+        """Calcula vencimento da fatura do cartão para um statement (mês/ano)."""
+        return statement_calendar.due_date(self.card, month, year)
 
     def create_installments(self):
         """Cria parcelas de forma não ambígua.
@@ -137,44 +159,8 @@ class Transaction(db.Model):
         - Cada parcela recebe statement_month/year (em qual fatura aparece).
         - due_date passa a ser o vencimento do cartão naquele statement (igual apps).
         """
-        first_month, first_year = self._first_statement_month_year()
-
-        if self.installments_total == 1:
-            due_date = self._invoice_due_date(first_month, first_year)
-            installment = Installment(
-                transaction_id=self.id,
-                installment_number=1,
-                total_installments=1,
-                amount=self.amount,
-                due_date=due_date,
-                statement_month=first_month,
-                statement_year=first_year,
-                original_statement_month=first_month,
-                original_statement_year=first_year,
-                paid=False
-            )
-            db.session.add(installment)
-        else:
-            amount_per_installment = self.amount / self.installments_total
-            base = datetime(first_year, first_month, 1)
-            for i in range(1, self.installments_total + 1):
-                ref = base + relativedelta(months=(i - 1))
-                stmt_month, stmt_year = ref.month, ref.year
-                due_date = self._invoice_due_date(stmt_month, stmt_year)
-
-                installment = Installment(
-                    transaction_id=self.id,
-                    installment_number=i,
-                    total_installments=self.installments_total,
-                    amount=amount_per_installment,
-                    due_date=due_date,
-                    statement_month=stmt_month,
-                    statement_year=stmt_year,
-                    original_statement_month=stmt_month,
-                    original_statement_year=stmt_year,
-                    paid=False
-                )
-                db.session.add(installment)
+        for row in plan_installments(self.card, self.date, self.amount, self.installments_total):
+            db.session.add(Installment(transaction_id=self.id, **row))
 
     def to_dict(self):
         return {
@@ -202,6 +188,8 @@ class Installment(db.Model):
     # Fonte de verdade: em qual fatura esta parcela aparece
     statement_month = db.Column(db.Integer)
     statement_year = db.Column(db.Integer)
+    # Chave year*100+month do statement (sincronizada automaticamente; ver _sync_period_keys)
+    statement_period = db.Column(db.Integer)
 
     # Auditoria (não ambíguo): onde a parcela estava originalmente
     original_statement_month = db.Column(db.Integer)
@@ -325,6 +313,8 @@ class Account(db.Model):
     type = db.Column(db.String(20), nullable=False)  # income, expense
     category = db.Column(db.String(50))
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Chave year*100+month de date (sincronizada automaticamente; ver _sync_period_keys)
+    period = db.Column(db.Integer)
 
     # SISTEMA DE RECORRÊNCIA (origem + instâncias por mês)
     recurring = db.Column(db.Boolean, default=False)  # Se é origem de recorrência
@@ -337,6 +327,9 @@ class Account(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Importação de extrato: hash do conteúdo da linha (índice único; NULL para lançamentos manuais)
+    import_hash = db.Column(db.String(40))
+
     # Relacionamentos
     children = db.relationship('Account', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
 
@@ -355,7 +348,7 @@ class Account(db.Model):
     def generate_next_months(self, num_months=12):
         """Gera lançamentos para os próximos N meses.
 
-        Evita duplicidade checando por parent_id + (year, month) (não por date exata).
+        Evita duplicidade checando por parent_id + period (year*100+month), não por date exata.
         """
         if not self.recurring or self.parent_id:
             return []
@@ -367,6 +360,13 @@ class Account(db.Model):
 
         day_pref = self.recurring_day or base_date.day
 
+        # Uma consulta para todos os meses já gerados desta origem
+        existing_periods = {
+            period for (period,) in db.session.query(Account.period).filter(
+                Account.parent_id == self.id
+            ).all()
+        }
+
         for i in range(1, num_months + 1):
             next_month_date = base_date + relativedelta(months=i)
 
@@ -377,13 +377,7 @@ class Account(db.Model):
             day = min(day_pref, max_day)
             target_date = datetime(year, month, day)
 
-            existing = Account.query.filter(
-                Account.parent_id == self.id,
-                db.extract('year', Account.date) == year,
-                db.extract('month', Account.date) == month
-            ).first()
-
-            if existing:
+            if period_key(year, month) in existing_periods:
                 continue
 
             new_account = Account(
@@ -424,6 +418,92 @@ class Account(db.Model):
             'children_count': self.children.count() if self.recurring else 0
         }
 
+@event.listens_for(Account, 'before_insert')
+@event.listens_for(Account, 'before_update')
+@event.listens_for(Installment, 'before_insert')
+@event.listens_for(Installment, 'before_update')
+def _sync_period_keys(mapper, connection, target):
+    """Mantém Account.period e Installment.statement_period coerentes com as colunas de origem."""
+    if isinstance(target, Account):
+        if target.date is None:
+            # Mesmo valor que o default da coluna aplicaria no INSERT
+            target.date = datetime.utcnow()
+        target.period = period_key(target.date.year, target.date.month)
+    elif target.statement_year and target.statement_month:
+        target.statement_period = period_key(target.statement_year, target.statement_month)
+    else:
+        target.statement_period = None
+
+class MonthlyLedger(db.Model):
+    """Rollup mensal (desnormalizado) de lançamentos, compras e parcelas.
+
+    Mantido por eventos de flush (services/ledger.py). Uma linha por
+    (period, type, category, card_id, consolidated):
+    - type 'income'/'expense': accounts (period = mês de date; card_id = 0)
+    - type 'card': transactions (period = mês da compra; consolidated = False)
+    - type 'installment': installments (period = statement; consolidated = paid)
+    """
+    __tablename__ = 'monthly_ledger'
+    __table_args__ = (
+        db.UniqueConstraint('period', 'type', 'category', 'card_id', 'consolidated', name='ux_monthly_ledger_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(20), nullable=False)
+    category = db.Column(db.String(50), nullable=False, default='')
+    card_id = db.Column(db.Integer, nullable=False, default=0)
+    consolidated = db.Column(db.Boolean, nullable=False, default=False)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'period': self.period,
+            'type': self.type,
+            'category': self.category,
+            'card_id': self.card_id,
+            'consolidated': self.consolidated,
+            'amount': self.amount,
+            'count': self.count
+        }
+
+class BalanceSnapshot(db.Model):
+    """Saldo de fechamento acumulado até o fim de um mês (cache do saldo projetado).
+
+    closing_balance = receitas - despesas (accounts até o mês) - faturas pagas
+    (mês da fatura até o mês) - boletos pagos (vencimento até o mês).
+    Snapshots a partir de um mês alterado são apagados e recalculados sob demanda
+    (services/balance.py).
+    """
+    __tablename__ = 'balance_snapshots'
+
+    period = db.Column(db.Integer, primary_key=True)
+    closing_balance = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'period': self.period,
+            'closing_balance': self.closing_balance,
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+        }
+
+class RecurrenceWatermark(db.Model):
+    """Último período com todos os filhos recorrentes gravados (linha única, id=1).
+
+    Gravada pelo agendador de recorrência na mesma transação da materialização;
+    as leituras virtuais pulam os meses até ela (services/recurrence.py). Triggers
+    em accounts (database.py) apagam a linha quando uma origem é criada/alterada
+    ou um filho é removido, em qualquer processo ou script.
+    """
+    __tablename__ = 'recurrence_watermark'
+
+    id = db.Column(db.Integer, primary_key=True)
+    materialized_through = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class Category(db.Model):
     """Modelo para Categorias"""
     __tablename__ = 'categories'
@@ -454,6 +534,10 @@ class Notification(db.Model):
     link = db.Column(db.String(200))
     reference_id = db.Column(db.Integer)
     reference_type = db.Column(db.String(50))
+    # Chave de deduplicação (year*100+month) da referência: statement da fatura,
+    # mês do vencimento do boleto ou mês do alerta de limite.
+    # Índice único (type, reference_type, reference_id, period) em database.py.
+    period = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     read_at = db.Column(db.DateTime)
 
@@ -471,3 +555,25 @@ class Notification(db.Model):
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'read_at': self.read_at.strftime('%Y-%m-%d %H:%M:%S') if self.read_at else None
         }
+
+
+class NotificationArchive(db.Model):
+    """Notificações lidas antigas, movidas pelo job de retenção (services/notification_retention.py).
+
+    Mesmas colunas de Notification (mesmo id) + archived_at.
+    """
+    __tablename__ = 'notifications_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    type = db.Column(db.String(50), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    priority = db.Column(db.String(20))
+    read = db.Column(db.Boolean)
+    link = db.Column(db.String(200))
+    reference_id = db.Column(db.Integer)
+    reference_type = db.Column(db.String(50))
+    period = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime)
+    read_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Reconstrói ou verifica o rollup mensal (tabela monthly_ledger).
+
+Uso:
+  python rebuild_monthly_ledger.py           # recalcula tudo a partir de accounts/transactions/installments
+  python rebuild_monthly_ledger.py --check   # só compara rollup x tabelas de origem (exit 1 se divergir)
+
+Normalmente não é necessário: o rollup é mantido automaticamente a cada gravação.
+"""
+
+import sys
+
+from app import app
+from services.ledger import check_monthly_ledger, rebuild_monthly_ledger
+
+
+def check() -> bool:
+    problems = check_monthly_ledger()
+    if not problems:
+        print("✓ monthly_ledger consistente.")
+        return True
+
+    print(f"✗ {len(problems)} divergência(s) em monthly_ledger:")
+    for p in problems[:50]:
+        print(
+            f"  {p['period']} {p['type']:<11} cat={p['category'] or '-'} card={p['card_id']} "
+            f"consolidado={p['consolidated']}: esperado R$ {p['expected_amount']:.2f} ({p['expected_count']}) "
+            f"x rollup R$ {p['ledger_amount']:.2f} ({p['ledger_count']})"
+        )
+    if len(problems) > 50:
+        print(f"  ... e mais {len(problems) - 50}")
+    return False
+
+
+def main():
+    with app.app_context():
+        if '--check' in sys.argv:
+            sys.exit(0 if check() else 1)
+
+        rows = rebuild_monthly_ledger()
+        print(f"✓ monthly_ledger reconstruído: {rows} linhas.")
+        check()
+
+
+if __name__ == '__main__':
+    main()
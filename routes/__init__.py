@@ -9,6 +9,8 @@ def register_routes(app):
     from .invoices import invoices_bp
     from .notifications import notifications_bp
     from .calendar import calendar_bp
+    from .export import export_bp
+    from .backup import backup_bp
     
     app.register_blueprint(cards_bp)
     app.register_blueprint(bills_bp)
@@ -16,4 +18,6 @@ def register_routes(app):
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(invoices_bp)
     app.register_blueprint(notifications_bp)
-    app.register_blueprint(calendar_bp)
\ No newline at end of file
+    app.register_blueprint(calendar_bp)
+    app.register_blueprint(export_bp)
+    app.register_blueprint(backup_bp)
\ No newline at end of file
@@ -1,11 +1,22 @@
-from flask import Blueprint, request, jsonify, render_template
-from models import Account
+from flask import Blueprint, request, jsonify, render_template, current_app
+from models import Account, period_key
 from database import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from calendar import monthrange
 from sqlalchemy import and_, func
-
-from services.recurrence import ensure_recurring_materialized_for_month
+import traceback
+
+from services.account_import import detect_format, import_statement
+from services.recurrence import (
+    ensure_recurring_materialized_for_range,
+    iter_virtual_occurrences,
+    materialize_occurrence,
+    parse_virtual_occurrence_id,
+    virtual_mode_enabled,
+    virtual_occurrence_totals,
+)
+from services.ledger import sum_ledger
+from services.recurrence_scheduler import recurrence_scheduler
 
 accounts_bp = Blueprint('accounts', __name__, url_prefix='/accounts')
 
@@ -14,22 +25,6 @@ def _parse_date_ymd(value: str) -> datetime:
     return datetime.strptime(value, '%Y-%m-%d')
 
 
-def _materialize_recurring_for_range(start_dt: datetime, end_dt: datetime) -> int:
-    """Materializa recorrências mês a mês dentro do intervalo (inclusive)."""
-    created = 0
-    y, m = start_dt.year, start_dt.month
-    end_ym = (end_dt.year, end_dt.month)
-
-    while (y, m) <= end_ym:
-        created += ensure_recurring_materialized_for_month(y, m)
-        m += 1
-        if m > 12:
-            m = 1
-            y += 1
-
-    return created
-
-
 @accounts_bp.route('/')
 def index():
     return render_template('accounts.html')
@@ -43,7 +38,9 @@ def get_accounts():
     - month/year (compat)
     - start_date/end_date (filtro customizado)
 
-    Importante: se houver origens recorrentes, materializa automaticamente os meses no período.
+    Recorrências: no modo virtual (default) os meses sem filho gravado entram como
+    ocorrências calculadas ('virtual': True, id 'v<origem>-<período>'), sem escrita.
+    Fora dele, materializa automaticamente os meses no período.
     """
     account_type = request.args.get('type')  # income, expense
     status = request.args.get('status')  # pending, consolidated, all
@@ -64,11 +61,7 @@ def get_accounts():
 
         first_day = datetime(start_dt.year, start_dt.month, start_dt.day, 0, 0, 0)
         last_day = datetime(end_dt.year, end_dt.month, end_dt.day, 23, 59, 59)
-
-        _materialize_recurring_for_range(first_day, last_day)
     elif month and year:
-        ensure_recurring_materialized_for_month(year, month)
-
         first_day = datetime(year, month, 1)
         last_day_num = monthrange(year, month)[1]
         last_day = datetime(year, month, last_day_num, 23, 59, 59)
@@ -77,12 +70,15 @@ def get_accounts():
         today = datetime.now()
         month = today.month
         year = today.year
-        ensure_recurring_materialized_for_month(year, month)
 
         first_day = datetime(year, month, 1)
         last_day_num = monthrange(year, month)[1]
         last_day = datetime(year, month, last_day_num, 23, 59, 59)
 
+    virtual = virtual_mode_enabled()
+    if not virtual:
+        ensure_recurring_materialized_for_range(first_day, last_day)
+
     query = Account.query
 
     # Tipo
@@ -102,7 +98,14 @@ def get_accounts():
     query = query.order_by(Account.date.asc(), Account.consolidated.asc())
 
     accounts = query.all()
-    return jsonify([account.to_dict() for account in accounts])
+    items = [account.to_dict() for account in accounts]
+
+    # Ocorrências virtuais são sempre pendentes
+    if virtual and status != 'consolidated':
+        items.extend(iter_virtual_occurrences(first_day, last_day, account_type))
+        items.sort(key=lambda item: (item['date'], item['consolidated']))
+
+    return jsonify(items)
 
 
 @accounts_bp.route('/api/accounts/summary', methods=['GET'])
@@ -131,89 +134,65 @@ def get_summary():
 
         first_day = datetime(start_dt.year, start_dt.month, start_dt.day, 0, 0, 0)
         last_day = datetime(end_dt.year, end_dt.month, end_dt.day, 23, 59, 59)
-
-        _materialize_recurring_for_range(first_day, last_day)
     else:
         if not month or not year:
             today = datetime.now()
             month = today.month
             year = today.year
 
-        ensure_recurring_materialized_for_month(year, month)
-
         first_day = datetime(year, month, 1)
         last_day_num = monthrange(year, month)[1]
         last_day = datetime(year, month, last_day_num, 23, 59, 59)
 
-    # Helpers de soma
-    def _sum_amount(q):
+    # Recorrências: no modo virtual, somamos as ocorrências calculadas (sempre pendentes)
+    # em vez de gravar os filhos durante a leitura.
+    if virtual_mode_enabled():
+        virtual_initial = virtual_occurrence_totals(None, first_day - timedelta(microseconds=1))
+        virtual_period = virtual_occurrence_totals(first_day, last_day)
+    else:
+        ensure_recurring_materialized_for_range(first_day, last_day)
+        virtual_initial = virtual_period = {'income': 0.0, 'expense': 0.0, 'count': 0}
+
+    # Somas: períodos de meses inteiros leem o rollup mensal (monthly_ledger);
+    # intervalos com dias quebrados (start_date/end_date customizados) somam direto em accounts.
+    first_period = period_key(first_day.year, first_day.month)
+    last_period = period_key(last_day.year, last_day.month)
+    use_ledger = first_day.day == 1 and last_day.day == monthrange(last_day.year, last_day.month)[1]
+
+    def _sum_accounts(account_type, consolidated=None, before=False):
+        if use_ledger:
+            if before:
+                # period <= first_period - 1  <=>  meses anteriores ao período
+                return sum_ledger((account_type,), period_to=first_period - 1, consolidated=consolidated)
+            return sum_ledger((account_type,), first_period, last_period, consolidated=consolidated)
+
+        q = db.session.query(func.sum(Account.amount)).filter(Account.type == account_type)
+        if consolidated is not None:
+            q = q.filter(Account.consolidated == consolidated)
+        if before:
+            q = q.filter(Account.date < first_day)
+        else:
+            q = q.filter(Account.date >= first_day, Account.date <= last_day)
         return float(q.scalar() or 0.0)
 
     # Saldo inicial (antes do período)
-    initial_income_consolidated = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'income',
-            Account.consolidated == True,
-            Account.date < first_day
-        )
-    )
-    initial_expense_consolidated = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'expense',
-            Account.consolidated == True,
-            Account.date < first_day
-        )
-    )
+    initial_income_consolidated = _sum_accounts('income', consolidated=True, before=True)
+    initial_expense_consolidated = _sum_accounts('expense', consolidated=True, before=True)
     balance_initial_consolidated = initial_income_consolidated - initial_expense_consolidated
 
-    initial_income_total = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'income',
-            Account.date < first_day
-        )
-    )
-    initial_expense_total = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'expense',
-            Account.date < first_day
-        )
-    )
+    initial_income_total = _sum_accounts('income', before=True) + virtual_initial['income']
+    initial_expense_total = _sum_accounts('expense', before=True) + virtual_initial['expense']
     balance_initial_total = initial_income_total - initial_expense_total
 
     # Totais do período
-    income_consolidated = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'income',
-            Account.consolidated == True,
-            Account.date >= first_day,
-            Account.date <= last_day
-        )
-    )
-    income_pending = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'income',
-            Account.consolidated == False,
-            Account.date >= first_day,
-            Account.date <= last_day
-        )
-    )
+    income_consolidated = _sum_accounts('income', consolidated=True)
+    income_pending = _sum_accounts('income', consolidated=False)
 
-    expense_consolidated = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'expense',
-            Account.consolidated == True,
-            Account.date >= first_day,
-            Account.date <= last_day
-        )
-    )
-    expense_pending = _sum_amount(
-        db.session.query(func.sum(Account.amount)).filter(
-            Account.type == 'expense',
-            Account.consolidated == False,
-            Account.date >= first_day,
-            Account.date <= last_day
-        )
-    )
+    expense_consolidated = _sum_accounts('expense', consolidated=True)
+    expense_pending = _sum_accounts('expense', consolidated=False)
+
+    income_pending += virtual_period['income']
+    expense_pending += virtual_period['expense']
 
     income_total = income_consolidated + income_pending
     expense_total = expense_consolidated + expense_pending
@@ -230,12 +209,14 @@ def get_summary():
         Account.date <= last_day,
         ((Account.recurring == True) | (Account.parent_id.isnot(None)))
     ).scalar() or 0
+    recurring_count += virtual_period['count']
 
     pending_count = db.session.query(func.count(Account.id)).filter(
         Account.date >= first_day,
         Account.date <= last_day,
         Account.consolidated == False
     ).scalar() or 0
+    pending_count += virtual_period['count']
 
     consolidated_count = db.session.query(func.count(Account.id)).filter(
         Account.date >= first_day,
@@ -271,6 +252,24 @@ def get_summary():
     })
 
 
+@accounts_bp.route('/api/accounts/virtual/<occurrence_id>/materialize', methods=['POST'])
+def materialize_virtual_occurrence(occurrence_id):
+    """Grava uma ocorrência recorrente virtual (ex.: 'v12-202610') e retorna o lançamento real.
+
+    Chamado pelo front antes de editar/consolidar/excluir uma ocorrência virtual.
+    Idempotente: se o filho já existir, apenas o retorna.
+    """
+    parsed = parse_virtual_occurrence_id(occurrence_id)
+    if not parsed:
+        return jsonify({'error': 'Ocorrência virtual inválida'}), 400
+
+    account = materialize_occurrence(*parsed)
+    if not account:
+        return jsonify({'error': 'Ocorrência recorrente não encontrada'}), 404
+
+    return jsonify(account.to_dict())
+
+
 @accounts_bp.route('/api/accounts/<int:account_id>', methods=['GET'])
 def get_account(account_id):
     account = Account.query.get_or_404(account_id)
@@ -281,7 +280,8 @@ def get_account(account_id):
 def create_account():
     """Criar lançamento.
 
-    Se for recorrente (origem), define recurring_day e gera meses futuros.
+    Se for recorrente (origem), define recurring_day; os meses futuros são gerados
+    em background pelo agendador de recorrência (a resposta não espera).
     """
     data = request.json
 
@@ -309,16 +309,61 @@ def create_account():
     db.session.commit()
 
     if account.recurring:
-        generated = account.generate_next_months(12)
+        recurrence_scheduler.request_run()
         return jsonify({
             'account': account.to_dict(),
-            'generated_count': len(generated),
-            'message': f'Lançamento recorrente criado! {len(generated)} meses gerados automaticamente.'
+            'generated_count': 0,
+            'scheduled': True,
+            'message': 'Lançamento recorrente criado! Os próximos meses serão gerados automaticamente.'
         }), 201
 
     return jsonify(account.to_dict()), 201
 
 
+@accounts_bp.route('/api/accounts/import', methods=['POST'])
+def import_accounts():
+    """Importa extrato bancário (CSV ou OFX) como lançamentos, em streaming.
+
+    multipart/form-data:
+    - file: o extrato (.csv com cabeçalho data/descrição/valor[/tipo/categoria] ou .ofx)
+    - format: csv|ofx (opcional; detectado pela extensão/conteúdo)
+    - category: categoria padrão (opcional)
+    - consolidated: true|false (default true: movimento já aconteceu no banco)
+
+    Valor negativo vira despesa e positivo receita (a menos que exista coluna tipo).
+    Movimentos já importados (mesmo hash de conteúdo) são ignorados.
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'Envie o extrato no campo "file"'}), 400
+
+        file_format = (request.form.get('format') or '').lower()
+        if not file_format:
+            file_format = detect_format(upload.filename, upload.stream.read(1024))
+            upload.stream.seek(0)
+        if file_format not in ('csv', 'ofx'):
+            return jsonify({'error': 'Formato deve ser csv ou ofx'}), 400
+
+        result = import_statement(
+            upload.stream,
+            file_format,
+            category=request.form.get('category', ''),
+            consolidated=request.form.get('consolidated', 'true').lower() != 'false',
+            chunk_size=current_app.config.get('ACCOUNT_IMPORT_CHUNK_SIZE', 1000),
+        )
+        return jsonify(result), 201 if result['imported'] else 200
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro em import_accounts: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
 @accounts_bp.route('/api/accounts/<int:account_id>', methods=['PUT'])
 def update_account(account_id):
     account = Account.query.get_or_404(account_id)
@@ -353,15 +398,19 @@ def update_account(account_id):
 
     db.session.commit()
 
-    # Se mudou para recorrente (origem), gerar meses
+    # Se mudou para recorrente (origem), o agendador gera os meses em background
     if not was_recurring and account.recurring and not account.parent_id:
-        generated = account.generate_next_months(12)
+        recurrence_scheduler.request_run()
         return jsonify({
             'account': account.to_dict(),
-            'generated_count': len(generated),
-            'message': f'{len(generated)} meses futuros gerados!'
+            'generated_count': 0,
+            'scheduled': True,
+            'message': 'Os próximos meses serão gerados automaticamente.'
         })
 
+    if account.recurring and not account.parent_id:
+        recurrence_scheduler.request_run()
+
     return jsonify(account.to_dict())
 
 
@@ -413,12 +462,19 @@ def delete_account(account_id):
     delete_children = request.args.get('delete_children', 'false').lower() == 'true'
 
     if account.recurring and not account.parent_id and delete_children:
-        account.children.delete()
+        # Remoção pelo ORM (não em lote) para manter o rollup mensal em dia
+        for child in account.children.all():
+            db.session.delete(child)
         db.session.commit()
 
+    is_child = account.parent_id is not None
     db.session.delete(account)
     db.session.commit()
 
+    # Filho removido: o trigger apagou a marca de recorrência; o agendador a regrava
+    if is_child or delete_children:
+        recurrence_scheduler.request_run()
+
     return jsonify({'message': 'Conta deletada', 'deleted_children': delete_children}), 200
 
 
@@ -438,8 +494,10 @@ def delete_recurring_series(account_id):
     if not account.recurring:
         return jsonify({'error': 'Conta não é recorrente'}), 400
 
-    children_count = account.children.count()
-    account.children.delete()
+    children = account.children.all()
+    children_count = len(children)
+    for child in children:
+        db.session.delete(child)
     db.session.delete(account)
     db.session.commit()
 
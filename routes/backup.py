@@ -0,0 +1,31 @@
+from flask import Blueprint, jsonify
+import traceback
+
+from services.backup import backup_scheduler
+from services.conditional_get import no_etag
+
+backup_bp = Blueprint('backup', __name__, url_prefix='/backup')
+
+
+@backup_bp.route('/api/status', methods=['GET'])
+@no_etag
+def backup_status():
+    """Último backup (métricas de tempo/passos/recomeços) e snapshots disponíveis"""
+    try:
+        return jsonify(backup_scheduler.status())
+    except Exception as e:
+        print(f"Erro ao consultar backups: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@backup_bp.route('/api/run', methods=['POST'])
+def run_backup():
+    """Agenda um snapshot imediato; roda em background (acompanhe em /backup/api/status)"""
+    try:
+        backup_scheduler.request_run()
+        return jsonify({'message': 'Backup agendado'}), 202
+    except Exception as e:
+        print(f"Erro ao agendar backup: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
@@ -1,91 +1,244 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, current_app
 from models import Invoice, Bill, CreditCard, Installment, Transaction, Account
 from database import db
 from datetime import datetime
-from calendar import monthrange
-from dateutil.relativedelta import relativedelta
 import traceback
 
+from services.conditional_get import no_etag
+from services.data_version import group_version
+from services.recurrence import (
+    ensure_recurring_materialized_for_range,
+    iter_virtual_occurrences,
+    virtual_mode_enabled,
+)
+from services.response_cache import calendar_events_cache
+
 calendar_bp = Blueprint('calendar', __name__, url_prefix='/calendar')
 
+def _bill_status(paid: bool, due_date: datetime, now: datetime) -> str:
+    """Mesma regra de Bill.status, a partir das colunas."""
+    if paid:
+        return 'Pago'
+    if due_date < now:
+        return 'Vencido'
+    return 'Pendente'
+
+
 @calendar_bp.route('/')
 def index():
     """Página do calendário"""
     return render_template('calendar.html')
 
 
-def _month_start(d: datetime) -> datetime:
-    return datetime(d.year, d.month, 1)
+def _build_events(start_date: datetime, end_date: datetime) -> list[dict]:
+    """Eventos de faturas, boletos, lançamentos e parcelas entre start_date e end_date."""
+    events = []
 
+    # Cada fonte vem de uma consulta só com as colunas usadas (joins explícitos,
+    # sem objetos ORM nem lazy loads por linha).
 
-def _ensure_recurring_materialized_for_range(start_date: datetime, end_date: datetime) -> int:
-    """Materializa instâncias mensais (filhos) para todas as origens recorrentes dentro do range.
-
-    Faz commit apenas se criar algo. Mantém o calendário alinhado com a aba de contas.
-    """
-    origins = Account.query.filter(
-        Account.recurring == True,
-        Account.parent_id.is_(None)
+    # 1. Faturas de cartões
+    invoices = db.session.query(
+        Invoice.id, Invoice.due_date, Invoice.status, Invoice.amount, CreditCard.name
+    ).join(CreditCard, Invoice.card_id == CreditCard.id).filter(
+        Invoice.due_date >= start_date,
+        Invoice.due_date <= end_date
     ).all()
 
-    if not origins:
-        return 0
-
-    created = 0
-    current = _month_start(start_date)
-    end_month = _month_start(end_date)
-
-    while current <= end_month:
-        year = current.year
-        month = current.month
-
-        for origin in origins:
-            if not origin.date:
-                continue
-
-            origin_ym = (origin.date.year, origin.date.month)
-            target_ym = (year, month)
-            if target_ym < origin_ym:
-                continue
-
-            # Se a origem já é do mês/ano, não cria filho
-            if origin.date.year == year and origin.date.month == month:
-                continue
-
-            day = origin.recurring_day or origin.date.day
-            max_day = monthrange(year, month)[1]
-            day = min(day, max_day)
-            target_date = datetime(year, month, day)
-
-            exists = Account.query.filter(
-                Account.parent_id == origin.id,
-                db.extract('year', Account.date) == year,
-                db.extract('month', Account.date) == month
-            ).first()
-
-            if exists:
-                continue
+    for invoice_id, due_date, status, amount, card_name in invoices:
+        try:
+            is_paid = status == 'paid'
+            events.append({
+                'id': f'invoice-{invoice_id}',
+                'title': f'💳 {card_name}',
+                'start': due_date.strftime('%Y-%m-%d'),
+                'backgroundColor': '#28a745' if is_paid else '#dc3545',
+                'borderColor': '#28a745' if is_paid else '#dc3545',
+                'textColor': '#ffffff',
+                'classNames': ['event-invoice'],
+                'extendedProps': {
+                    'type': 'invoice',
+                    'icon': '💳',
+                    'typeLabel': 'Fatura de Cartão',
+                    'amount': float(amount),
+                    'description': f'Fatura do cartão {card_name}',
+                    'status': 'Paga' if is_paid else 'Aberta',
+                    'link': '/invoices',
+                    'reference_id': invoice_id,
+                    'card_name': card_name
+                }
+            })
+        except Exception as e:
+            print(f"Erro ao processar fatura {invoice_id}: {str(e)}")
+
+    # 2. Boletos
+    bills = db.session.query(
+        Bill.id, Bill.description, Bill.due_date, Bill.amount, Bill.paid, Bill.category
+    ).filter(
+        Bill.due_date >= start_date,
+        Bill.due_date <= end_date
+    ).all()
 
-            child = Account(
-                description=origin.description,
-                amount=origin.amount,
-                type=origin.type,
-                category=origin.category,
-                date=target_date,
-                recurring=False,
-                parent_id=origin.id,
-                recurring_day=origin.recurring_day,
-                consolidated=False
-            )
-            db.session.add(child)
-            created += 1
+    now = datetime.now()
+    for bill_id, description, due_date, amount, paid, category in bills:
+        try:
+            is_paid = bool(paid)
+            events.append({
+                'id': f'bill-{bill_id}',
+                'title': f'📄 {description}',
+                'start': due_date.strftime('%Y-%m-%d'),
+                'backgroundColor': '#28a745' if is_paid else '#ffc107',
+                'borderColor': '#28a745' if is_paid else '#ffc107',
+                'textColor': '#000000' if not is_paid else '#ffffff',
+                'classNames': ['event-bill'],
+                'extendedProps': {
+                    'type': 'bill',
+                    'icon': '📄',
+                    'typeLabel': 'Boleto',
+                    'amount': float(amount),
+                    'description': description,
+                    'status': _bill_status(is_paid, due_date, now),
+                    'link': '/bills',
+                    'reference_id': bill_id,
+                    'category': category or 'Sem categoria'
+                }
+            })
+        except Exception as e:
+            print(f"Erro ao processar boleto {bill_id}: {str(e)}")
+
+    # 3. Lançamentos reais (+ ocorrências recorrentes virtuais, sem gravar no banco)
+    virtual = virtual_mode_enabled()
+    if not virtual:
+        ensure_recurring_materialized_for_range(start_date, end_date)
+
+    accounts = db.session.query(
+        Account.id, Account.description, Account.date, Account.amount, Account.type,
+        Account.category, Account.consolidated, Account.recurring, Account.parent_id
+    ).filter(
+        Account.date >= start_date,
+        Account.date <= end_date
+    ).all()
 
-        current = current + relativedelta(months=1)
+    for acc_id, description, date, amount, acc_type, category, consolidated, recurring, parent_id in accounts:
+        try:
+            is_income = acc_type == 'income'
+            is_consolidated = bool(consolidated)
+            # Mesmas regras de Account.is_recurring_origin / is_recurring_child
+            is_recurring_origin = bool(recurring and not parent_id)
+            is_recurring_child = parent_id is not None
+
+            # Cor base: consolidado verde; pendente amarelo
+            bg = '#28a745' if is_consolidated else '#ffc107'
+            border = bg
+            text = '#ffffff' if is_consolidated else '#000000'
+
+            # Diferenciar recorrência com borda roxa/rosa (sem mudar muito)
+            if is_recurring_origin:
+                border = '#6f42c1'
+            elif is_recurring_child:
+                border = '#e83e8c'
+
+            icon = '💵' if is_income else '💸'
+            title = f"{icon} {description}"
+
+            events.append({
+                'id': f'account-{acc_id}',
+                'title': title,
+                'start': date.strftime('%Y-%m-%d'),
+                'backgroundColor': bg,
+                'borderColor': border,
+                'textColor': text,
+                'classNames': ['event-account'],
+                'extendedProps': {
+                    'type': 'account',
+                    'icon': icon,
+                    'typeLabel': 'Lançamento',
+                    'amount': float(amount),
+                    'description': description,
+                    'status': 'Consolidado' if is_consolidated else 'Pendente',
+                    'link': '/accounts',
+                    'reference_id': acc_id,
+                    'category': category or 'Sem categoria',
+                    'is_recurring_origin': is_recurring_origin,
+                    'is_recurring_child': is_recurring_child
+                }
+            })
+        except Exception as e:
+            print(f"Erro ao processar account {acc_id}: {str(e)}")
+
+    if virtual:
+        for occ in iter_virtual_occurrences(start_date, end_date):
+            is_income = occ['type'] == 'income'
+            icon = '💵' if is_income else '💸'
+
+            events.append({
+                'id': f"account-{occ['id']}",
+                'title': f"{icon} {occ['description']}",
+                'start': occ['date'],
+                'backgroundColor': '#ffc107',
+                'borderColor': '#e83e8c',
+                'textColor': '#000000',
+                'classNames': ['event-account'],
+                'extendedProps': {
+                    'type': 'account',
+                    'icon': icon,
+                    'typeLabel': 'Lançamento',
+                    'amount': float(occ['amount']),
+                    'description': occ['description'],
+                    'status': occ['status'],
+                    'link': '/accounts',
+                    'reference_id': occ['id'],
+                    'category': occ['category'] or 'Sem categoria',
+                    'is_recurring_origin': False,
+                    'is_recurring_child': True,
+                    'virtual': True
+                }
+            })
+
+    # 4. Parcelas
+    try:
+        installments = db.session.query(
+            Installment.id, Installment.due_date, Installment.amount,
+            Installment.installment_number, Installment.total_installments,
+            Transaction.description, CreditCard.name
+        ).join(
+            Transaction, Installment.transaction_id == Transaction.id
+        ).join(
+            CreditCard, Transaction.card_id == CreditCard.id
+        ).filter(
+            Installment.due_date >= start_date,
+            Installment.due_date <= end_date,
+            Installment.paid == False
+        ).all()
 
-    if created:
-        db.session.commit()
+        for inst_id, due_date, amount, number, total, description, card_name in installments:
+            try:
+                events.append({
+                    'id': f'installment-{inst_id}',
+                    'title': f'🔹 {description} ({number}/{total})',
+                    'start': due_date.strftime('%Y-%m-%d'),
+                    'backgroundColor': '#0dcaf0',
+                    'borderColor': '#0dcaf0',
+                    'textColor': '#000000',
+                    'classNames': ['event-installment'],
+                    'extendedProps': {
+                        'type': 'installment',
+                        'icon': '🔹',
+                        'typeLabel': 'Parcela',
+                        'amount': float(amount),
+                        'description': f'{description} - Parcela {number}/{total}',
+                        'status': 'Pendente',
+                        'link': '/cards',
+                        'reference_id': inst_id,
+                        'card_name': card_name
+                    }
+                })
+            except Exception as e:
+                print(f"Erro ao processar parcela {inst_id}: {str(e)}")
+    except Exception as e:
+        print(f"Erro ao buscar parcelas: {str(e)}")
 
-    return created
+    return events
 
 
 @calendar_bp.route('/api/events', methods=['GET'])
@@ -104,162 +257,27 @@ def get_events():
         start_date = datetime.strptime(start_str, '%Y-%m-%d')
         end_date = datetime.strptime(end_str, '%Y-%m-%d')
 
-        events = []
-
-        # 1. Faturas de cartões
-        invoices = Invoice.query.filter(
-            Invoice.due_date >= start_date,
-            Invoice.due_date <= end_date
-        ).all()
-
-        for invoice in invoices:
-            try:
-                is_paid = invoice.status == 'paid'
-                events.append({
-                    'id': f'invoice-{invoice.id}',
-                    'title': f'💳 {invoice.card.name}',
-                    'start': invoice.due_date.strftime('%Y-%m-%d'),
-                    'backgroundColor': '#28a745' if is_paid else '#dc3545',
-                    'borderColor': '#28a745' if is_paid else '#dc3545',
-                    'textColor': '#ffffff',
-                    'classNames': ['event-invoice'],
-                    'extendedProps': {
-                        'type': 'invoice',
-                        'icon': '💳',
-                        'typeLabel': 'Fatura de Cartão',
-                        'amount': float(invoice.amount),
-                        'description': f'Fatura do cartão {invoice.card.name}',
-                        'status': 'Paga' if is_paid else 'Aberta',
-                        'link': '/invoices',
-                        'reference_id': invoice.id,
-                        'card_name': invoice.card.name
-                    }
-                })
-            except Exception as e:
-                print(f"Erro ao processar fatura {invoice.id}: {str(e)}")
-
-        # 2. Boletos
-        bills = Bill.query.filter(
-            Bill.due_date >= start_date,
-            Bill.due_date <= end_date
-        ).all()
+        # Cache por (intervalo, versão dos dados): qualquer commit nessas tabelas muda a chave
+        key = (start_str, end_str, virtual_mode_enabled(), group_version('calendar'))
+        body = calendar_events_cache.get(key)
+        if body is not None:
+            response = current_app.response_class(body, mimetype='application/json')
+            response.headers['X-Cache'] = 'HIT'
+            return response
 
-        for bill in bills:
-            try:
-                is_paid = bill.paid
-                events.append({
-                    'id': f'bill-{bill.id}',
-                    'title': f'📄 {bill.description}',
-                    'start': bill.due_date.strftime('%Y-%m-%d'),
-                    'backgroundColor': '#28a745' if is_paid else '#ffc107',
-                    'borderColor': '#28a745' if is_paid else '#ffc107',
-                    'textColor': '#000000' if not is_paid else '#ffffff',
-                    'classNames': ['event-bill'],
-                    'extendedProps': {
-                        'type': 'bill',
-                        'icon': '📄',
-                        'typeLabel': 'Boleto',
-                        'amount': float(bill.amount),
-                        'description': bill.description,
-                        'status': bill.status,
-                        'link': '/bills',
-                        'reference_id': bill.id,
-                        'category': bill.category or 'Sem categoria'
-                    }
-                })
-            except Exception as e:
-                print(f"Erro ao processar boleto {bill.id}: {str(e)}")
-
-        # 3. Materializar recorrências no range e listar lançamentos reais
-        _ensure_recurring_materialized_for_range(start_date, end_date)
-
-        accounts = Account.query.filter(
-            Account.date >= start_date,
-            Account.date <= end_date
-        ).all()
-
-        for acc in accounts:
-            try:
-                is_income = acc.type == 'income'
-                is_consolidated = bool(acc.consolidated)
-
-                # Cor base: consolidado verde; pendente amarelo
-                bg = '#28a745' if is_consolidated else '#ffc107'
-                border = bg
-                text = '#ffffff' if is_consolidated else '#000000'
-
-                # Diferenciar recorrência com borda roxa/rosa (sem mudar muito)
-                if acc.is_recurring_origin:
-                    border = '#6f42c1'
-                elif acc.is_recurring_child:
-                    border = '#e83e8c'
-
-                icon = '💵' if is_income else '💸'
-                title = f"{icon} {acc.description}"
-
-                events.append({
-                    'id': f'account-{acc.id}',
-                    'title': title,
-                    'start': acc.date.strftime('%Y-%m-%d'),
-                    'backgroundColor': bg,
-                    'borderColor': border,
-                    'textColor': text,
-                    'classNames': ['event-account'],
-                    'extendedProps': {
-                        'type': 'account',
-                        'icon': icon,
-                        'typeLabel': 'Lançamento',
-                        'amount': float(acc.amount),
-                        'description': acc.description,
-                        'status': acc.status,
-                        'link': '/accounts',
-                        'reference_id': acc.id,
-                        'category': acc.category or 'Sem categoria',
-                        'is_recurring_origin': acc.is_recurring_origin,
-                        'is_recurring_child': acc.is_recurring_child
-                    }
-                })
-            except Exception as e:
-                print(f"Erro ao processar account {acc.id}: {str(e)}")
-
-        # 4. Parcelas
-        try:
-            installments = Installment.query.join(Transaction).filter(
-                Installment.due_date >= start_date,
-                Installment.due_date <= end_date,
-                Installment.paid == False
-            ).all()
-
-            for inst in installments:
-                try:
-                    events.append({
-                        'id': f'installment-{inst.id}',
-                        'title': f'🔹 {inst.transaction.description} ({inst.installment_number}/{inst.total_installments})',
-                        'start': inst.due_date.strftime('%Y-%m-%d'),
-                        'backgroundColor': '#0dcaf0',
-                        'borderColor': '#0dcaf0',
-                        'textColor': '#000000',
-                        'classNames': ['event-installment'],
-                        'extendedProps': {
-                            'type': 'installment',
-                            'icon': '🔹',
-                            'typeLabel': 'Parcela',
-                            'amount': float(inst.amount),
-                            'description': f'{inst.transaction.description} - Parcela {inst.installment_number}/{inst.total_installments}',
-                            'status': 'Pendente',
-                            'link': '/cards',
-                            'reference_id': inst.id,
-                            'card_name': inst.transaction.card.name
-                        }
-                    })
-                except Exception as e:
-                    print(f"Erro ao processar parcela {inst.id}: {str(e)}")
-        except Exception as e:
-            print(f"Erro ao buscar parcelas: {str(e)}")
-
-        return jsonify(events)
+        response = jsonify(_build_events(start_date, end_date))
+        calendar_events_cache.set(key, response.get_data())
+        response.headers['X-Cache'] = 'MISS'
+        return response
 
     except Exception as e:
         print(f"Erro em get_events: {str(e)}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
+
+
+@calendar_bp.route('/api/events/cache-stats', methods=['GET'])
+@no_etag
+def get_events_cache_stats():
+    """Contadores do cache de /calendar/api/events (hits, misses, tamanho)."""
+    return jsonify(calendar_events_cache.stats())
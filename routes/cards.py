@@ -1,9 +1,12 @@
-from flask import Blueprint, request, jsonify, render_template
-from models import CreditCard, Transaction, Installment, Invoice
+from flask import Blueprint, request, jsonify, render_template, current_app
+from models import CreditCard, Transaction, Installment, Invoice, period_key
 from database import db
-from datetime import datetime, timedelta
-from calendar import monthrange
-from dateutil.relativedelta import relativedelta
+from datetime import datetime
+import traceback
+
+from services.card_import import import_transactions, parse_csv
+from services.card_stats import compute_card_stats
+from services import statement_calendar
 
 cards_bp = Blueprint('cards', __name__, url_prefix='/cards')
 
@@ -39,52 +42,8 @@ def _suggest_target_statement(card: CreditCard):
     Fechou = hoje >= data de fechamento (closing_day) do mês.
     """
     today = datetime.now()
-    closing_day = min(card.closing_day, monthrange(today.year, today.month)[1])
-    closing_date = datetime(today.year, today.month, closing_day)
-
-    if today >= closing_date:
-        ref = datetime(today.year, today.month, 1) + relativedelta(months=1)
-        return ref.month, ref.year, 'next'
-
-    return today.month, today.year, 'current'
-
-
-def _invoice_due_date(card: CreditCard, month: int, year: int) -> datetime:
-    """Vencimento da fatura para um statement.
-
-    Suporta due_day > último dia do mês (caso default seja fechamento + 7 dias e caia no mês seguinte).
-    """
-    due_day = card.due_day or ((card.closing_day or 1) + 7)
-    days_in_month = monthrange(year, month)[1]
-
-    if due_day <= days_in_month:
-        return datetime(year, month, due_day)
-
-    overflow = due_day - days_in_month
-    return datetime(year, month, days_in_month) + timedelta(days=overflow)
-
-
-def _get_or_create_invoice(card: CreditCard, month: int, year: int) -> Invoice | None:
-    amount = card.get_bill_for_month(month, year)
-    invoice = Invoice.query.filter_by(card_id=card.id, month=month, year=year).first()
-
-    if not invoice and amount > 0:
-        invoice = Invoice(
-            card_id=card.id,
-            month=month,
-            year=year,
-            amount=amount,
-            due_date=_invoice_due_date(card, month, year),
-            status='open'
-        )
-        db.session.add(invoice)
-        db.session.commit()
-
-    if invoice and invoice.amount != amount:
-        invoice.amount = amount
-        db.session.commit()
-
-    return invoice
+    stmt = statement_calendar.statement_for_date(card, today)
+    return stmt.month, stmt.year, 'current' if stmt.month == today.month else 'next'
 
 
 @cards_bp.route('/')
@@ -94,7 +53,8 @@ def index():
 @cards_bp.route('/api/cards', methods=['GET'])
 def get_cards():
     cards = CreditCard.query.all()
-    return jsonify([card.to_dict() for card in cards])
+    stats = compute_card_stats([card.id for card in cards])
+    return jsonify([card.to_dict(stats) for card in cards])
 
 @cards_bp.route('/api/cards/<int:card_id>', methods=['GET'])
 def get_card(card_id):
@@ -249,11 +209,61 @@ def create_transaction():
         installments_total=int(data.get('installments_total', 1))
     )
     db.session.add(transaction)
-    db.session.commit()
+    # flush basta para ter o id; compra e parcelas no mesmo commit
+    db.session.flush()
     transaction.create_installments()
     db.session.commit()
     return jsonify(transaction.to_dict()), 201
 
+@cards_bp.route('/api/transactions/bulk', methods=['POST'])
+def bulk_create_transactions():
+    """Importa várias compras de uma vez (uma transação, INSERTs em lote).
+
+    Aceita:
+    - JSON: lista de compras ou {"card_id": X, "transactions": [...]}
+    - CSV: upload multipart no campo "file" (ou corpo text/csv), com cabeçalho
+      card_id,description,amount,date,category,installments_total
+    card_id pode vir uma vez (?card_id=, campo do form ou do JSON) para todas as linhas.
+
+    Linhas inválidas são reportadas em errors e não impedem as demais.
+    """
+    try:
+        default_card_id = request.args.get('card_id') or request.form.get('card_id')
+        upload = request.files.get('file')
+
+        if upload is not None:
+            items = parse_csv(upload.read().decode('utf-8-sig'))
+        elif request.mimetype == 'text/csv':
+            items = parse_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                default_card_id = default_card_id or data.get('card_id')
+                data = data.get('transactions')
+            if not isinstance(data, list):
+                return jsonify({'error': 'Envie uma lista de compras (JSON) ou um arquivo CSV'}), 400
+            items = data
+
+        max_rows = current_app.config.get('CARD_IMPORT_MAX_ROWS', 5000)
+        if len(items) > max_rows:
+            return jsonify({'error': f'Máximo de {max_rows} linhas por importação'}), 400
+
+        result = import_transactions(items, default_card_id)
+        if not result['created']:
+            db.session.rollback()
+            return jsonify({**result, 'error': 'Nenhuma linha válida'}), 400
+
+        db.session.commit()
+        return jsonify(result), 201
+
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Arquivo CSV deve estar em UTF-8'}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro em bulk_create_transactions: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 @cards_bp.route('/api/transactions/<int:transaction_id>', methods=['DELETE'])
 def delete_transaction(transaction_id):
     transaction = Transaction.query.get_or_404(transaction_id)
@@ -280,7 +290,8 @@ def pay_current_invoice(card_id):
     if not month or not year:
         month, year, _ = _suggest_target_statement(card)
 
-    invoice = _get_or_create_invoice(card, int(month), int(year))
+    # Faturas são mantidas pelos hooks de flush (services/invoices.py)
+    invoice = Invoice.query.filter_by(card_id=card.id, month=int(month), year=int(year)).first()
     if not invoice:
         return jsonify({
             'error': 'Não há fatura para pagar neste período (valor 0).',
@@ -295,8 +306,7 @@ def pay_current_invoice(card_id):
 
     installments = Installment.query.join(Transaction).filter(
         Transaction.card_id == card.id,
-        Installment.statement_month == invoice.month,
-        Installment.statement_year == invoice.year,
+        Installment.statement_period == period_key(invoice.year, invoice.month),
         Installment.paid == False
     ).all()
 
@@ -326,6 +336,7 @@ def anticipate_installments(transaction_id):
         return jsonify({'error': 'Envie installment_ids.'}), 400
 
     target_month, target_year, target_kind = _suggest_target_statement(card)
+    target_due_date = statement_calendar.due_date(card, target_month, target_year)
 
     moved = 0
     skipped = 0
@@ -364,7 +375,7 @@ def anticipate_installments(transaction_id):
         # Move para a fatura destino
         inst.statement_month = target_month
         inst.statement_year = target_year
-        inst.due_date = _invoice_due_date(card, target_month, target_year)
+        inst.due_date = target_due_date
 
         moved += 1
 
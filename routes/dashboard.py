@@ -1,10 +1,10 @@
-from flask import Blueprint, jsonify, render_template, session, request
-from models import CreditCard, Bill, Account, Transaction
-from database import db
+from flask import Blueprint, jsonify, render_template, session, request, current_app
+from models import CreditCard, Bill, period_key
 from datetime import datetime
-from sqlalchemy import func
 from calendar import monthrange
 
+from services.card_stats import compute_card_stats, get_card_stats
+from services.ledger import sum_ledger, sum_ledger_by
 from services.recurrence import list_recurring_occurrences_for_month
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
@@ -59,7 +59,8 @@ def get_summary():
         cards = CreditCard.query.all()
 
     total_card_limit = sum(card.limit_total for card in cards)
-    total_card_used = sum(card.get_total_used() for card in cards)
+    card_stats = compute_card_stats([card.id for card in cards])
+    total_card_used = sum(get_card_stats(card_stats, card.id)['total_used'] for card in cards)
     total_card_available = total_card_limit - total_card_used
 
     # Período do mês aplicado
@@ -84,32 +85,17 @@ def get_summary():
 
     pending_until_today_amount = float(sum(bill.amount for bill in pending_until_today))
 
+    # Receitas/despesas do mês vêm do rollup mensal (monthly_ledger)
+    period = period_key(viewing_year, viewing_month)
+
     # Receitas (não filtradas por cartão)
-    monthly_income = db.session.query(func.sum(Account.amount)).filter(
-        Account.type == 'income',
-        Account.date >= first_day,
-        Account.date < next_month
-    ).scalar() or 0.0
+    monthly_income = sum_ledger(('income',), period, period)
 
     # Despesas gerais (não de cartão)
-    monthly_expenses = db.session.query(func.sum(Account.amount)).filter(
-        Account.type == 'expense',
-        Account.date >= first_day,
-        Account.date < next_month
-    ).scalar() or 0.0
+    monthly_expenses = sum_ledger(('expense',), period, period)
 
     # Gastos de cartão (filtrados se card_id especificado)
-    if card_id:
-        monthly_card_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.card_id == card_id,
-            Transaction.date >= first_day,
-            Transaction.date < next_month
-        ).scalar() or 0.0
-    else:
-        monthly_card_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.date >= first_day,
-            Transaction.date < next_month
-        ).scalar() or 0.0
+    monthly_card_expenses = sum_ledger(('card',), period, period, card_id=card_id or None)
 
     # Total de despesas
     if card_id:
@@ -313,43 +299,21 @@ def get_prediction():
 def expenses_by_category():
     card_id = request.args.get('card_id', type=int)
     viewing_month, viewing_year = _resolve_viewing_month_year()
-    first_day, next_month = _month_range(viewing_month, viewing_year)
+
+    period = period_key(viewing_year, viewing_month)
 
     categories = {}
 
     # Despesas gerais (só em Total Geral)
     if not card_id:
-        account_expenses = db.session.query(
-            Account.category,
-            func.sum(Account.amount).label('total')
-        ).filter(
-            Account.type == 'expense',
-            Account.date >= first_day,
-            Account.date < next_month
-        ).group_by(Account.category).all()
+        account_expenses = sum_ledger_by('category', ('expense',), period, period)
 
         for category, total in account_expenses:
             cat_name = category or 'Sem categoria'
             categories[cat_name] = categories.get(cat_name, 0) + total
 
     # Gastos de cartão (filtrados se necessário)
-    if card_id:
-        card_expenses = db.session.query(
-            Transaction.category,
-            func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.card_id == card_id,
-            Transaction.date >= first_day,
-            Transaction.date < next_month
-        ).group_by(Transaction.category).all()
-    else:
-        card_expenses = db.session.query(
-            Transaction.category,
-            func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.date >= first_day,
-            Transaction.date < next_month
-        ).group_by(Transaction.category).all()
+    card_expenses = sum_ledger_by('category', ('card',), period, period, card_id=card_id or None)
 
     for category, total in card_expenses:
         cat_name = category or 'Sem categoria'
@@ -363,64 +327,49 @@ def expenses_by_category():
 
 @dashboard_bp.route('/api/monthly-trend', methods=['GET'])
 def monthly_trend():
+    """Tendência mensal terminando no mês aplicado (inclusive).
+
+    Janela: ?months=N (default app.config['DASHBOARD_TREND_MONTHS'], limitado a
+    DASHBOARD_TREND_MAX_MONTHS). Todos os meses saem de uma única consulta
+    agrupada por (period, type) no rollup mensal; meses sem lançamentos são
+    preenchidos com zero.
+    """
     viewing_month, viewing_year = _resolve_viewing_month_year()
     card_id = request.args.get('card_id', type=int)
 
-    # Últimos 6 meses terminando no mês aplicado (inclusive)
-    trends = []
+    default_window = current_app.config.get('DASHBOARD_TREND_MONTHS', 6)
+    max_window = current_app.config.get('DASHBOARD_TREND_MAX_MONTHS', 120)
+    window = request.args.get('months', default_window, type=int) or default_window
+    window = max(1, min(window, max_window))
+
+    # Meses da janela, do mais antigo ao mês aplicado
+    months = []
+    year, month = viewing_year, viewing_month
+    for _ in range(window):
+        months.append((year, month))
+        month -= 1
+        if month < 1:
+            month = 12
+            year -= 1
+    months.reverse()
+
+    # Receitas/despesas gerais só em Total Geral; cartão filtrado se card_id
+    types = ('card',) if card_id else ('income', 'expense', 'card')
+    rows = sum_ledger_by(
+        ('period', 'type'), types,
+        period_key(*months[0]), period_key(*months[-1]),
+        card_id=card_id or None
+    )
+
+    totals = {}
+    for period, type_, total in rows:
+        totals[(period, type_)] = total
 
-    def _add_month(y, m, delta):
-        mm = m + delta
-        yy = y
-        while mm > 12:
-            mm -= 12
-            yy += 1
-        while mm < 1:
-            mm += 12
-            yy -= 1
-        return yy, mm
-
-    for offset in range(-5, 1):
-        year, month = _add_month(viewing_year, viewing_month, offset)
-
-        first_day = datetime(year, month, 1)
-        if month == 12:
-            last_day = datetime(year + 1, 1, 1)
-        else:
-            last_day = datetime(year, month + 1, 1)
-
-        # Receitas (só em Total Geral)
-        income = 0.0
-        if not card_id:
-            income = db.session.query(func.sum(Account.amount)).filter(
-                Account.type == 'income',
-                Account.date >= first_day,
-                Account.date < last_day
-            ).scalar() or 0.0
-
-        # Despesas gerais (só em Total Geral)
-        expenses = 0.0
-        if not card_id:
-            expenses = db.session.query(func.sum(Account.amount)).filter(
-                Account.type == 'expense',
-                Account.date >= first_day,
-                Account.date < last_day
-            ).scalar() or 0.0
-
-        # Gastos de cartão (filtrados se necessário)
-        if card_id:
-            card_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.card_id == card_id,
-                Transaction.date >= first_day,
-                Transaction.date < last_day
-            ).scalar() or 0.0
-        else:
-            card_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.date >= first_day,
-                Transaction.date < last_day
-            ).scalar() or 0.0
-
-        expenses += card_expenses
+    trends = []
+    for year, month in months:
+        period = period_key(year, month)
+        income = totals.get((period, 'income'), 0.0)
+        expenses = totals.get((period, 'expense'), 0.0) + totals.get((period, 'card'), 0.0)
 
         trends.append({
             'month': f"{year}-{month:02d}",
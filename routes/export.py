@@ -0,0 +1,62 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from datetime import datetime, timedelta
+
+from services.conditional_get import no_etag
+from services.export import EXPORTS, FORMATS, export_columns, iter_export_rows, stream_csv, stream_jsonl
+
+export_bp = Blueprint('export', __name__, url_prefix='/export')
+
+
+def _parse_date_arg(name: str):
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+@export_bp.route('/api/<entity>', methods=['GET'])
+@no_etag
+def export_entity(entity):
+    """Exporta accounts, bills, transactions ou installments em streaming.
+
+    Parâmetros:
+    - format: csv (default) ou jsonl
+    - start/end: AAAA-MM-DD, inclusive, sobre a data da entidade
+      (accounts.date, bills.due_date, transactions.date, installments.due_date)
+    - card_id: só transactions/installments
+
+    Memória constante: linhas lidas do cursor em lotes (yield_per) e escritas
+    conforme chegam; o download começa antes da consulta terminar.
+    """
+    if entity not in EXPORTS:
+        return jsonify({'error': f"Entidade inválida. Use: {', '.join(EXPORTS)}"}), 404
+
+    file_format = request.args.get('format', 'csv').lower()
+    if file_format not in FORMATS:
+        return jsonify({'error': f"Formato inválido. Use: {', '.join(FORMATS)}"}), 400
+
+    try:
+        start = _parse_date_arg('start')
+        end = _parse_date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+    if end is not None:
+        end += timedelta(days=1)
+
+    card_id = request.args.get('card_id', type=int)
+    if card_id is not None and EXPORTS[entity][2] is None:
+        return jsonify({'error': f'card_id não se aplica a {entity}'}), 400
+
+    columns = export_columns(entity)
+    rows = iter_export_rows(entity, start, end, card_id)
+
+    if file_format == 'csv':
+        body, mimetype = stream_csv(columns, rows), 'text/csv'
+    else:
+        body, mimetype = stream_jsonl(columns, rows), 'application/x-ndjson'
+
+    filename = f"{entity}-{datetime.now().strftime('%Y%m%d')}.{file_format}"
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no',
+    })
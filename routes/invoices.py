@@ -1,26 +1,15 @@
-from flask import Blueprint, request, jsonify, render_template, session
-from models import CreditCard, Invoice, Transaction, Installment, Bill, Account
+from flask import Blueprint, request, jsonify, render_template, session, current_app
+from models import CreditCard, Invoice, Transaction, Installment, period_key
 from database import db
-from datetime import datetime, timedelta
-from calendar import monthrange
+from datetime import datetime
 import traceback
 
-invoices_bp = Blueprint('invoices', __name__, url_prefix='/invoices')
-
-
-def _invoice_due_date(card: CreditCard, month: int, year: int) -> datetime:
-    """Vencimento da fatura para um mês/ano.
-
-    Suporta due_day > último dia do mês (ex.: fechamento + 7 dias).
-    """
-    due_day = card.due_day or ((card.closing_day or 1) + 7)
-    days_in_month = monthrange(year, month)[1]
+from sqlalchemy.orm import contains_eager
 
-    if due_day <= days_in_month:
-        return datetime(year, month, due_day)
+from services.balance import compute_projected_balance
+from services.card_stats import compute_card_stats, compute_statement_totals
 
-    overflow = due_day - days_in_month
-    return datetime(year, month, days_in_month) + timedelta(days=overflow)
+invoices_bp = Blueprint('invoices', __name__, url_prefix='/invoices')
 
 
 @invoices_bp.route('/')
@@ -102,62 +91,11 @@ def get_projected_balance():
         current_month = today.month
         current_year = today.year
 
-        current_balance = 0.0
-
-        incomes = Account.query.filter(
-            Account.type == 'income',
-            Account.date <= datetime.now()
-        ).all()
-        current_balance += sum(acc.amount for acc in incomes)
-
-        expenses = Account.query.filter(
-            Account.type == 'expense',
-            Account.date <= datetime.now()
-        ).all()
-        current_balance -= sum(acc.amount for acc in expenses)
-
-        paid_invoices = Invoice.query.filter(
-            Invoice.status == 'paid'
-        ).all()
-        current_balance -= sum(inv.amount for inv in paid_invoices)
-
-        paid_bills = Bill.query.filter(
-            Bill.paid == True
-        ).all()
-        current_balance -= sum(bill.amount for bill in paid_bills)
-
-        total_to_pay = 0.0
-
-        prev_month = month - 1 if month > 1 else 12
-        prev_year = year if month > 1 else year - 1
-
-        temp_month = current_month
-        temp_year = current_year
-
-        while (temp_year < prev_year) or (temp_year == prev_year and temp_month <= prev_month):
-            invoices = Invoice.query.filter_by(
-                month=temp_month,
-                year=temp_year,
-                status='open'
-            ).all()
-            total_to_pay += sum(inv.amount for inv in invoices)
-
-            first_day = datetime(temp_year, temp_month, 1)
-            last_day = datetime(temp_year, temp_month, monthrange(temp_year, temp_month)[1])
-
-            bills = Bill.query.filter(
-                Bill.paid == False,
-                Bill.due_date >= first_day,
-                Bill.due_date <= last_day
-            ).all()
-            total_to_pay += sum(bill.amount for bill in bills)
-
-            temp_month += 1
-            if temp_month > 12:
-                temp_month = 1
-                temp_year += 1
-
-        projected_balance = current_balance - total_to_pay
+        # Saldo de fechamento vem dos snapshots mensais; o resto de poucas agregações
+        result = compute_projected_balance(month, year, today)
+        current_balance = result['current_balance']
+        total_to_pay = result['total_to_pay']
+        projected_balance = result['projected_balance']
 
         return jsonify({
             'current_balance': round(current_balance, 2),
@@ -188,45 +126,42 @@ def get_invoices():
 
         print(f"Buscando faturas para {month}/{year}")
 
+        # Somente leitura: faturas são criadas/atualizadas na escrita (services/invoices.py)
         cards = CreditCard.query.filter_by(active=True).all()
+        card_ids = [card.id for card in cards]
+        card_stats = compute_card_stats(card_ids)
+
+        # Parcelas do statement de todos os cartões + transação, em uma consulta
+        installments_by_card = {}
+        if card_ids:
+            installments = Installment.query.join(Installment.transaction).options(
+                contains_eager(Installment.transaction)
+            ).filter(
+                Transaction.card_id.in_(card_ids),
+                Installment.statement_period == period_key(year, month)
+            ).order_by(Installment.id).all()
+
+            for inst in installments:
+                installments_by_card.setdefault(inst.transaction.card_id, []).append(inst)
+
+        invoices_by_card = {
+            invoice.card_id: invoice
+            for invoice in Invoice.query.filter_by(month=month, year=year).all()
+        }
+
         invoices_data = []
 
         for card in cards:
             try:
-                amount = card.get_bill_for_month(month, year)
+                card_installments = installments_by_card.get(card.id, [])
+                amount = float(sum(inst.amount for inst in card_installments))
                 print(f"Cartão {card.name}: R$ {amount}")
 
-                invoice = Invoice.query.filter_by(
-                    card_id=card.id,
-                    month=month,
-                    year=year
-                ).first()
-
-                if not invoice and amount > 0:
-                    invoice = Invoice(
-                        card_id=card.id,
-                        month=month,
-                        year=year,
-                        amount=amount,
-                        due_date=_invoice_due_date(card, month, year),
-                        status='open'
-                    )
-                    db.session.add(invoice)
-                    db.session.commit()
-                elif invoice:
-                    if invoice.amount != amount:
-                        invoice.amount = amount
-                        db.session.commit()
+                invoice = invoices_by_card.get(card.id)
 
                 if invoice or amount > 0:
-                    installments = Installment.query.join(Transaction).filter(
-                        Transaction.card_id == card.id,
-                        Installment.statement_month == month,
-                        Installment.statement_year == year
-                    ).all()
-
                     installments_data = []
-                    for inst in installments:
+                    for inst in card_installments:
                         inst_dict = inst.to_dict()
                         inst_dict['transaction_id'] = inst.transaction_id
                         inst_dict['description'] = inst.transaction.description
@@ -234,9 +169,9 @@ def get_invoices():
 
                     invoices_data.append({
                         'invoice': invoice.to_dict() if invoice else None,
-                        'card': card.to_dict(),
+                        'card': card.to_dict(card_stats),
                         'amount': amount,
-                        'installments_count': len(installments),
+                        'installments_count': len(card_installments),
                         'installments': installments_data
                     })
             except Exception as card_error:
@@ -261,8 +196,7 @@ def pay_invoice(invoice_id):
 
         installments = Installment.query.join(Transaction).filter(
             Transaction.card_id == invoice.card_id,
-            Installment.statement_month == invoice.month,
-            Installment.statement_year == invoice.year,
+            Installment.statement_period == period_key(invoice.year, invoice.month),
             Installment.paid == False
         ).all()
 
@@ -288,8 +222,7 @@ def unpay_invoice(invoice_id):
 
         installments = Installment.query.join(Transaction).filter(
             Transaction.card_id == invoice.card_id,
-            Installment.statement_month == invoice.month,
-            Installment.statement_year == invoice.year
+            Installment.statement_period == period_key(invoice.year, invoice.month)
         ).all()
 
         for inst in installments:
@@ -306,15 +239,26 @@ def unpay_invoice(invoice_id):
 
 @invoices_bp.route('/api/timeline', methods=['GET'])
 def get_timeline():
-    """Retorna timeline de faturas (12 meses)"""
+    """Retorna timeline de faturas em torno do mês atual.
+
+    Janela: ?before=N&after=M meses (default app.config INVOICE_TIMELINE_MONTHS_BEFORE=6
+    e INVOICE_TIMELINE_MONTHS_AFTER=5, limitados a INVOICE_TIMELINE_MAX_MONTHS cada).
+    Valores vêm de uma consulta agrupada por statement_period e o status de uma
+    consulta de faturas para a janela inteira.
+    """
     try:
         today = datetime.now()
         current_month = today.month
         current_year = today.year
 
-        timeline = []
+        max_months = current_app.config.get('INVOICE_TIMELINE_MAX_MONTHS', 60)
+        before = request.args.get('before', current_app.config.get('INVOICE_TIMELINE_MONTHS_BEFORE', 6), type=int)
+        after = request.args.get('after', current_app.config.get('INVOICE_TIMELINE_MONTHS_AFTER', 5), type=int)
+        before = max(0, min(before, max_months))
+        after = max(0, min(after, max_months))
 
-        for offset in range(-6, 6):
+        months = []
+        for offset in range(-before, after + 1):
             month = current_month + offset
             year = current_year
 
@@ -325,34 +269,39 @@ def get_timeline():
                 month -= 12
                 year += 1
 
-            try:
-                cards = CreditCard.query.filter_by(active=True).all()
-                total_month = 0
-                for card in cards:
-                    try:
-                        total_month += card.get_bill_for_month(month, year)
-                    except Exception as card_error:
-                        print(f"Erro ao calcular fatura do cartão {card.name} para {month}/{year}: {str(card_error)}")
-                        continue
-
-                invoices = Invoice.query.filter_by(month=month, year=year).all()
-                all_paid = len(invoices) > 0 and all(inv.status == 'paid' for inv in invoices)
-
-                month_names = ['', 'Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
-
-                timeline.append({
-                    'month': month,
-                    'year': year,
-                    'month_name': month_names[month],
-                    'amount': total_month,
-                    'is_current': month == current_month and year == current_year,
-                    'is_past': year < current_year or (year == current_year and month < current_month),
-                    'is_paid': all_paid
-                })
-            except Exception as month_error:
-                print(f"Erro ao processar mês {month}/{year}: {str(month_error)}")
-                traceback.print_exc()
-                continue
+            months.append((year, month))
+
+        period_from = period_key(*months[0])
+        period_to = period_key(*months[-1])
+
+        card_ids = [card_id for (card_id,) in db.session.query(CreditCard.id).filter_by(active=True).all()]
+        totals = compute_statement_totals(period_from, period_to, card_ids)
+
+        # Status: mês "pago" quando existe fatura e todas estão pagas
+        statuses = {}
+        invoices = db.session.query(Invoice.year, Invoice.month, Invoice.status).filter(
+            (Invoice.year * 100 + Invoice.month).between(period_from, period_to)
+        ).all()
+        for year, month, status in invoices:
+            statuses.setdefault(period_key(year, month), []).append(status)
+
+        month_names = ['', 'Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+        timeline = []
+        for year, month in months:
+            period = period_key(year, month)
+            month_statuses = statuses.get(period, [])
+            all_paid = len(month_statuses) > 0 and all(status == 'paid' for status in month_statuses)
+
+            timeline.append({
+                'month': month,
+                'year': year,
+                'month_name': month_names[month],
+                'amount': totals.get(period, 0.0),
+                'is_current': month == current_month and year == current_year,
+                'is_past': year < current_year or (year == current_year and month < current_month),
+                'is_paid': all_paid
+            })
 
         return jsonify(timeline)
     except Exception as e:
@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify, render_template
-from models import Notification, Invoice, Bill, CreditCard
+from flask import Blueprint, request, jsonify, render_template, Response, current_app
+from models import Notification
 from database import db
-from datetime import datetime, timedelta
+from datetime import datetime
+import base64
+import json
+import queue
 import traceback
 
+from sqlalchemy import tuple_
+
+from services.conditional_get import no_etag
+from services.notification_events import notification_broker, unread_count
+from services.notifications import generate_due_notifications
+
 notifications_bp = Blueprint('notifications', __name__, url_prefix='/notifications')
 
 @notifications_bp.route('/')
@@ -11,19 +20,60 @@ def index():
     """Página de notificações"""
     return render_template('notifications.html')
 
+def _encode_cursor(notification) -> str:
+    raw = f"{notification.created_at.isoformat()}|{notification.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Cursor opaco -> (created_at, id) do último item da página anterior. ValueError se inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, notification_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(notification_id)
+    except Exception:
+        raise ValueError('cursor inválido')
+
+
 @notifications_bp.route('/api/notifications', methods=['GET'])
 def get_notifications():
-    """Lista todas as notificações"""
+    """Lista notificações, mais recentes primeiro, paginadas por cursor (keyset).
+
+    ?limit=N (default NOTIFICATIONS_PAGE_SIZE, máximo NOTIFICATIONS_PAGE_MAX) e
+    ?cursor=... (header X-Next-Cursor da página anterior). A consulta usa
+    (created_at, id) < cursor nos índices de created_at, então o custo não
+    depende de quantas páginas já foram lidas. Sem X-Next-Cursor: última página.
+    """
     try:
         unread_only = request.args.get('unread', 'false').lower() == 'true'
-        
+        page_max = current_app.config.get('NOTIFICATIONS_PAGE_MAX', 200)
+        limit = request.args.get('limit', current_app.config.get('NOTIFICATIONS_PAGE_SIZE', 50), type=int)
+        limit = max(1, min(limit, page_max))
+
         query = Notification.query
         if unread_only:
             query = query.filter_by(read=False)
-        
-        notifications = query.order_by(Notification.created_at.desc()).limit(50).all()
-        
-        return jsonify([n.to_dict() for n in notifications])
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                created_at, notification_id = _decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(tuple_(Notification.created_at, Notification.id) < (created_at, notification_id))
+
+        # Um item a mais só para saber se existe próxima página
+        notifications = query.order_by(
+            Notification.created_at.desc(), Notification.id.desc()
+        ).limit(limit + 1).all()
+
+        has_more = len(notifications) > limit
+        notifications = notifications[:limit]
+
+        response = jsonify([n.to_dict() for n in notifications])
+        if has_more:
+            response.headers['X-Next-Cursor'] = _encode_cursor(notifications[-1])
+        return response
     except Exception as e:
         print(f"Erro em get_notifications: {str(e)}")
         traceback.print_exc()
@@ -39,6 +89,48 @@ def count_unread():
         print(f"Erro em count_unread: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@notifications_bp.route('/api/notifications/stream', methods=['GET'])
+@no_etag
+def stream_notifications():
+    """Server-Sent Events: contagem de não lidas e notificações novas, empurradas a cada commit.
+
+    Eventos:
+    - count: {"count": N} (logo ao conectar e quando a tabela muda)
+    - notification: payload de Notification.to_dict() de cada notificação criada
+    Comentários de keep-alive a cada NOTIFICATION_STREAM_KEEPALIVE segundos.
+    """
+    keepalive = float(current_app.config.get('NOTIFICATION_STREAM_KEEPALIVE', 25))
+
+    # Inscreve antes de contar: um commit entre os dois passos chega pela fila
+    subscription = notification_broker.subscribe()
+    try:
+        initial = unread_count()
+    except Exception:
+        notification_broker.unsubscribe(subscription)
+        raise
+
+    def _format(event_name, data):
+        return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            yield _format('count', {'count': initial})
+            while True:
+                try:
+                    event_name, data = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _format(event_name, data)
+        finally:
+            notification_broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @notifications_bp.route('/api/notifications/<int:notification_id>/read', methods=['POST'])
 def mark_as_read(notification_id):
     """Marca notificação como lida"""
@@ -80,97 +172,16 @@ def delete_notification(notification_id):
 
 @notifications_bp.route('/api/notifications/generate', methods=['POST'])
 def generate_notifications():
-    """Gera notificações automáticas baseado no estado atual"""
+    """Gera notificações automáticas baseado no estado atual.
+
+    Candidatos em poucas consultas agregadas e um único INSERT ... ON CONFLICT
+    DO NOTHING (ver services/notifications.py): uma notificação por referência
+    por período.
+    """
     try:
-        today = datetime.now()
-        generated = []
-        
-        # 1. Verificar faturas vencendo em 5 dias
-        future_date = today + timedelta(days=5)
-        invoices = Invoice.query.filter(
-            Invoice.status == 'open',
-            Invoice.due_date <= future_date,
-            Invoice.due_date >= today
-        ).all()
-        
-        for invoice in invoices:
-            # Verificar se já existe notificação
-            existing = Notification.query.filter_by(
-                type='invoice_due',
-                reference_id=invoice.id,
-                read=False
-            ).first()
-            
-            if not existing:
-                days_left = (invoice.due_date - today).days
-                notification = Notification(
-                    type='invoice_due',
-                    title=f'Fatura vencendo em {days_left} dias',
-                    message=f'A fatura do cartão {invoice.card.name} vence em {invoice.due_date.strftime("%d/%m/%Y")}. Valor: R$ {invoice.amount:.2f}',
-                    priority='high' if days_left <= 2 else 'normal',
-                    link=f'/invoices',
-                    reference_id=invoice.id,
-                    reference_type='invoice'
-                )
-                db.session.add(notification)
-                generated.append('invoice_due')
-        
-        # 2. Verificar boletos vencendo em 3 dias
-        future_date_bills = today + timedelta(days=3)
-        bills = Bill.query.filter(
-            Bill.paid == False,
-            Bill.due_date <= future_date_bills,
-            Bill.due_date >= today
-        ).all()
-        
-        for bill in bills:
-            existing = Notification.query.filter_by(
-                type='bill_due',
-                reference_id=bill.id,
-                read=False
-            ).first()
-            
-            if not existing:
-                days_left = (bill.due_date - today).days
-                notification = Notification(
-                    type='bill_due',
-                    title=f'Boleto vencendo em {days_left} dias',
-                    message=f'{bill.description} vence em {bill.due_date.strftime("%d/%m/%Y")}. Valor: R$ {bill.amount:.2f}',
-                    priority='urgent' if days_left == 0 else 'high',
-                    link=f'/bills',
-                    reference_id=bill.id,
-                    reference_type='bill'
-                )
-                db.session.add(notification)
-                generated.append('bill_due')
-        
-        # 3. Verificar limite de cartões (>80%)
-        cards = CreditCard.query.filter_by(active=True).all()
-        for card in cards:
-            usage_percent = (card.get_total_used() / card.limit_total) * 100 if card.limit_total > 0 else 0
-            
-            if usage_percent > 80:
-                existing = Notification.query.filter_by(
-                    type='limit_alert',
-                    reference_id=card.id,
-                    read=False
-                ).first()
-                
-                if not existing:
-                    notification = Notification(
-                        type='limit_alert',
-                        title=f'Limite do cartão alto',
-                        message=f'Você está usando {usage_percent:.1f}% do limite do {card.name}. Disponível: R$ {card.get_available_limit():.2f}',
-                        priority='normal',
-                        link=f'/cards',
-                        reference_id=card.id,
-                        reference_type='card'
-                    )
-                    db.session.add(notification)
-                    generated.append('limit_alert')
-        
+        generated = [n.type for n in generate_due_notifications()]
         db.session.commit()
-        
+
         return jsonify({
             'success': True,
             'generated': len(generated),
@@ -178,6 +189,7 @@ def generate_notifications():
         })
         
     except Exception as e:
+        db.session.rollback()
         print(f"Erro em generate_notifications: {str(e)}")
         traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,239 @@
+"""Importação de extratos bancários (CSV/OFX) para Account, em streaming.
+
+O arquivo é lido linha a linha (geradores), cada movimento vira um lançamento
+de receita/despesa e a gravação é feita em blocos (INSERT em lote ... ON
+CONFLICT DO NOTHING, um commit por bloco). Em memória ficam o bloco atual e a
+contagem de movimentos repetidos: uma entrada de tamanho fixo (digest sha1 de
+20 bytes) por movimento distinto do arquivo, ou seja, memória O(movimentos
+distintos), não constante, mas sem guardar o texto das linhas.
+
+Deduplicação: import_hash = sha1(data | tipo | valor | descrição normalizada |
+ordinal), com índice único em accounts.import_hash. O ordinal distingue
+movimentos idênticos no mesmo dia (ex.: dois cafés iguais); reimportar o mesmo
+extrato (ou um período sobreposto) gera os mesmos hashes e não duplica nada.
+Lançamentos digitados à mão ficam com import_hash NULL.
+"""
+import csv
+import hashlib
+import re
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert
+
+from database import db
+from models import Account, period_key
+from services.ledger import apply_account_rows
+
+
+# Nomes aceitos no cabeçalho do CSV (minúsculas, sem acento) -> campo
+_CSV_HEADERS = {
+    'date': 'date', 'data': 'date', 'data lancamento': 'date', 'data movimento': 'date',
+    'description': 'description', 'descricao': 'description', 'historico': 'description',
+    'memo': 'description', 'lancamento': 'description',
+    'amount': 'amount', 'valor': 'amount', 'valor (r$)': 'amount',
+    'type': 'type', 'tipo': 'type',
+    'category': 'category', 'categoria': 'category',
+}
+
+_ACCENTS = str.maketrans('áàâãäéèêëíìîïóòôõöúùûüç', 'aaaaaeeeeiiiiooooouuuuc')
+
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%Y%m%d')
+
+_TYPES = {
+    'income': 'income', 'receita': 'income', 'credito': 'income', 'c': 'income', 'credit': 'income',
+    'expense': 'expense', 'despesa': 'expense', 'debito': 'expense', 'd': 'expense', 'debit': 'expense',
+}
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+class ImportRowError(ValueError):
+    """Linha do extrato que não pôde ser convertida (vai para errors, não interrompe a importação)."""
+
+
+def _decode_lines(stream):
+    """Linhas de texto de um stream binário (UTF-8; linhas inválidas caem para cp1252)."""
+    for raw in stream:
+        if isinstance(raw, str):
+            yield raw
+            continue
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            yield raw.decode('cp1252', errors='replace')
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(str(text or '').strip().lower().translate(_ACCENTS).split())
+
+
+def _parse_amount(value) -> float:
+    text = str(value or '').strip().replace('R$', '').replace(' ', '')
+    if ',' in text:
+        # Formato brasileiro: 1.234,56
+        text = text.replace('.', '').replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        raise ImportRowError(f'valor inválido: {value!r}')
+
+
+def _parse_date(value) -> datetime:
+    text = str(value or '').strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ImportRowError(f'data inválida: {value!r}')
+
+
+def iter_csv(stream):
+    """Gera (número da linha, dict) de um CSV com cabeçalho (',' ou ';')."""
+    lines = _decode_lines(stream)
+    header_line = next(lines, '').lstrip('\ufeff')
+    delimiter = ';' if header_line.count(';') > header_line.count(',') else ','
+
+    header = next(csv.reader([header_line], delimiter=delimiter), [])
+    fields = [_CSV_HEADERS.get(_normalize(name)) for name in header]
+    if 'date' not in fields or 'amount' not in fields:
+        raise ValueError('CSV sem colunas de data e valor no cabeçalho')
+
+    for line_number, values in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+        if not any(v.strip() for v in values):
+            continue
+        yield line_number, {
+            field: value.strip()
+            for field, value in zip(fields, values)
+            if field
+        }
+
+
+def iter_ofx(stream):
+    """Gera (número da linha, dict) para cada <STMTTRN> de um OFX (SGML 1.x ou XML 2.x)."""
+    current = None
+    start_line = 0
+    for line_number, line in enumerate(_decode_lines(stream), start=1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield start_line, {
+                        'date': (current.get('DTPOSTED') or '')[:8],
+                        'amount': current.get('TRNAMT'),
+                        'description': current.get('MEMO') or current.get('NAME') or '',
+                    }
+                    current = None
+                elif not closing:
+                    current, start_line = {}, line_number
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+
+
+def _to_account_row(fields: dict, defaults: dict) -> dict:
+    date = _parse_date(fields.get('date'))
+    amount = _parse_amount(fields.get('amount'))
+    if amount == 0:
+        raise ImportRowError('valor zerado')
+
+    type_ = _TYPES.get(_normalize(fields.get('type'))) if fields.get('type') else None
+    if type_ is None:
+        type_ = 'expense' if amount < 0 else 'income'
+
+    description = ' '.join(str(fields.get('description') or '').split())[:200] or 'Importado'
+
+    return {
+        'description': description,
+        'amount': abs(amount),
+        'type': type_,
+        'category': (fields.get('category') or defaults['category'] or '')[:50],
+        'date': date,
+        'period': period_key(date.year, date.month),
+        'consolidated': defaults['consolidated'],
+        'consolidated_date': defaults['consolidated_at'] if defaults['consolidated'] else None,
+        'recurring': False,
+        'created_at': defaults['created_at'],
+    }
+
+
+def _content(row: dict) -> str:
+    return f"{row['date']:%Y-%m-%d}|{row['type']}|{row['amount']:.2f}|{_normalize(row['description'])}"
+
+
+def _write_chunk(rows: list[dict]) -> int:
+    """Insere o bloco ignorando hashes já existentes; rollup mensal só das linhas gravadas. Faz commit."""
+    inserted = set(db.session.execute(
+        insert(Account.__table__).on_conflict_do_nothing().returning(Account.__table__.c.import_hash),
+        rows
+    ).scalars())
+
+    # INSERT em lote não passa pelos eventos do ORM: atualizar o rollup mensal aqui.
+    apply_account_rows([row for row in rows if row['import_hash'] in inserted])
+    db.session.commit()
+    return len(inserted)
+
+
+def import_statement(stream, file_format: str, category: str = '', consolidated: bool = True,
+                     chunk_size: int = 1000, max_errors: int = 100) -> dict:
+    """Importa um extrato (stream binário) em blocos de chunk_size linhas.
+
+    file_format: 'csv' ou 'ofx'. Linhas inválidas são contadas e as primeiras
+    max_errors voltam em errors ({'line', 'error'}).
+    Retorna {'read', 'imported', 'duplicates', 'invalid', 'errors'}.
+    """
+    if file_format == 'csv':
+        records = iter_csv(stream)
+    elif file_format == 'ofx':
+        records = iter_ofx(stream)
+    else:
+        raise ValueError(f'formato não suportado: {file_format!r}')
+
+    defaults = {
+        'category': category,
+        'consolidated': consolidated,
+        'consolidated_at': datetime.now(),
+        'created_at': datetime.utcnow(),
+    }
+    # Ocorrências de cada (data | tipo | valor | descrição) no arquivo inteiro: a ordem
+    # das linhas não importa (extrato fora de ordem de data numera igual). Chave =
+    # digest de 20 bytes do conteúdo, não o texto: O(movimentos distintos) de memória
+    ordinals = {}
+    result = {'read': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+
+    chunk = []
+    for line_number, fields in records:
+        result['read'] += 1
+        try:
+            row = _to_account_row(fields, defaults)
+        except ImportRowError as e:
+            result['invalid'] += 1
+            if len(result['errors']) < max_errors:
+                result['errors'].append({'line': line_number, 'error': str(e)})
+            continue
+
+        content = _content(row)
+        key = hashlib.sha1(content.encode()).digest()
+        ordinal = ordinals.get(key, 0)
+        ordinals[key] = ordinal + 1
+        row['import_hash'] = hashlib.sha1(f'{content}|{ordinal}'.encode()).hexdigest()
+        chunk.append(row)
+
+        if len(chunk) >= chunk_size:
+            result['imported'] += _write_chunk(chunk)
+            chunk = []
+
+    if chunk:
+        result['imported'] += _write_chunk(chunk)
+
+    result['duplicates'] = result['read'] - result['invalid'] - result['imported']
+    return result
+
+
+def detect_format(filename: str | None, head: bytes) -> str:
+    """'ofx' ou 'csv' pela extensão do arquivo (ou pelo início do conteúdo)."""
+    name = (filename or '').lower()
+    if name.endswith('.ofx'):
+        return 'ofx'
+    if name.endswith('.csv') or name.endswith('.txt'):
+        return 'csv'
+    return 'ofx' if b'OFXHEADER' in head.upper() or b'<OFX>' in head.upper() else 'csv'
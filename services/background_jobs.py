@@ -0,0 +1,77 @@
+"""Início explícito das threads de background (recorrência, notificações, retenção, backup).
+
+init_app() dos agendadores só configura; as threads sobem aqui, só no
+processo que atende as requisições. Assim importar o app (scripts, testes,
+migrações) não grava nada em background, e com o reloader do Flask o pai (que
+só vigia arquivos) não duplica materialização, notificações (que o broker SSE
+do filho nunca veria) nem backups.
+
+Dois caminhos de início:
+- python app.py: bloco __main__ chama start_background_jobs(app, use_reloader=True)
+  (só o filho do reloader, WERKZEUG_RUN_MAIN, inicia);
+- flask run / servidor WSGI: init_background_jobs(app) inicia os jobs na primeira
+  requisição atendida (o pai do reloader nunca atende requisições). Desligue com
+  BACKGROUND_JOBS_AUTOSTART = False. Com vários workers cada um roda os seus
+  (a materialização não duplica filhos: índice único (parent_id, period)).
+"""
+import os
+import threading
+
+from services.backup import backup_scheduler
+from services.notification_retention import notification_retention
+from services.notification_scheduler import notification_scheduler
+from services.recurrence_scheduler import recurrence_scheduler
+
+
+# (chave de configuração que habilita, job)
+_JOBS = (
+    ('RECURRENCE_SCHEDULER_ENABLED', recurrence_scheduler),
+    ('NOTIFICATION_SCHEDULER_ENABLED', notification_scheduler),
+    ('NOTIFICATION_RETENTION_ENABLED', notification_retention),
+    ('BACKUP_ENABLED', backup_scheduler),
+)
+
+
+def start_background_jobs(app, use_reloader: bool = False) -> list[str]:
+    """Inicia os jobs habilitados em app.config. Retorna os nomes das threads iniciadas.
+
+    use_reloader=True: no processo pai do reloader (sem WERKZEUG_RUN_MAIN) não inicia nada.
+    """
+    if app.testing:
+        return []
+    if use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return []
+
+    started = []
+    for config_key, job in _JOBS:
+        if not app.config.get(config_key, True) or job.app is not app:
+            continue
+        if job is backup_scheduler and (not job.db_path or job.db_path == ':memory:'):
+            # Banco em memória não tem arquivo para copiar
+            continue
+        job.start()
+        started.append(job._thread.name)
+    return started
+
+
+def init_background_jobs(app):
+    """Registra o início dos jobs na primeira requisição (flask run / WSGI).
+
+    Chamado no app.py depois de init_app() dos agendadores; respeita
+    BACKGROUND_JOBS_AUTOSTART (default True). Idempotente com o bloco __main__:
+    job já iniciado não sobe de novo.
+    """
+    if not app.config.get('BACKGROUND_JOBS_AUTOSTART', True):
+        return
+
+    lock = threading.Lock()
+    started = []
+
+    @app.before_request
+    def _start_background_jobs_once():
+        if started:
+            return
+        with lock:
+            if not started:
+                start_background_jobs(app)
+                started.append(True)
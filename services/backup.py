@@ -0,0 +1,339 @@
+"""Backup a quente do banco SQLite (API de backup online), rotação e restauração.
+
+Copiar o arquivo .db enquanto o app grava pode gerar uma cópia corrompida. A
+API de backup do SQLite copia página a página de forma consistente; aqui ela
+roda em passos de poucas páginas com uma pausa entre eles, então o lock de
+leitura no banco de origem dura só um passo e as requisições seguem gravando.
+Se o banco muda no meio, o SQLite recomeça a cópia (contado em restarts). Depois
+de BACKUP_MAX_RESTARTS recomeços:
+- banco em WAL (ativado por init_db): a cópia termina num passo só; a leitura
+  longa não bloqueia quem grava;
+- outro journal: desiste (BackupBusyError) em vez de segurar o lock de leitura
+  durante a cópia inteira, e o agendador tenta de novo após BACKUP_RETRY_INTERVAL.
+
+Os snapshots saem com journal DELETE (arquivo único, sem -wal ao lado).
+
+Cada snapshot é gravado num arquivo temporário e renomeado no fim (nunca fica
+um backup pela metade com nome válido). Ficam os BACKUP_KEEP mais recentes.
+"""
+import glob
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime
+
+
+DEFAULT_KEEP = 7
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_STEP_SLEEP = 0.01
+DEFAULT_INTERVAL = 86400
+DEFAULT_MAX_RESTARTS = 5
+DEFAULT_RETRY_INTERVAL = 300
+
+_SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+
+def _snapshot_prefix(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0] + '-'
+
+
+def list_backups(db_path: str, backup_dir: str) -> list[dict]:
+    """Snapshots existentes (mais recente primeiro): path, name, size, created_at."""
+    pattern = os.path.join(backup_dir, glob.escape(_snapshot_prefix(db_path)) + '*.db')
+    backups = []
+    for path in glob.glob(pattern):
+        stat = os.stat(path)
+        backups.append({
+            'path': path,
+            'name': os.path.basename(path),
+            'size': stat.st_size,
+            'created_at': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+        })
+    backups.sort(key=lambda b: b['name'], reverse=True)
+    return backups
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class BackupBusyError(RuntimeError):
+    """Banco alterado demais durante a cópia (sem WAL): tentar de novo mais tarde."""
+
+
+def _copy(source_path: str, dest_path: str, pages: int, sleep: float, max_restarts: int | None = None) -> dict:
+    """Backup online de source_path para dest_path em passos de `pages` páginas. Retorna métricas.
+
+    Com max_restarts, a cópia em passos desiste após esse número de recomeços:
+    com a origem em WAL termina num passo único (pages=-1, não bloqueia quem
+    grava); senão levanta BackupBusyError.
+    """
+    metrics = {'steps': 0, 'restarts': 0, 'pages': 0, 'max_step_seconds': 0.0, 'single_step': pages < 1}
+    state = {'remaining': None, 'last': time.perf_counter()}
+
+    def _progress(status, remaining, total):
+        now = time.perf_counter()
+        metrics['steps'] += 1
+        metrics['pages'] = total
+        metrics['max_step_seconds'] = max(metrics['max_step_seconds'], now - state['last'] - sleep)
+        if state['remaining'] is not None and remaining > state['remaining']:
+            # Origem alterada por outra conexão: o SQLite recomeçou a cópia
+            metrics['restarts'] += 1
+            if max_restarts is not None and metrics['restarts'] > max_restarts and pages > 0:
+                raise _TooManyRestarts
+        state['remaining'] = remaining
+        state['last'] = time.perf_counter()
+
+    source = sqlite3.connect(source_path, timeout=30)
+    dest = sqlite3.connect(dest_path)
+    try:
+        try:
+            source.backup(dest, pages=pages, progress=_progress, sleep=sleep)
+        except _TooManyRestarts:
+            if source.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+                # Sem WAL, um passo único seguraria o lock de leitura e travaria as gravações
+                raise BackupBusyError(f"banco alterado {metrics['restarts']} vezes durante a cópia")
+            metrics['single_step'] = True
+            state['last'] = time.perf_counter()
+            source.backup(dest, pages=-1, progress=_progress)
+    finally:
+        dest.close()
+        source.close()
+
+    metrics['max_step_seconds'] = round(max(metrics['max_step_seconds'], 0.0), 4)
+    return metrics
+
+
+def rotate_backups(db_path: str, backup_dir: str, keep: int) -> list[str]:
+    """Apaga os snapshots além dos `keep` mais recentes. Retorna os nomes removidos."""
+    removed = []
+    for backup in list_backups(db_path, backup_dir)[keep:]:
+        os.remove(backup['path'])
+        removed.append(backup['name'])
+    return removed
+
+
+def create_backup(db_path: str, backup_dir: str, keep: int = DEFAULT_KEEP,
+                  pages: int = DEFAULT_PAGES_PER_STEP, sleep: float = DEFAULT_STEP_SLEEP,
+                  max_restarts: int = DEFAULT_MAX_RESTARTS) -> dict:
+    """Gera um snapshot consistente de db_path em backup_dir e aplica a rotação.
+
+    Retorna métricas: path, size, seconds, steps, pages, restarts, single_step,
+    max_step_seconds (maior tempo de um passo, sem a pausa) e rotated.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+
+    name = f"{_snapshot_prefix(db_path)}{datetime.now().strftime(_SNAPSHOT_TIME_FORMAT)}.db"
+    path = os.path.join(backup_dir, name)
+    tmp_path = path + '.tmp'
+
+    started = time.perf_counter()
+    try:
+        metrics = _copy(db_path, tmp_path, pages, sleep, max_restarts)
+
+        # Snapshot em arquivo único e checagem rápida antes de torná-lo válido
+        check = sqlite3.connect(tmp_path)
+        try:
+            check.execute('PRAGMA journal_mode=DELETE')
+            result = check.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            check.close()
+        if result != 'ok':
+            raise RuntimeError(f'backup inválido (quick_check: {result})')
+
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    metrics.update({
+        'path': path,
+        'name': name,
+        'size': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - started, 3),
+        'rotated': rotate_backups(db_path, backup_dir, keep),
+    })
+    return metrics
+
+
+def restore_backup(backup_path: str, db_path: str, pages: int = -1) -> dict:
+    """Restaura um snapshot sobre db_path (usar com o app parado).
+
+    Antes, o banco atual é copiado para db_path + '.before-restore' (se existir).
+    A cópia usa a mesma API de backup (o destino fica consistente mesmo com WAL).
+    """
+    check = sqlite3.connect(f'file:{backup_path}?mode=ro', uri=True)
+    try:
+        result = check.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        check.close()
+    if result != 'ok':
+        raise RuntimeError(f'snapshot inválido (quick_check: {result})')
+
+    started = time.perf_counter()
+    safety_copy = None
+    if os.path.exists(db_path):
+        safety_copy = db_path + '.before-restore'
+        _copy(db_path, safety_copy, -1, 0)
+
+    metrics = _copy(backup_path, db_path, pages, 0)
+    metrics.update({
+        'restored_from': backup_path,
+        'safety_copy': safety_copy,
+        'seconds': round(time.perf_counter() - started, 3),
+    })
+    return metrics
+
+
+class BackupScheduler:
+    """Thread em background que gera snapshots periódicos do banco.
+
+    Configuração (app.config):
+    - BACKUP_ENABLED (default True; lido por start_background_jobs)
+    - BACKUP_DIR (default <pasta do banco>/backups)
+    - BACKUP_KEEP (snapshots mantidos, default 7)
+    - BACKUP_INTERVAL (segundos, default 86400)
+    - BACKUP_PAGES_PER_STEP / BACKUP_STEP_SLEEP (tamanho do passo e pausa entre passos)
+    - BACKUP_MAX_RESTARTS (recomeços antes do passo único/desistência, default 5)
+    - BACKUP_RETRY_INTERVAL (segundos até nova tentativa após falha, default 300)
+
+    Mesmo padrão de recurrence_scheduler: instância global + init_app(app); a
+    thread só sobe em start_background_jobs.
+    O primeiro snapshot sai depois de BACKUP_INTERVAL (não na inicialização).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.db_path = None
+        self.backup_dir = None
+        self.keep = DEFAULT_KEEP
+        self.interval_seconds = DEFAULT_INTERVAL
+        self.pages = DEFAULT_PAGES_PER_STEP
+        self.sleep = DEFAULT_STEP_SLEEP
+        self.max_restarts = DEFAULT_MAX_RESTARTS
+        self.retry_interval_seconds = DEFAULT_RETRY_INTERVAL
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.last_run_at = None
+        self.last_metrics = None
+        self.last_error = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from database import db
+
+        self.app = app
+        with app.app_context():
+            self.db_path = db.engine.url.database
+        self.backup_dir = app.config.get('BACKUP_DIR') or os.path.join(
+            os.path.dirname(os.path.abspath(self.db_path or '.')), 'backups'
+        )
+        self.keep = int(app.config.get('BACKUP_KEEP', DEFAULT_KEEP))
+        self.interval_seconds = float(app.config.get('BACKUP_INTERVAL', DEFAULT_INTERVAL))
+        self.pages = int(app.config.get('BACKUP_PAGES_PER_STEP', DEFAULT_PAGES_PER_STEP))
+        self.sleep = float(app.config.get('BACKUP_STEP_SLEEP', DEFAULT_STEP_SLEEP))
+        self.max_restarts = int(app.config.get('BACKUP_MAX_RESTARTS', DEFAULT_MAX_RESTARTS))
+        self.retry_interval_seconds = float(app.config.get('BACKUP_RETRY_INTERVAL', DEFAULT_RETRY_INTERVAL))
+
+        app.extensions['backup_scheduler'] = self
+
+    def run_once(self) -> dict:
+        """Gera um snapshot agora (na thread atual). Retorna as métricas."""
+        if not self.db_path or self.db_path == ':memory:':
+            raise RuntimeError('banco sem arquivo para backup')
+
+        with self._lock:
+            try:
+                metrics = create_backup(
+                    self.db_path, self.backup_dir, self.keep, self.pages, self.sleep, self.max_restarts
+                )
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+
+            self.last_run_at = datetime.now()
+            self.last_metrics = metrics
+            self.last_error = None
+
+        print(
+            f"💾 Backup: {metrics['name']} ({metrics['size'] / 1024 / 1024:.1f} MB) em {metrics['seconds']}s, "
+            f"{metrics['steps']} passos, maior passo {metrics['max_step_seconds']}s, "
+            f"{metrics['restarts']} recomeços, {len(metrics['rotated'])} antigos removidos"
+        )
+        return metrics
+
+    def request_run(self):
+        """Pede um snapshot em background (não bloqueia a requisição).
+
+        Com a thread periódica ativa, só a acorda; senão, roda numa thread avulsa.
+        """
+        if self._thread and self._thread.is_alive():
+            self._wakeup.set()
+            return
+
+        threading.Thread(target=self._run_logged, name='sqlite-backup-once', daemon=True).start()
+
+    def status(self) -> dict:
+        """Configuração, métricas do último backup e snapshots existentes."""
+        return {
+            'running': self._lock.locked(),
+            'enabled': bool(self._thread and self._thread.is_alive()),
+            'backup_dir': self.backup_dir,
+            'keep': self.keep,
+            'interval_seconds': self.interval_seconds,
+            'last_run_at': self.last_run_at.strftime('%Y-%m-%d %H:%M:%S') if self.last_run_at else None,
+            'last_metrics': self.last_metrics,
+            'last_error': self.last_error,
+            'backups': [
+                {key: value for key, value in backup.items() if key != 'path'}
+                for backup in list_backups(self.db_path, self.backup_dir)
+            ] if self.db_path and self.db_path != ':memory:' else [],
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='sqlite-backup', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        wait = self.interval_seconds
+        while not self._stop.is_set():
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+
+            # Depois de uma falha (ex.: banco ocupado) tenta de novo mais cedo
+            wait = self.interval_seconds if self._run_logged() else min(self.retry_interval_seconds, self.interval_seconds)
+
+    def _run_logged(self) -> bool:
+        try:
+            self.run_once()
+            return True
+        except BackupBusyError as e:
+            print(f"⚠️ Backup adiado: {e}; nova tentativa em {self.retry_interval_seconds:.0f}s")
+        except Exception as e:
+            print(f"⚠️ Falha no backup do banco: {e}")
+            traceback.print_exc()
+        return False
+
+
+backup_scheduler = BackupScheduler()
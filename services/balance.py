@@ -0,0 +1,292 @@
+"""Saldo atual/projetado com snapshots mensais de fechamento (tabela balance_snapshots).
+
+O saldo de fechamento de cada mês é acumulado a partir do rollup mensal
+(monthly_ledger), das faturas pagas e dos boletos pagos, e gravado em
+balance_snapshots. Uma alteração num mês apaga os snapshots daquele mês em
+diante e, no commit dessa mesma escrita (before_commit), os meses fechados que
+faltam são recalculados a partir do último snapshot válido. Como recálculo e
+invalidação acontecem na mesma transação do escritor, nenhum saldo velho fica
+gravado. As leituras só leem: partem do último snapshot e somam os meses que
+faltarem, sem gravar nem fazer commit.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, event, func, inspect, text
+from sqlalchemy.orm import Session
+
+from database import db
+from models import Account, Bill, Invoice, period_key
+
+
+# Marca, na conexão da escrita, que há snapshots a recalcular no commit
+_INVALIDATED_KEY = 'balance_snapshots_invalidated'
+
+_BILL_PERIOD_SQL = "CAST(strftime('%Y', due_date) AS INTEGER) * 100 + CAST(strftime('%m', due_date) AS INTEGER)"
+
+
+def _next_period(period: int) -> int:
+    year, month = divmod(period, 100)
+    return period_key(year + 1, 1) if month == 12 else period_key(year, month + 1)
+
+
+def _prev_period(period: int) -> int:
+    year, month = divmod(period, 100)
+    return period_key(year - 1, 12) if month == 1 else period_key(year, month - 1)
+
+
+def invalidate_balance_snapshots(connection, period_from: int | None = None):
+    """Apaga os snapshots a partir de period_from (None = todos). Use a conexão da transação em curso.
+
+    Os meses fechados apagados são regravados no commit da sessão (_refresh_on_commit).
+    """
+    connection.info[_INVALIDATED_KEY] = True
+    if period_from is None:
+        connection.execute(text("DELETE FROM balance_snapshots"))
+    else:
+        connection.execute(text("DELETE FROM balance_snapshots WHERE period >= :p"), {'p': int(period_from)})
+
+
+# ---------------------------------------------------------------------------
+# Invalidação por eventos (faturas e boletos; accounts são cobertos pelo ledger)
+# ---------------------------------------------------------------------------
+
+def _invoice_period(values: dict):
+    if not values['year'] or not values['month']:
+        return None
+    return period_key(values['year'], values['month'])
+
+
+def _bill_period(values: dict):
+    due_date = values['due_date']
+    if not due_date:
+        return None
+    return period_key(due_date.year, due_date.month)
+
+
+_TRACKED = {
+    Invoice: (('year', 'month', 'status', 'amount'), _invoice_period),
+    Bill: (('due_date', 'paid', 'amount'), _bill_period),
+}
+
+
+def _changed_from(target, columns, period_of):
+    """Menor período afetado pela alteração. False = nada relevante mudou; None = invalidar tudo."""
+    state = inspect(target)
+    if not any(state.attrs[col].history.has_changes() for col in columns):
+        return False
+
+    previous = {}
+    for col in columns:
+        hist = state.attrs[col].history
+        if hist.deleted:
+            previous[col] = hist.deleted[0]
+        elif hist.added:
+            # Valor antigo desconhecido (atributo expirado)
+            return None
+        else:
+            previous[col] = getattr(target, col)
+
+    periods = [p for p in (period_of(previous), period_of({col: getattr(target, col) for col in columns}))
+               if p is not None]
+    return min(periods) if periods else None
+
+
+def _after_change(mapper, connection, target):
+    columns, period_of = _TRACKED[mapper.class_]
+    period = period_of({col: getattr(target, col) for col in columns})
+    invalidate_balance_snapshots(connection, period)
+
+
+def _after_update(mapper, connection, target):
+    columns, period_of = _TRACKED[mapper.class_]
+    period = _changed_from(target, columns, period_of)
+    if period is not False:
+        invalidate_balance_snapshots(connection, period)
+
+
+for _model in (Invoice, Bill):
+    event.listen(_model, 'after_insert', _after_change)
+    event.listen(_model, 'after_delete', _after_change)
+    event.listen(_model, 'after_update', _after_update)
+
+
+# ---------------------------------------------------------------------------
+# Cálculo
+# ---------------------------------------------------------------------------
+
+def _monthly_deltas(executor, period_from: int | None, period_to: int) -> dict[int, float]:
+    """Variação do saldo por mês em (period_from, period_to]: 3 consultas agregadas."""
+    params = {'p_to': period_to, 'p_from': period_from if period_from is not None else 0}
+    deltas: dict[int, float] = {}
+
+    def _add(rows, sign):
+        for period, total in rows:
+            if period is None:
+                continue
+            deltas[int(period)] = deltas.get(int(period), 0.0) + sign * float(total or 0.0)
+
+    _add(executor.execute(text(
+        "SELECT period, SUM(CASE WHEN type = 'income' THEN amount ELSE -amount END) "
+        "FROM monthly_ledger WHERE type IN ('income', 'expense') AND period > :p_from AND period <= :p_to "
+        "GROUP BY period"
+    ), params), +1)
+
+    _add(executor.execute(text(
+        "SELECT year * 100 + month, SUM(amount) FROM invoices "
+        "WHERE status = 'paid' AND year * 100 + month > :p_from AND year * 100 + month <= :p_to "
+        "GROUP BY 1"
+    ), params), -1)
+
+    _add(executor.execute(text(
+        f"SELECT {_BILL_PERIOD_SQL}, SUM(amount) FROM bills "
+        f"WHERE paid = 1 AND {_BILL_PERIOD_SQL} > :p_from AND {_BILL_PERIOD_SQL} <= :p_to "
+        "GROUP BY 1"
+    ), params), -1)
+
+    return deltas
+
+
+def _closing_balances(executor, period: int) -> tuple[float, list[dict]]:
+    """Saldo de fechamento de `period` e os snapshots que faltam até ele (a partir do último gravado).
+
+    executor: sessão (leituras) ou conexão da transação em curso (commit).
+    """
+    snapshot = executor.execute(text(
+        "SELECT period, closing_balance FROM balance_snapshots WHERE period <= :p ORDER BY period DESC LIMIT 1"
+    ), {'p': period}).fetchone()
+
+    if snapshot and snapshot.period == period:
+        return float(snapshot.closing_balance), []
+
+    base_period = snapshot.period if snapshot else None
+    balance = float(snapshot.closing_balance) if snapshot else 0.0
+
+    deltas = _monthly_deltas(executor, base_period, period)
+    if base_period is None:
+        # Sem snapshot anterior: começa no mês mais antigo com movimento (ou no próprio mês)
+        first = min(deltas) if deltas else period
+        current = min(first, period)
+    else:
+        current = _next_period(base_period)
+
+    now = datetime.utcnow()
+    rows = []
+    while current <= period:
+        balance += deltas.get(current, 0.0)
+        rows.append({'period': current, 'closing_balance': balance, 'updated_at': now})
+        current = _next_period(current)
+
+    return balance, rows
+
+
+def closing_balance(period: int) -> float:
+    """Saldo acumulado até o fim do mês `period`. Só leitura (não grava snapshots)."""
+    balance, _ = _closing_balances(db.session, period)
+    return balance
+
+
+def _store_snapshots(connection, now: datetime | None = None) -> int:
+    """Grava os snapshots que faltam até o mês anterior ao atual (meses fechados)."""
+    now = now or datetime.now()
+    _, rows = _closing_balances(connection, _prev_period(period_key(now.year, now.month)))
+    if rows:
+        connection.execute(text(
+            "INSERT OR REPLACE INTO balance_snapshots (period, closing_balance, updated_at) "
+            "VALUES (:period, :closing_balance, :updated_at)"
+        ), rows)
+    return len(rows)
+
+
+def _refresh_on_commit(session):
+    """Regrava, na transação do escritor, os snapshots apagados pelas escritas desta sessão."""
+    if not session.in_transaction():
+        return
+
+    # O flush final do commit roda depois deste evento: antecipa para ver todas as invalidações
+    session.flush()
+    connection = session.connection()
+    if connection.info.pop(_INVALIDATED_KEY, False):
+        _store_snapshots(connection)
+
+
+event.listen(Session, 'before_commit', _refresh_on_commit)
+
+
+def init_balance(app):
+    """Na inicialização: grava os snapshots de meses fechados que faltarem (ex.: virada de mês)."""
+    with app.app_context():
+        try:
+            rows = _store_snapshots(db.session.connection())
+            db.session.commit()
+            if rows:
+                print(f"🛠️ Auto-migração: {rows} snapshots de saldo gravados")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Falha ao gravar snapshots de saldo: {e}")
+
+
+def current_balance(now: datetime | None = None) -> float:
+    """Saldo atual: lançamentos com data até agora - faturas pagas - boletos pagos.
+
+    = fechamento do mês anterior + lançamentos do mês atual até agora
+      - faturas/boletos pagos de meses a partir do atual.
+    """
+    now = now or datetime.now()
+    period = period_key(now.year, now.month)
+    first_day = datetime(now.year, now.month, 1)
+
+    balance = closing_balance(_prev_period(period))
+
+    balance += float(db.session.query(
+        func.sum(case((Account.type == 'income', Account.amount), else_=-Account.amount))
+    ).filter(
+        Account.period == period,
+        Account.type.in_(('income', 'expense')),
+        Account.date <= now
+    ).scalar() or 0.0)
+
+    balance -= float(db.session.query(func.sum(Invoice.amount)).filter(
+        Invoice.status == 'paid',
+        Invoice.year * 100 + Invoice.month >= period
+    ).scalar() or 0.0)
+
+    balance -= float(db.session.query(func.sum(Bill.amount)).filter(
+        Bill.paid == True,
+        Bill.due_date >= first_day
+    ).scalar() or 0.0)
+
+    return balance
+
+
+def amount_to_pay(month: int, year: int, now: datetime | None = None) -> float:
+    """Faturas abertas + boletos não pagos do mês atual até o mês anterior a month/year."""
+    now = now or datetime.now()
+    period_from = period_key(now.year, now.month)
+    period_to = _prev_period(period_key(year, month))
+    if period_to < period_from:
+        return 0.0
+
+    total = float(db.session.query(func.sum(Invoice.amount)).filter(
+        Invoice.status == 'open',
+        (Invoice.year * 100 + Invoice.month).between(period_from, period_to)
+    ).scalar() or 0.0)
+
+    total += float(db.session.query(func.sum(Bill.amount)).filter(
+        Bill.paid == False,
+        Bill.due_date >= datetime(now.year, now.month, 1),
+        Bill.due_date < datetime(year, month, 1)
+    ).scalar() or 0.0)
+
+    return total
+
+
+def compute_projected_balance(month: int, year: int, now: datetime | None = None) -> dict:
+    """Saldo atual, total a pagar até o mês anterior a month/year e saldo projetado."""
+    now = now or datetime.now()
+    balance = current_balance(now)
+    to_pay = amount_to_pay(month, year, now)
+    return {
+        'current_balance': balance,
+        'total_to_pay': to_pay,
+        'projected_balance': balance - to_pay,
+    }
@@ -0,0 +1,173 @@
+"""Importação em lote de compras de cartão (JSON ou CSV de fatura).
+
+Valida todas as linhas e calcula as parcelas/statements em memória; depois
+insere compras e parcelas em lote (dois INSERTs) na transação da sessão, em
+vez de dois commits por compra. Como os INSERTs não passam pelos eventos do
+ORM, aqui mesmo são atualizados o rollup mensal (services/ledger.py) e as
+faturas (services/invoices.py); versão dos dados e agendador de notificações
+veem os INSERTs pelo session.execute.
+"""
+import csv
+import io
+import math
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database import db
+from models import CreditCard, Installment, Transaction, period_key, plan_installments
+from services.invoices import sync_invoices
+from services.ledger import apply_transaction_rows
+
+
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y')
+
+
+def parse_csv(content: str) -> list[dict]:
+    """Linhas do CSV como dicts (cabeçalho obrigatório; separador ',' ou ';')."""
+    content = content.lstrip('\ufeff')
+    try:
+        dialect = csv.Sniffer().sniff(content[:4096], delimiters=',;')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(content), dialect=dialect)
+    return [
+        {(key or '').strip().lower(): (value.strip() if isinstance(value, str) else value)
+         for key, value in row.items()}
+        for row in reader
+    ]
+
+
+def _parse_amount(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        amount = float(value)
+    else:
+        text = str(value or '').strip().replace('R$', '').replace(' ', '')
+        if ',' in text:
+            # Formato brasileiro: 1.234,56
+            text = text.replace('.', '').replace(',', '.')
+        amount = float(text)
+    if not math.isfinite(amount):
+        raise ValueError
+    return amount
+
+
+def _parse_date(value) -> datetime:
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError
+
+
+def _validate(item, default_card_id, cards) -> tuple[dict | None, str | None]:
+    if not isinstance(item, dict):
+        return None, 'linha deve ser um objeto'
+
+    card_id = item.get('card_id') or default_card_id
+    try:
+        card_id = int(card_id)
+    except (TypeError, ValueError):
+        return None, 'card_id ausente ou inválido'
+    if card_id not in cards:
+        return None, f'cartão {card_id} não encontrado'
+
+    description = str(item.get('description') or '').strip()
+    if not description:
+        return None, 'description obrigatória'
+    if len(description) > 200:
+        return None, 'description com mais de 200 caracteres'
+
+    try:
+        amount = _parse_amount(item.get('amount'))
+    except (TypeError, ValueError):
+        return None, f"amount inválido: {item.get('amount')!r}"
+
+    try:
+        date = _parse_date(item.get('date'))
+    except ValueError:
+        return None, f"date inválida (use AAAA-MM-DD ou DD/MM/AAAA): {item.get('date')!r}"
+
+    installments_total = item.get('installments_total')
+    if installments_total in (None, ''):
+        installments_total = 1
+    try:
+        installments_total = int(installments_total)
+    except (TypeError, ValueError):
+        return None, f'installments_total inválido: {installments_total!r}'
+    if installments_total < 1:
+        return None, 'installments_total deve ser >= 1'
+
+    return {
+        'card_id': card_id,
+        'description': description,
+        'amount': amount,
+        'date': date,
+        'category': str(item.get('category') or '').strip(),
+        'installments_total': installments_total,
+    }, None
+
+
+def import_transactions(items: list, default_card_id=None) -> dict:
+    """Valida e insere as compras em lote. Não faz commit.
+
+    Linhas inválidas não impedem as válidas: voltam em errors como
+    {'row': n (1 = primeira linha de dados), 'error': mensagem}.
+    Retorna {'created', 'installments', 'transaction_ids', 'errors'}.
+    """
+    # Cartões citados em uma consulta; statement/vencimento calculados em memória
+    card_ids = set()
+    for item in items:
+        if isinstance(item, dict):
+            try:
+                card_ids.add(int(item.get('card_id') or default_card_id))
+            except (TypeError, ValueError):
+                pass
+    cards = {card.id: card for card in CreditCard.query.filter(CreditCard.id.in_(card_ids)).all()} if card_ids else {}
+
+    rows, errors = [], []
+    for number, item in enumerate(items, start=1):
+        row, error = _validate(item, default_card_id, cards)
+        if error:
+            errors.append({'row': number, 'error': error})
+        else:
+            rows.append(row)
+
+    if not rows:
+        return {'created': 0, 'installments': 0, 'transaction_ids': [], 'errors': errors}
+
+    now = datetime.utcnow()
+    for row in rows:
+        row['created_at'] = now
+
+    # Um INSERT multi-VALUES (insertmanyvalues) em vez de um por linha. O RETURNING
+    # não tem ordem garantida: sort_by_parameter_order faz o SQLAlchemy devolver os
+    # ids na ordem de rows (a correspondência não depende de rowids crescentes).
+    transaction_ids = db.session.execute(
+        insert(Transaction.__table__).returning(Transaction.__table__.c.id, sort_by_parameter_order=True),
+        rows
+    ).scalars().all()
+
+    installments = []
+    pairs = set()
+    for row, transaction_id in zip(rows, transaction_ids):
+        row['id'] = transaction_id
+        for inst in plan_installments(cards[row['card_id']], row['date'], row['amount'], row['installments_total']):
+            inst['transaction_id'] = transaction_id
+            inst['statement_period'] = period_key(inst['statement_year'], inst['statement_month'])
+            installments.append(inst)
+            pairs.add((row['card_id'], inst['statement_year'], inst['statement_month']))
+
+    db.session.execute(insert(Installment.__table__), installments)
+
+    # INSERT em lote não passa pelos eventos do ORM: rollup mensal e faturas aqui
+    apply_transaction_rows(rows, installments)
+    sync_invoices(pairs)
+
+    return {
+        'created': len(transaction_ids),
+        'installments': len(installments),
+        'transaction_ids': list(transaction_ids),
+        'errors': errors,
+    }
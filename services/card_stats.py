@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from sqlalchemy import case, func, or_
+
+from database import db
+from models import Installment, Transaction, period_key
+
+
+def _empty_stats() -> dict:
+    return {'total_used': 0.0, 'current_bill': 0.0, 'current_bill_total': 0.0}
+
+
+def compute_card_stats(card_ids=None, month: int | None = None, year: int | None = None) -> dict[int, dict]:
+    """Calcula, em uma única consulta agrupada por cartão, os valores usados em CreditCard.to_dict.
+
+    Para cada cartão:
+    - total_used: soma das parcelas não pagas (mesma regra de get_total_used)
+    - current_bill: em aberto na fatura do mês (get_current_bill_amount)
+    - current_bill_total: total da fatura do mês, mesmo se pago (get_bill_for_month)
+
+    month/year default: mês atual. card_ids=None calcula para todos os cartões.
+    Cartões sem parcelas aparecem com zeros.
+    """
+    if month is None or year is None:
+        today = datetime.now()
+        month, year = today.month, today.year
+
+    in_statement = Installment.statement_period == period_key(year, month)
+    unpaid = Installment.paid == False
+
+    query = db.session.query(
+        Transaction.card_id,
+        func.sum(case((unpaid, Installment.amount), else_=0.0)),
+        func.sum(case((in_statement & unpaid, Installment.amount), else_=0.0)),
+        func.sum(case((in_statement, Installment.amount), else_=0.0)),
+    ).join(Transaction, Installment.transaction_id == Transaction.id).filter(
+        or_(unpaid, in_statement)
+    )
+
+    if card_ids is not None:
+        card_ids = list(card_ids)
+        if not card_ids:
+            return {}
+        query = query.filter(Transaction.card_id.in_(card_ids))
+
+    stats = {card_id: _empty_stats() for card_id in (card_ids or [])}
+    for card_id, total_used, current_bill, current_bill_total in query.group_by(Transaction.card_id).all():
+        stats[card_id] = {
+            'total_used': float(total_used or 0.0),
+            'current_bill': float(current_bill or 0.0),
+            'current_bill_total': float(current_bill_total or 0.0),
+        }
+
+    return stats
+
+
+def get_card_stats(stats: dict[int, dict], card_id: int) -> dict:
+    """Busca as estatísticas de um cartão no mapa (zeros se o cartão não tiver parcelas)."""
+    return stats.get(card_id) or _empty_stats()
+
+
+def compute_statement_totals(period_from: int, period_to: int, card_ids=None) -> dict[int, float]:
+    """Total das faturas (todas as parcelas, pagas ou não) por período, em uma consulta agrupada.
+
+    Mesma regra de get_bill_for_month, somada entre os cartões informados
+    (card_ids=None: todos). Retorna {period: total}; períodos sem parcelas não aparecem.
+    """
+    query = db.session.query(
+        Installment.statement_period,
+        func.sum(Installment.amount)
+    ).join(Transaction, Installment.transaction_id == Transaction.id).filter(
+        Installment.statement_period.between(period_from, period_to)
+    )
+
+    if card_ids is not None:
+        card_ids = list(card_ids)
+        if not card_ids:
+            return {}
+        query = query.filter(Transaction.card_id.in_(card_ids))
+
+    return {
+        period: float(total or 0.0)
+        for period, total in query.group_by(Installment.statement_period).all()
+    }
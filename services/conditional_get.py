@@ -0,0 +1,77 @@
+"""GET condicional (ETag / 304) para as APIs JSON dos blueprints.
+
+O ETag de uma requisição GET em /<área>/api/... é derivado de:
+- endpoint + query string;
+- sessão (mês/ano em visualização);
+- data de hoje (respostas dependem do mês atual, vencidos etc.);
+- versão dos dados do grupo de tabelas da área (services/data_version.py);
+- id do processo (as versões recomeçam a cada inicialização).
+
+Se o If-None-Match bater, responde 304 antes de executar a view (nenhuma
+consulta). Caso contrário a view roda e a resposta 200 leva o ETag com
+Cache-Control: no-cache, para o navegador sempre revalidar.
+"""
+import hashlib
+import json
+import uuid
+from datetime import date
+
+from flask import current_app, g, request, session
+
+from services.data_version import group_version
+
+
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def no_etag(view):
+    """Decorator: exclui a view do GET condicional (respostas que mudam sem escrita no banco)."""
+    view.no_etag = True
+    return view
+
+
+def _request_etag() -> str | None:
+    if request.method != 'GET' or '/api/' not in request.path or not request.endpoint:
+        return None
+
+    view = current_app.view_functions.get(request.endpoint)
+    if view is None or getattr(view, 'no_etag', False):
+        return None
+
+    raw = json.dumps([
+        _BOOT_ID,
+        request.endpoint,
+        sorted(request.args.items(multi=True)),
+        sorted((key, str(value)) for key, value in session.items()),
+        date.today().isoformat(),
+        group_version(request.blueprint),
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def _before_request():
+    etag = _request_etag()
+    if etag is None:
+        return None
+
+    # Versão lida antes da view: os dados da resposta são no mínimo tão novos quanto ela
+    g.etag = etag
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+
+def _after_request(response):
+    etag = g.pop('etag', None)
+    if etag and response.status_code == 200 and response.mimetype == 'application/json':
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def init_conditional_get(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,98 @@
+"""Versão dos dados em memória, incrementada a cada commit que altera tabelas.
+
+Os hooks de sessão anotam quais tabelas foram escritas na transação
+(flush do ORM ou INSERT/UPDATE/DELETE via session.execute) e, no after_commit,
+incrementam a versão global e registram em qual versão cada tabela mudou.
+Caches usam table_version(...) na chave: qualquer commit relevante muda a chave.
+
+Escritas feitas direto numa conexão fora da sessão não são vistas; chame
+mark_tables_changed() nesses casos.
+"""
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+_TOUCHED_KEY = 'data_version_tables'
+
+# Grupos de tabelas por área (nome do blueprint): a versão de um grupo só muda
+# quando alguma das tabelas lidas por aquela área muda.
+TABLE_GROUPS = {
+    'cards': ('credit_cards', 'transactions', 'installments', 'invoices'),
+    'bills': ('bills',),
+    'accounts': ('accounts',),
+    'dashboard': ('credit_cards', 'transactions', 'installments', 'invoices', 'bills', 'accounts'),
+    'invoices': ('credit_cards', 'transactions', 'installments', 'invoices', 'bills', 'accounts'),
+    'notifications': ('notifications',),
+    'calendar': ('invoices', 'bills', 'accounts', 'installments', 'transactions', 'credit_cards'),
+}
+
+_lock = threading.Lock()
+_version = 0
+_table_versions: dict[str, int] = {}
+
+
+def data_version() -> int:
+    """Versão global (muda a cada commit que escreveu em qualquer tabela)."""
+    return _version
+
+
+def table_version(*tables: str) -> int:
+    """Última versão em que alguma das tabelas informadas mudou (0 = nunca desde o início)."""
+    return max((_table_versions.get(table, 0) for table in tables), default=0)
+
+
+def group_version(group: str | None) -> int:
+    """Versão de um grupo de TABLE_GROUPS (grupo desconhecido = versão global)."""
+    tables = TABLE_GROUPS.get(group)
+    if not tables:
+        return data_version()
+    return table_version(*tables)
+
+
+def bump(tables) -> int:
+    """Incrementa a versão global marcando as tabelas informadas como alteradas."""
+    global _version
+    with _lock:
+        _version += 1
+        for table in tables:
+            _table_versions[table] = _version
+        return _version
+
+
+def mark_tables_changed(session, *tables: str):
+    """Marca tabelas escritas fora do ORM; a versão muda no commit da sessão."""
+    session.info.setdefault(_TOUCHED_KEY, set()).update(tables)
+
+
+def _after_flush(session, flush_context):
+    touched = session.info.setdefault(_TOUCHED_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            touched.add(table)
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None:
+        mark_tables_changed(orm_execute_state.session, table.name)
+
+
+def _after_commit(session):
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if touched:
+        bump(touched)
+
+
+def _after_rollback(session):
+    session.info.pop(_TOUCHED_KEY, None)
+
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'do_orm_execute', _do_orm_execute)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_rollback', _after_rollback)
@@ -0,0 +1,105 @@
+"""Exportação em streaming (CSV/JSONL) de lançamentos, boletos, compras e parcelas.
+
+As linhas saem de um SELECT só de colunas com yield_per (cursor lido em lotes,
+sem montar objetos ORM nem a lista inteira em memória) e são formatadas uma a
+uma por geradores; a resposta começa a ser enviada logo na primeira linha.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from database import db
+from models import Account, Bill, Installment, Transaction
+
+
+# entidade -> (tabela, coluna de data usada no filtro de período, coluna de cartão)
+EXPORTS = {
+    'accounts': (Account.__table__, Account.__table__.c.date, None),
+    'bills': (Bill.__table__, Bill.__table__.c.due_date, None),
+    'transactions': (Transaction.__table__, Transaction.__table__.c.date, Transaction.__table__.c.card_id),
+    'installments': (Installment.__table__, Installment.__table__.c.due_date, Transaction.__table__.c.card_id),
+}
+
+FORMATS = ('csv', 'jsonl')
+
+YIELD_PER = 1000
+
+
+def export_columns(entity: str) -> list[str]:
+    table, _, _ = EXPORTS[entity]
+    columns = [column.name for column in table.columns]
+    if entity == 'installments':
+        # Parcelas não têm cartão: vem da compra
+        columns.append('card_id')
+    return columns
+
+
+def iter_export_rows(entity: str, start: datetime | None = None, end: datetime | None = None,
+                     card_id: int | None = None):
+    """Gera as linhas (tuplas na ordem de export_columns) da entidade, por data e id.
+
+    start/end filtram a coluna de data da entidade (end exclusivo); card_id só
+    vale para transactions/installments.
+    """
+    table, date_column, card_column = EXPORTS[entity]
+
+    query = select(*table.columns)
+    if entity == 'installments':
+        query = query.add_columns(Transaction.__table__.c.card_id).join(
+            Transaction.__table__, Transaction.__table__.c.id == table.c.transaction_id
+        )
+
+    if start is not None:
+        query = query.where(date_column >= start)
+    if end is not None:
+        query = query.where(date_column < end)
+    if card_id is not None:
+        if card_column is None:
+            raise ValueError(f'card_id não se aplica a {entity}')
+        query = query.where(card_column == card_id)
+
+    query = query.order_by(date_column, table.c.id).execution_options(yield_per=YIELD_PER)
+
+    for row in db.session.execute(query):
+        yield tuple(row)
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(columns: list[str], rows, flush_bytes: int = 64 * 1024):
+    """Gera o CSV em pedaços: cabeçalho na hora e depois blocos de ~flush_bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+
+    for row in rows:
+        writer.writerow([_format_value(value) for value in row])
+        if buffer.tell() >= flush_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_jsonl(columns: list[str], rows):
+    """Gera um objeto JSON por linha (JSON Lines)."""
+    for row in rows:
+        yield json.dumps(
+            {column: _format_value(value) for column, value in zip(columns, row)},
+            ensure_ascii=False
+        ) + '\n'
@@ -0,0 +1,265 @@
+"""Faturas (Invoice) mantidas por eventos de flush.
+
+Invoice.amount é o total das parcelas do cartão naquele statement (mesma regra
+de CreditCard.get_bill_for_month). Sempre que parcelas são inseridas, removidas
+ou movidas de statement (ex.: antecipação), os hooks de sessão abaixo:
+
+1. before_flush: anotam os pares (cartão, statement) afetados, com os valores
+   antigos e novos de cada parcela;
+2. after_flush: recalculam esses pares em lote na mesma conexão do flush
+   (cria a fatura se o total ficou > 0, atualiza amount se mudou).
+
+Assim as leituras só consultam as faturas gravadas: não recalculam nem fazem commit.
+Escritas que não passam pelo ORM chamam sync_invoices() explicitamente.
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, event, inspect, insert, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import db
+from models import Installment, Invoice, period_key
+from services import statement_calendar
+from services.balance import invalidate_balance_snapshots
+from services.data_version import mark_tables_changed
+
+
+# Colunas da parcela que mudam o total de alguma fatura
+_TRACKED = ('transaction_id', 'statement_year', 'statement_month', 'amount')
+
+_PENDING_KEY = 'invoice_sync_pairs'
+
+
+def _in_list(prefix: str, values) -> tuple[str, dict]:
+    values = sorted(values)
+    params = {f'{prefix}{i}': value for i, value in enumerate(values)}
+    return ', '.join(f':{name}' for name in params), params
+
+
+def _sync(session, keys) -> int:
+    """Recalcula as faturas dos pares (card_id, period) (None = todas) na conexão da sessão.
+
+    Uma consulta agrupada para os totais, uma para as faturas existentes e uma
+    para os cartões das faturas novas. Não faz commit.
+    """
+    connection = session.connection()
+
+    totals_sql = (
+        "SELECT t.card_id, i.statement_period, SUM(i.amount) "
+        "FROM installments i JOIN transactions t ON t.id = i.transaction_id "
+        "WHERE i.statement_period IS NOT NULL"
+    )
+    invoices_sql = "SELECT id, card_id, year * 100 + month, amount FROM invoices WHERE 1 = 1"
+    params = {}
+
+    if keys is not None:
+        keys = {(int(card_id), int(period)) for card_id, period in keys}
+        if not keys:
+            return 0
+
+        cards_in, cards_params = _in_list('c', {card_id for card_id, _ in keys})
+        periods_in, periods_params = _in_list('p', {period for _, period in keys})
+        params = {**cards_params, **periods_params}
+        totals_sql += f" AND t.card_id IN ({cards_in}) AND i.statement_period IN ({periods_in})"
+        invoices_sql += f" AND card_id IN ({cards_in}) AND year * 100 + month IN ({periods_in})"
+
+    totals = {
+        (card_id, period): float(total or 0.0)
+        for card_id, period, total in connection.execute(
+            text(totals_sql + " GROUP BY t.card_id, i.statement_period"), params
+        )
+    }
+    existing = {
+        (card_id, period): (invoice_id, amount)
+        for invoice_id, card_id, period, amount in connection.execute(text(invoices_sql), params)
+    }
+
+    # Com pares informados, os IN acima podem trazer combinações extras: só os pedidos contam
+    if keys is None:
+        keys = set(totals) | set(existing)
+
+    updates = []
+    new_keys = []
+    changed_periods = []
+    for key in sorted(keys):
+        amount = totals.get(key, 0.0)
+        if key in existing:
+            invoice_id, current = existing[key]
+            if current != amount:
+                updates.append({'invoice_id': invoice_id, 'amount': amount})
+                changed_periods.append(key[1])
+        elif amount > 0:
+            new_keys.append(key)
+
+    if updates:
+        connection.execute(
+            update(Invoice.__table__).where(Invoice.__table__.c.id == bindparam('invoice_id')),
+            updates
+        )
+        # Faturas já carregadas na sessão passam a refletir o valor gravado
+        amounts = {row['invoice_id']: row['amount'] for row in updates}
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, Invoice) and obj.id in amounts:
+                set_committed_value(obj, 'amount', amounts[obj.id])
+
+    if new_keys:
+        cards_in, cards_params = _in_list('c', {card_id for card_id, _ in new_keys})
+        cards = {
+            row.id: row
+            for row in connection.execute(
+                text(f"SELECT id, closing_day, due_day FROM credit_cards WHERE id IN ({cards_in})"), cards_params
+            )
+        }
+        now = datetime.utcnow()
+        rows = []
+        for card_id, period in new_keys:
+            card = cards.get(card_id)
+            if not card:
+                continue
+            year, month = divmod(period, 100)
+            rows.append({
+                'card_id': card_id,
+                'month': month,
+                'year': year,
+                'amount': totals[(card_id, period)],
+                'due_date': statement_calendar.due_date(card, month, year),
+                'status': 'open',
+                'created_at': now,
+            })
+        if rows:
+            connection.execute(insert(Invoice.__table__), rows)
+            changed_periods += [period_key(row['year'], row['month']) for row in rows]
+
+    # Escrita direta não passa pelos eventos de Invoice: invalidar os saldos aqui
+    if changed_periods:
+        invalidate_balance_snapshots(connection, min(changed_periods))
+        mark_tables_changed(session, 'invoices')
+
+    return len(changed_periods)
+
+
+def sync_invoices(pairs=None) -> int:
+    """Cria/atualiza as faturas dos pares (card_id, year, month) informados (None = todas).
+
+    - Sem fatura e total > 0: cria a fatura (status 'open').
+    - Fatura existente com valor diferente: atualiza amount.
+
+    Para escritas fora do ORM (INSERT em lote etc.); alterações via ORM já são
+    cobertas pelos hooks de flush. Não faz commit. Retorna quantas faturas mudaram.
+    """
+    db.session.flush()
+    keys = None
+    if pairs is not None:
+        keys = {(card_id, period_key(year, month)) for card_id, year, month in pairs}
+    return _sync(db.session, keys)
+
+
+# ---------------------------------------------------------------------------
+# Hooks de sessão
+# ---------------------------------------------------------------------------
+
+def _statement_period(values: dict):
+    if not values['statement_year'] or not values['statement_month']:
+        return None
+    return period_key(values['statement_year'], values['statement_month'])
+
+
+def _previous_values(inst) -> dict | None:
+    """Valores antes do flush. None se algum valor antigo alterado for desconhecido."""
+    state = inspect(inst)
+    values = {}
+    for col in _TRACKED:
+        hist = state.attrs[col].history
+        if hist.deleted:
+            values[col] = hist.deleted[0]
+        elif hist.added:
+            return None
+        else:
+            values[col] = getattr(inst, col)
+    return values
+
+
+def _card_of(session, inst, transaction_id, card_cache: dict):
+    """card_id da parcela: pela transação já carregada ou por consulta (antes do flush a linha existe)."""
+    transaction = inst.__dict__.get('transaction')
+    if transaction is not None and transaction.id == transaction_id:
+        return transaction.card_id
+    if transaction_id is None:
+        return transaction.card_id if transaction is not None else None
+
+    if transaction_id not in card_cache:
+        card_cache[transaction_id] = session.connection().execute(
+            text("SELECT card_id FROM transactions WHERE id = :id"), {'id': transaction_id}
+        ).scalar()
+    return card_cache[transaction_id]
+
+
+def _before_flush(session, flush_context, instances):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    if pending is None:
+        # Já marcado para recalcular tudo
+        return
+    card_cache = {}
+
+    def _add(inst, values):
+        period = _statement_period(values)
+        if period is None:
+            return
+        card_id = _card_of(session, inst, values['transaction_id'], card_cache)
+        if card_id is not None:
+            pending.add((card_id, period))
+
+    for inst in session.new:
+        if isinstance(inst, Installment):
+            _add(inst, {col: getattr(inst, col) for col in _TRACKED})
+
+    for inst in session.deleted:
+        if isinstance(inst, Installment):
+            _add(inst, _previous_values(inst) or {col: getattr(inst, col) for col in _TRACKED})
+
+    for inst in session.dirty:
+        if not isinstance(inst, Installment):
+            continue
+        state = inspect(inst)
+        if not any(state.attrs[col].history.has_changes() for col in _TRACKED):
+            continue
+
+        previous = _previous_values(inst)
+        if previous is None:
+            # Sem o valor antigo não dá para saber a fatura de origem: recalcula tudo
+            session.info[_PENDING_KEY] = None
+            return
+        _add(inst, previous)
+        _add(inst, {col: getattr(inst, col) for col in _TRACKED})
+
+
+def _after_flush(session, flush_context):
+    if _PENDING_KEY not in session.info:
+        return
+
+    keys = session.info.pop(_PENDING_KEY)
+    if keys is None or keys:
+        _sync(session, keys)
+
+
+def _discard_pending(session, *args):
+    session.info.pop(_PENDING_KEY, None)
+
+
+event.listen(Session, 'before_flush', _before_flush)
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'after_rollback', _discard_pending)
+
+
+def init_invoices(app):
+    """Na inicialização: cria/atualiza faturas que ficaram para trás (antes eram criadas nas leituras)."""
+    with app.app_context():
+        try:
+            changed = sync_invoices()
+            if changed:
+                db.session.commit()
+                print(f"🛠️ Auto-migração: {changed} faturas criadas/atualizadas")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Falha ao sincronizar faturas: {e}")
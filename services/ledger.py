@@ -0,0 +1,383 @@
+"""Rollup mensal (monthly_ledger) mantido de forma incremental.
+
+Cada linha de accounts/transactions/installments contribui (amount, 1) para uma
+chave (period, type, category, card_id, consolidated). Os eventos de mapper
+(after_insert/after_update/after_delete) aplicam a diferença via UPSERT na
+mesma conexão do flush, então o rollup é gravado/revertido junto com a transação.
+
+Escritas que não passam pelo ORM (INSERT em lote da recorrência, importação de
+compras) chamam apply_account_rows()/apply_transaction_rows() ou
+rebuild_monthly_ledger(periods) explicitamente.
+Toda alteração do rollup também invalida os snapshots de saldo (services/balance.py).
+"""
+from sqlalchemy import event, func, inspect, text
+
+from database import db
+from models import Account, Transaction, Installment, MonthlyLedger, period_key
+from services.balance import invalidate_balance_snapshots
+
+
+_UPSERT_SQL = text(
+    "INSERT INTO monthly_ledger (period, type, category, card_id, consolidated, amount, count) "
+    "VALUES (:period, :type, :category, :card_id, :consolidated, :amount, :count) "
+    "ON CONFLICT(period, type, category, card_id, consolidated) DO UPDATE SET "
+    "amount = amount + excluded.amount, count = count + excluded.count"
+)
+
+_PERIOD_OF_DATE_SQL = "CAST(strftime('%Y', {col}) AS INTEGER) * 100 + CAST(strftime('%m', {col}) AS INTEGER)"
+
+# Agregações "de verdade" (a partir das tabelas de origem), usadas no rebuild e na checagem.
+_SOURCE_SQL = (
+    "SELECT period, type, COALESCE(category, ''), 0, COALESCE(consolidated, 0), SUM(amount), COUNT(*) "
+    "FROM accounts WHERE period IS NOT NULL {where_accounts} "
+    "GROUP BY 1, 2, 3, 4, 5 "
+    "UNION ALL "
+    "SELECT " + _PERIOD_OF_DATE_SQL.format(col='date') + ", 'card', COALESCE(category, ''), card_id, 0, "
+    "SUM(amount), COUNT(*) "
+    "FROM transactions WHERE date IS NOT NULL {where_transactions} "
+    "GROUP BY 1, 2, 3, 4, 5 "
+    "UNION ALL "
+    "SELECT i.statement_period, 'installment', COALESCE(t.category, ''), t.card_id, COALESCE(i.paid, 0), "
+    "SUM(i.amount), COUNT(*) "
+    "FROM installments i JOIN transactions t ON t.id = i.transaction_id "
+    "WHERE i.statement_period IS NOT NULL {where_installments} "
+    "GROUP BY 1, 2, 3, 4, 5"
+)
+
+# Colunas que alteram a contribuição de cada model
+_TRACKED = {
+    Account: ('date', 'type', 'category', 'consolidated', 'amount'),
+    Transaction: ('date', 'category', 'card_id', 'amount'),
+    Installment: ('statement_year', 'statement_month', 'paid', 'amount', 'transaction_id'),
+}
+
+
+def _key(period, type_, category, card_id, consolidated):
+    return (int(period), type_, category or '', int(card_id or 0), bool(consolidated))
+
+
+def _account_entry(values: dict, connection):
+    date = values['date']
+    if not date or values['amount'] is None:
+        return None
+    return _key(period_key(date.year, date.month), values['type'], values['category'], 0,
+                values['consolidated']), float(values['amount'])
+
+
+def _transaction_entry(values: dict, connection):
+    date = values['date']
+    if not date or values['amount'] is None:
+        return None
+    return _key(period_key(date.year, date.month), 'card', values['category'], values['card_id'],
+                False), float(values['amount'])
+
+
+def _installment_entry(values: dict, connection):
+    if not values['statement_year'] or not values['statement_month'] or values['amount'] is None:
+        return None
+
+    # Categoria/cartão vêm da transação (consulta na conexão do flush; sem lazy load)
+    row = connection.execute(
+        text("SELECT card_id, category FROM transactions WHERE id = :id"),
+        {'id': values['transaction_id']}
+    ).fetchone()
+    if not row:
+        return None
+
+    card_id, category = row
+    return _key(period_key(values['statement_year'], values['statement_month']), 'installment',
+                category, card_id, values['paid']), float(values['amount'])
+
+
+_ENTRY = {
+    Account: _account_entry,
+    Transaction: _transaction_entry,
+    Installment: _installment_entry,
+}
+
+
+def _apply(connection, deltas: dict):
+    params = []
+    for (period, type_, category, card_id, consolidated), (amount, count) in deltas.items():
+        if not count and not amount:
+            continue
+        params.append({
+            'period': period, 'type': type_, 'category': category, 'card_id': card_id,
+            'consolidated': consolidated, 'amount': amount, 'count': count,
+        })
+    if params:
+        connection.execute(_UPSERT_SQL, params)
+        # Saldos de fechamento a partir do mês mais antigo alterado ficam inválidos
+        invalidate_balance_snapshots(connection, min(p['period'] for p in params))
+
+
+def _add(deltas: dict, entry, sign: int):
+    if entry is None:
+        return
+    key, amount = entry
+    cur_amount, cur_count = deltas.get(key, (0.0, 0))
+    deltas[key] = (cur_amount + sign * amount, cur_count + sign)
+
+
+def _current_values(target, columns) -> dict:
+    return {col: getattr(target, col) for col in columns}
+
+
+def _previous_values(target, columns) -> dict:
+    """Valores antes do flush (histórico de atributos).
+
+    As colunas rastreadas usam active_history (ver _load_old_values): ao alterar
+    um atributo expirado o valor antigo é carregado antes da troca, então um
+    added sem deleted significa que o valor antigo era NULL.
+    """
+    state = inspect(target)
+    values = {}
+    for col in columns:
+        hist = state.attrs[col].history
+        if hist.deleted:
+            values[col] = hist.deleted[0]
+        elif hist.added:
+            values[col] = None
+        else:
+            values[col] = getattr(target, col)
+    return values
+
+
+def _transaction_installment_deltas(connection, transaction_id, previous: dict, current: dict) -> dict:
+    """Parcelas da compra mudam de chave quando categoria/cartão da compra mudam.
+
+    Lê as parcelas gravadas (estado antes das alterações de parcelas deste mesmo
+    flush, que rodam depois e já enxergam a compra nova) e as move da chave
+    antiga para a nova.
+    """
+    deltas = {}
+    rows = connection.execute(
+        text(
+            "SELECT statement_period, COALESCE(paid, 0), SUM(amount), COUNT(*) FROM installments "
+            "WHERE transaction_id = :id AND statement_period IS NOT NULL AND amount IS NOT NULL "
+            "GROUP BY 1, 2"
+        ),
+        {'id': transaction_id}
+    ).fetchall()
+    for period, paid, amount, count in rows:
+        old_key = _key(period, 'installment', previous['category'], previous['card_id'], paid)
+        new_key = _key(period, 'installment', current['category'], current['card_id'], paid)
+        for key, sign in ((old_key, -1), (new_key, +1)):
+            cur_amount, cur_count = deltas.get(key, (0.0, 0))
+            deltas[key] = (cur_amount + sign * float(amount or 0.0), cur_count + sign * int(count))
+    return deltas
+
+
+def _after_insert(mapper, connection, target):
+    model = mapper.class_
+    deltas = {}
+    _add(deltas, _ENTRY[model](_current_values(target, _TRACKED[model]), connection), +1)
+    _apply(connection, deltas)
+
+
+def _after_delete(mapper, connection, target):
+    model = mapper.class_
+    deltas = {}
+    _add(deltas, _ENTRY[model](_previous_values(target, _TRACKED[model]), connection), -1)
+    _apply(connection, deltas)
+
+
+def _after_update(mapper, connection, target):
+    model = mapper.class_
+    columns = _TRACKED[model]
+    state = inspect(target)
+    if not any(state.attrs[col].history.has_changes() for col in columns):
+        return
+
+    previous = _previous_values(target, columns)
+    current = _current_values(target, columns)
+
+    deltas = {}
+    if model is Transaction and (previous['category'], previous['card_id']) != (current['category'], current['card_id']):
+        # Parcelas herdam categoria/cartão da compra (a data da compra não entra na chave delas)
+        deltas = _transaction_installment_deltas(connection, target.id, previous, current)
+    _add(deltas, _ENTRY[model](previous, connection), -1)
+    _add(deltas, _ENTRY[model](current, connection), +1)
+    _apply(connection, deltas)
+
+
+def _load_old_values(target, value, oldvalue, initiator):
+    """Só existe para ligar active_history nas colunas rastreadas."""
+
+
+for _model in (Account, Transaction, Installment):
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_update', _after_update)
+    event.listen(_model, 'after_delete', _after_delete)
+    # Carrega o valor antigo ao alterar atributo expirado: a diferença fica sempre incremental
+    for _column in _TRACKED[_model]:
+        event.listen(getattr(_model, _column), 'set', _load_old_values, active_history=True)
+
+
+def apply_account_rows(rows: list[dict]):
+    """Soma ao rollup lançamentos inseridos fora do ORM (ex.: INSERT em lote da recorrência).
+
+    Deve ser chamada na mesma transação do INSERT (antes do commit).
+    """
+    deltas = {}
+    for row in rows:
+        _add(deltas, _account_entry({
+            'date': row['date'],
+            'type': row['type'],
+            'category': row.get('category'),
+            'consolidated': row.get('consolidated', False),
+            'amount': row['amount'],
+        }, None), +1)
+    _apply(db.session.connection(), deltas)
+
+
+def apply_transaction_rows(transactions: list[dict], installments: list[dict]):
+    """Soma ao rollup compras e parcelas inseridas fora do ORM (importação em lote).
+
+    transactions precisam de id (para as parcelas acharem cartão/categoria sem
+    consultar o banco). Deve ser chamada na mesma transação do INSERT.
+    """
+    deltas = {}
+    by_id = {}
+    for row in transactions:
+        by_id[row['id']] = row
+        _add(deltas, _transaction_entry({
+            'date': row['date'],
+            'category': row.get('category'),
+            'card_id': row['card_id'],
+            'amount': row['amount'],
+        }, None), +1)
+
+    for row in installments:
+        tx = by_id[row['transaction_id']]
+        if not row['statement_year'] or not row['statement_month'] or row['amount'] is None:
+            continue
+        _add(deltas, (_key(period_key(row['statement_year'], row['statement_month']), 'installment',
+                           tx.get('category'), tx['card_id'], row.get('paid', False)),
+                      float(row['amount'])), +1)
+
+    _apply(db.session.connection(), deltas)
+
+
+def _source_sql(periods=None) -> tuple[str, dict]:
+    if not periods:
+        return _SOURCE_SQL.format(where_accounts='', where_transactions='', where_installments=''), {}
+
+    periods = sorted({int(p) for p in periods})
+    params = {f'p{i}': p for i, p in enumerate(periods)}
+    in_list = ', '.join(f':p{i}' for i in range(len(periods)))
+    return _SOURCE_SQL.format(
+        where_accounts=f"AND period IN ({in_list})",
+        where_transactions=f"AND {_PERIOD_OF_DATE_SQL.format(col='date')} IN ({in_list})",
+        where_installments=f"AND i.statement_period IN ({in_list})",
+    ), params
+
+
+def _rebuild(connection, periods=None) -> int:
+    sql, params = _source_sql(periods)
+    if periods:
+        in_list = ', '.join(f':p{i}' for i in range(len(params)))
+        connection.execute(text(f"DELETE FROM monthly_ledger WHERE period IN ({in_list})"), params)
+    else:
+        connection.execute(text("DELETE FROM monthly_ledger"))
+
+    invalidate_balance_snapshots(connection, min(params.values()) if periods else None)
+
+    result = connection.execute(text(
+        "INSERT INTO monthly_ledger (period, type, category, card_id, consolidated, amount, count) " + sql
+    ), params)
+    return result.rowcount or 0
+
+
+def rebuild_monthly_ledger(periods=None, commit: bool = True) -> int:
+    """Recalcula o rollup a partir das tabelas de origem (tudo ou só os períodos informados).
+
+    Retorna a quantidade de linhas gravadas.
+    """
+    rows = _rebuild(db.session.connection(), periods)
+    if commit:
+        db.session.commit()
+    return rows
+
+
+def check_monthly_ledger(tolerance: float = 0.005) -> list[dict]:
+    """Compara o rollup com as agregações das tabelas de origem.
+
+    Retorna a lista de divergências (vazia = consistente). Linhas do rollup com
+    count 0 e amount ~0 são equivalentes a ausentes.
+    """
+    sql, params = _source_sql()
+    expected = {}
+    for period, type_, category, card_id, consolidated, amount, count in db.session.execute(text(sql), params):
+        expected[_key(period, type_, category, card_id, consolidated)] = (float(amount or 0.0), int(count))
+
+    stored = {}
+    for row in MonthlyLedger.query.all():
+        stored[_key(row.period, row.type, row.category, row.card_id, row.consolidated)] = (
+            float(row.amount or 0.0), int(row.count or 0)
+        )
+
+    problems = []
+    for key in sorted(set(expected) | set(stored), key=lambda k: (k[0], k[1], k[2], k[3], k[4])):
+        exp_amount, exp_count = expected.get(key, (0.0, 0))
+        got_amount, got_count = stored.get(key, (0.0, 0))
+        if exp_count != got_count or abs(exp_amount - got_amount) > tolerance:
+            period, type_, category, card_id, consolidated = key
+            problems.append({
+                'period': period, 'type': type_, 'category': category, 'card_id': card_id,
+                'consolidated': consolidated,
+                'expected_amount': round(exp_amount, 2), 'ledger_amount': round(got_amount, 2),
+                'expected_count': exp_count, 'ledger_count': got_count,
+            })
+
+    return problems
+
+
+def _ledger_query(columns, types, period_from=None, period_to=None, card_id=None, consolidated=None):
+    query = db.session.query(*columns).filter(MonthlyLedger.type.in_(list(types)))
+    if period_from is not None:
+        query = query.filter(MonthlyLedger.period >= period_from)
+    if period_to is not None:
+        query = query.filter(MonthlyLedger.period <= period_to)
+    if card_id is not None:
+        query = query.filter(MonthlyLedger.card_id == card_id)
+    if consolidated is not None:
+        query = query.filter(MonthlyLedger.consolidated == consolidated)
+    return query
+
+
+def sum_ledger(types, period_from=None, period_to=None, card_id=None, consolidated=None) -> float:
+    """Soma do rollup para os tipos informados entre period_from e period_to (inclusive)."""
+    query = _ledger_query([func.sum(MonthlyLedger.amount)], types, period_from, period_to, card_id, consolidated)
+    return float(query.scalar() or 0.0)
+
+
+def sum_ledger_by(column, types, period_from=None, period_to=None, card_id=None, consolidated=None):
+    """Soma do rollup agrupada por uma ou mais colunas ('period', 'type', 'category', 'card_id').
+
+    column pode ser um nome ou uma tupla de nomes. Retorna lista de (valor, total)
+    ou, para tupla, (valor1, valor2, ..., total).
+    """
+    names = (column,) if isinstance(column, str) else tuple(column)
+    group_cols = [getattr(MonthlyLedger, name) for name in names]
+    query = _ledger_query([*group_cols, func.sum(MonthlyLedger.amount)], types, period_from, period_to,
+                          card_id, consolidated)
+    return [(*row[:-1], float(row[-1] or 0.0)) for row in query.group_by(*group_cols).all()]
+
+
+def init_ledger(app):
+    """Na inicialização: se o rollup estiver vazio e houver dados, reconstrói."""
+    with app.app_context():
+        try:
+            if MonthlyLedger.query.first() is not None:
+                return
+            has_data = (
+                db.session.query(Account.id).first() is not None
+                or db.session.query(Transaction.id).first() is not None
+            )
+            if has_data:
+                rows = rebuild_monthly_ledger()
+                print(f"🛠️ Auto-migração: monthly_ledger reconstruído ({rows} linhas)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Falha ao inicializar monthly_ledger: {e}")
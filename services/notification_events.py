@@ -0,0 +1,126 @@
+"""Pub/sub em memória para notificações (alimenta o SSE de routes/notifications.py).
+
+Hooks de sessão detectam commits que alteraram a tabela notifications (ORM ou
+INSERT/UPDATE/DELETE em lote via session.execute; INSERTs em lote informam as
+linhas novas com queue_new_notifications). No after_commit, a contagem de não
+lidas é recalculada uma única vez e publicada para todos os inscritos, junto
+com o payload das notificações novas.
+
+Só vale dentro do processo: cada processo do servidor tem seus próprios inscritos.
+"""
+import queue
+import threading
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from database import db
+from models import Notification
+
+
+_CHANGED_KEY = 'notifications_changed'
+_NEW_KEY = 'notifications_new'
+
+
+class NotificationBroker:
+    """Lista de filas (uma por conexão SSE). publish() nunca bloqueia quem faz o commit."""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: list[queue.Queue] = []
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_name: str, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event_name, data))
+            except queue.Full:
+                # Cliente lento/travado: descarta; a próxima contagem corrige o badge
+                pass
+
+
+notification_broker = NotificationBroker()
+
+
+def unread_count() -> int:
+    return db.session.query(func.count(Notification.id)).filter(Notification.read == False).scalar() or 0
+
+
+def _mark_changed(session):
+    session.info[_CHANGED_KEY] = True
+
+
+def queue_new_notifications(session, notifications):
+    """Agenda a publicação de notificações inseridas fora do flush (INSERT em lote)."""
+    if not notifications:
+        return
+    _mark_changed(session)
+    session.info.setdefault(_NEW_KEY, []).extend(n.to_dict() for n in notifications)
+
+
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Notification):
+            _mark_changed(session)
+            if obj in session.new:
+                # Serializa já (no after_commit os objetos estão expirados)
+                session.info.setdefault(_NEW_KEY, []).append(obj.to_dict())
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None and table.name == Notification.__tablename__:
+        _mark_changed(orm_execute_state.session)
+
+
+def _after_commit(session):
+    payloads = session.info.pop(_NEW_KEY, [])
+    if not session.info.pop(_CHANGED_KEY, False):
+        return
+    if not notification_broker.subscriber_count:
+        return
+
+    try:
+        # A sessão não pode emitir SQL no after_commit: usa uma conexão própria
+        with db.engine.connect() as connection:
+            count = connection.execute(
+                select(func.count(Notification.id)).where(Notification.read == False)
+            ).scalar() or 0
+    except Exception as e:
+        print(f"⚠️ Falha ao publicar notificações: {e}")
+        return
+
+    for payload in payloads:
+        notification_broker.publish('notification', payload)
+    notification_broker.publish('count', {'count': count})
+
+
+def _after_rollback(session):
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(_NEW_KEY, None)
+
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'do_orm_execute', _do_orm_execute)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_rollback', _after_rollback)
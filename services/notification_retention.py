@@ -0,0 +1,137 @@
+"""Retenção de notificações: move as lidas antigas para notifications_archive.
+
+Roda em lotes (INSERT ... SELECT + DELETE por ids, um commit por lote) para não
+segurar o banco por muito tempo; a tabela notifications fica só com o que é
+recente ou ainda não foi lido.
+"""
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, select
+
+from database import db
+from models import Notification, NotificationArchive
+
+
+_ARCHIVED_COLUMNS = (
+    'id', 'type', 'title', 'message', 'priority', 'read', 'link',
+    'reference_id', 'reference_type', 'period', 'created_at', 'read_at',
+)
+
+
+def archive_read_notifications(max_age_days: int, batch_size: int = 500, now: datetime | None = None) -> int:
+    """Arquiva notificações lidas com created_at anterior a now - max_age_days.
+
+    Cada lote: seleciona até batch_size ids (índice read, created_at), copia
+    para notifications_archive e apaga da tabela principal, com commit.
+    Retorna quantas foram arquivadas.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=max_age_days)
+    columns = [getattr(Notification, name) for name in _ARCHIVED_COLUMNS]
+
+    archived = 0
+    while True:
+        ids = db.session.scalars(
+            select(Notification.id).where(
+                Notification.read == True,
+                Notification.created_at < cutoff
+            ).order_by(Notification.created_at, Notification.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return archived
+
+        db.session.execute(
+            insert(NotificationArchive).from_select(
+                list(_ARCHIVED_COLUMNS) + ['archived_at'],
+                select(*columns, literal(now, NotificationArchive.archived_at.type)).where(Notification.id.in_(ids))
+            ).prefix_with('OR REPLACE')
+        )
+        db.session.execute(delete(Notification).where(Notification.id.in_(ids)))
+        db.session.commit()
+
+        archived += len(ids)
+        if len(ids) < batch_size:
+            return archived
+
+
+class NotificationRetentionJob:
+    """Thread em background que roda archive_read_notifications periodicamente.
+
+    Configuração (app.config):
+    - NOTIFICATION_RETENTION_ENABLED (default True; lido por start_background_jobs)
+    - NOTIFICATION_RETENTION_DAYS (idade mínima das lidas, default 90)
+    - NOTIFICATION_RETENTION_BATCH (linhas por lote, default 500)
+    - NOTIFICATION_RETENTION_INTERVAL (segundos, default 86400)
+
+    Mesmo padrão de recurrence_scheduler: instância global + init_app(app); a
+    thread só sobe em start_background_jobs.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_age_days = 90
+        self.batch_size = 500
+        self.interval_seconds = 86400
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.last_run_at = None
+        self.last_archived = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_age_days = int(app.config.get('NOTIFICATION_RETENTION_DAYS', 90))
+        self.batch_size = int(app.config.get('NOTIFICATION_RETENTION_BATCH', 500))
+        self.interval_seconds = float(app.config.get('NOTIFICATION_RETENTION_INTERVAL', 86400))
+
+        app.extensions['notification_retention'] = self
+
+    def run_once(self) -> int:
+        """Arquiva agora (na thread atual). Retorna quantas notificações moveu."""
+        with self._lock:
+            with self.app.app_context():
+                try:
+                    archived = archive_read_notifications(self.max_age_days, self.batch_size)
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+            self.last_run_at = datetime.now()
+            self.last_archived = archived
+
+        if archived:
+            print(f"🗄️ Notificações: {archived} lidas arquivadas (mais de {self.max_age_days} dias)")
+        return archived
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='notification-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Falha na retenção de notificações: {e}")
+                traceback.print_exc()
+
+            self._stop.wait(self.interval_seconds)
+
+
+notification_retention = NotificationRetentionJob()
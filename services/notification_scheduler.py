@@ -0,0 +1,343 @@
+"""Agendador de notificações por prazo (min-heap de horários de disparo).
+
+Em vez de varrer tudo periodicamente, mantém um heap com o próximo horário de
+cada alerta e dorme até o mais próximo:
+
+- fatura aberta: vencimento - INVOICE_DUE_DAYS
+- boleto não pago: vencimento - BILL_DUE_DAYS
+- limite do cartão: na hora em que o uso muda (e no início do mês seguinte,
+  enquanto o cartão continuar acima do limite de alerta)
+
+Os hooks de sessão anotam o que cada commit alterou (boletos, cartões,
+transações, parcelas, faturas) e o agendador recarrega só essas referências.
+No disparo, services/notifications insere com ON CONFLICT DO NOTHING, então
+disparos repetidos (ou vários processos) não duplicam notificações.
+"""
+import heapq
+import itertools
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db
+from models import Bill, CreditCard, Installment, Invoice, Transaction
+from services.notifications import (
+    BILL_DUE_DAYS, INVOICE_DUE_DAYS, collect_candidates, insert_notifications,
+)
+
+
+_CHANGES_KEY = 'notification_scheduler_changes'
+
+# Escritas em lote (session.execute) não dizem quais linhas mudaram: recarrega a categoria
+_BULK_TABLES = {
+    'bills': 'bills',
+    'credit_cards': 'cards',
+    'transactions': 'cards',
+    'installments': 'cards',
+    'invoices': 'cards',
+}
+
+
+class NotificationScheduler:
+    """Thread em background que dispara as notificações automáticas no horário.
+
+    Entradas do heap: (fire_at, seq, key), key = ('invoice'|'bill'|'limit', id).
+    _scheduled guarda o horário válido de cada key; entradas antigas no heap
+    (reagendadas/canceladas) são descartadas quando chegam ao topo.
+
+    Configuração (app.config):
+    - NOTIFICATION_SCHEDULER_ENABLED (default True; lido por start_background_jobs)
+
+    Mesmo padrão de recurrence_scheduler: instância global + init_app(app); a
+    thread só sobe em start_background_jobs.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+
+        self._heap = []
+        self._scheduled = {}
+        self._seq = itertools.count()
+
+        # Alterações anotadas pelos commits, aplicadas pela thread
+        self._changes = set()
+        self._reload = set()
+
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.last_fired_at = None
+        self.last_created = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['notification_scheduler'] = self
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self) -> int:
+        """Quantidade de alertas agendados."""
+        with self._cond:
+            return len(self._scheduled)
+
+    def next_fire_at(self) -> datetime | None:
+        with self._cond:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    # Heap ----------------------------------------------------------------
+
+    def _schedule(self, key, fire_at: datetime):
+        if self._scheduled.get(key) == fire_at:
+            return
+        self._scheduled[key] = fire_at
+        heapq.heappush(self._heap, (fire_at, next(self._seq), key))
+
+    def _cancel(self, key):
+        self._scheduled.pop(key, None)
+
+    def _discard_stale(self):
+        while self._heap and self._scheduled.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: datetime) -> list:
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, key = heapq.heappop(self._heap)
+            del self._scheduled[key]
+            due.append(key)
+
+    # Recarga incremental ---------------------------------------------------
+
+    def notify_changes(self, changes):
+        """Chamado no after_commit: anota o que mudou e acorda a thread."""
+        if not self.running:
+            return
+        with self._cond:
+            for change in changes:
+                if change in ('bills', 'cards'):
+                    self._reload.add(change)
+                else:
+                    self._changes.add(change)
+            self._cond.notify()
+
+    def _load(self, now: datetime, bill_ids=None, card_ids=None, tx_ids=None):
+        """Recarrega os horários de boletos/cartões (None = todos). Retorna as entradas a agendar/cancelar."""
+        schedule, cancel = [], []
+
+        if tx_ids:
+            card_ids = set(card_ids or ())
+            card_ids.update(card_id for (card_id,) in db.session.query(Transaction.card_id).filter(
+                Transaction.id.in_(tx_ids)
+            ).distinct())
+
+        if bill_ids is None or bill_ids:
+            query = db.session.query(Bill.id, Bill.due_date).filter(
+                Bill.paid == False,
+                Bill.due_date >= now
+            )
+            if bill_ids is not None:
+                query = query.filter(Bill.id.in_(bill_ids))
+            found = set()
+            for bill_id, due_date in query:
+                found.add(bill_id)
+                schedule.append((('bill', bill_id), max(now, due_date - timedelta(days=BILL_DUE_DAYS))))
+            if bill_ids is not None:
+                cancel += [('bill', bill_id) for bill_id in set(bill_ids) - found]
+
+        if card_ids is None or card_ids:
+            query = db.session.query(Invoice.id, Invoice.due_date).filter(
+                Invoice.status == 'open',
+                Invoice.due_date >= now
+            )
+            cards = db.session.query(CreditCard.id).filter(CreditCard.active == True)
+            if card_ids is not None:
+                query = query.filter(Invoice.card_id.in_(card_ids))
+                cards = cards.filter(CreditCard.id.in_(card_ids))
+            for invoice_id, due_date in query:
+                schedule.append((('invoice', invoice_id), max(now, due_date - timedelta(days=INVOICE_DUE_DAYS))))
+            # Uso do limite: reavalia já (uma consulta agrupada no disparo)
+            for (card_id,) in cards:
+                schedule.append((('limit', card_id), now))
+
+        return schedule, cancel
+
+    def _fire(self, now: datetime, keys) -> tuple[int, list]:
+        """Insere as notificações das keys vencidas. Retorna (criadas, reagendamentos)."""
+        ids = {'invoice': set(), 'bill': set(), 'limit': set()}
+        for kind, ref_id in keys:
+            ids[kind].add(ref_id)
+
+        candidates = collect_candidates(now, ids['invoice'], ids['bill'], ids['limit'])
+        created = insert_notifications(candidates)
+
+        # Cartão ainda acima do limite: novo alerta no período seguinte
+        next_month = datetime(now.year, now.month, 1) + relativedelta(months=1)
+        reschedule = [
+            (('limit', candidate['reference_id']), next_month)
+            for candidate in candidates if candidate['type'] == 'limit_alert'
+        ]
+        return len(created), reschedule
+
+    def run_pending(self, now: datetime | None = None, full: bool = False) -> int:
+        """Aplica as alterações anotadas e dispara o que venceu. Retorna quantas notificações criou."""
+        now = now or datetime.now()
+
+        with self._cond:
+            changes, self._changes = self._changes, set()
+            reload_, self._reload = self._reload, set()
+
+        with self.app.app_context():
+            try:
+                if full:
+                    loads = [self._load(now)]
+                else:
+                    loads = []
+                    if 'bills' in reload_:
+                        loads.append(self._load(now, card_ids=()))
+                    if 'cards' in reload_:
+                        loads.append(self._load(now, bill_ids=()))
+                    by_kind = {'bill': set(), 'card': set(), 'tx': set()}
+                    for kind, ref_id in changes:
+                        by_kind[kind].add(ref_id)
+                    if any(by_kind.values()):
+                        loads.append(self._load(now, by_kind['bill'], by_kind['card'], by_kind['tx']))
+
+                with self._cond:
+                    for schedule, cancel in loads:
+                        for key in cancel:
+                            self._cancel(key)
+                        for key, fire_at in schedule:
+                            self._schedule(key, fire_at)
+                    due = self._pop_due(now)
+
+                if not due:
+                    return 0
+
+                created, reschedule = self._fire(now, due)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+        with self._cond:
+            for key, fire_at in reschedule:
+                self._schedule(key, fire_at)
+
+        self.last_fired_at = now
+        self.last_created = created
+        if created:
+            print(f"🔔 Notificações: {created} criadas pelo agendador")
+        return created
+
+    # Thread ------------------------------------------------------------------
+
+    def start(self):
+        if self.running:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='notification-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _wait(self):
+        """Dorme até o próximo disparo ou até chegar alguma alteração."""
+        with self._cond:
+            while not self._stop.is_set() and not self._changes and not self._reload:
+                self._discard_stale()
+                if self._heap:
+                    timeout = (self._heap[0][0] - datetime.now()).total_seconds()
+                    if timeout <= 0:
+                        return
+                    self._cond.wait(timeout)
+                else:
+                    self._cond.wait()
+
+    def _loop(self):
+        full = True
+        while not self._stop.is_set():
+            try:
+                self.run_pending(full=full)
+                full = False
+            except Exception as e:
+                print(f"⚠️ Falha no agendador de notificações: {e}")
+                traceback.print_exc()
+                # Alertas retirados do heap podem ter se perdido: recarrega tudo.
+                # A espera evita laço apertado se o banco estiver indisponível.
+                full = True
+                self._stop.wait(30)
+                continue
+
+            self._wait()
+
+
+notification_scheduler = NotificationScheduler()
+
+
+def _changes(session) -> set:
+    return session.info.setdefault(_CHANGES_KEY, set())
+
+
+def _after_flush(session, flush_context):
+    changes = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Bill):
+            key = ('bill', obj.id)
+        elif isinstance(obj, CreditCard):
+            key = ('card', obj.id)
+        elif isinstance(obj, (Transaction, Invoice)):
+            key = ('card', obj.card_id)
+        elif isinstance(obj, Installment):
+            key = ('tx', obj.transaction_id)
+        else:
+            continue
+
+        if changes is None:
+            changes = _changes(session)
+        if key[1] is not None:
+            changes.add(key)
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None and table.name in _BULK_TABLES:
+        _changes(orm_execute_state.session).add(_BULK_TABLES[table.name])
+
+
+def _after_commit(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes:
+        notification_scheduler.notify_changes(changes)
+
+
+def _after_rollback(session):
+    session.info.pop(_CHANGES_KEY, None)
+
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'do_orm_execute', _do_orm_execute)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_rollback', _after_rollback)
@@ -0,0 +1,149 @@
+"""Geração automática de notificações (faturas e boletos vencendo, limite alto).
+
+Set-based: os candidatos saem de poucas consultas agregadas (faturas + nome do
+cartão, boletos, cartões ativos e uso de limite agrupado por cartão) e são
+gravados em um único INSERT ... ON CONFLICT DO NOTHING. A deduplicação fica com
+o índice único (type, reference_type, reference_id, period): cada referência
+gera no máximo uma notificação por período, independente de já ter sido lida.
+
+O número de consultas é constante, independente de quantos boletos/cartões existem.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.sqlite import insert
+
+from database import db
+from models import Bill, CreditCard, Invoice, Notification, period_key
+from services.card_stats import compute_card_stats
+from services.notification_events import queue_new_notifications
+
+
+INVOICE_DUE_DAYS = 5
+BILL_DUE_DAYS = 3
+LIMIT_ALERT_PERCENT = 80
+
+
+def _invoice_candidates(today: datetime, invoice_ids=None) -> list[dict]:
+    query = db.session.query(
+        Invoice.id, Invoice.due_date, Invoice.amount, Invoice.year, Invoice.month, CreditCard.name
+    ).join(CreditCard, Invoice.card_id == CreditCard.id).filter(
+        Invoice.status == 'open',
+        Invoice.due_date <= today + timedelta(days=INVOICE_DUE_DAYS),
+        Invoice.due_date >= today
+    )
+    if invoice_ids is not None:
+        query = query.filter(Invoice.id.in_(invoice_ids))
+    rows = query.order_by(Invoice.due_date, Invoice.id).all()
+
+    candidates = []
+    for invoice_id, due_date, amount, year, month, card_name in rows:
+        days_left = (due_date - today).days
+        candidates.append({
+            'type': 'invoice_due',
+            'title': f'Fatura vencendo em {days_left} dias',
+            'message': f'A fatura do cartão {card_name} vence em {due_date.strftime("%d/%m/%Y")}. Valor: R$ {amount:.2f}',
+            'priority': 'high' if days_left <= 2 else 'normal',
+            'link': '/invoices',
+            'reference_id': invoice_id,
+            'reference_type': 'invoice',
+            'period': period_key(year, month),
+        })
+    return candidates
+
+
+def _bill_candidates(today: datetime, bill_ids=None) -> list[dict]:
+    query = db.session.query(
+        Bill.id, Bill.description, Bill.due_date, Bill.amount
+    ).filter(
+        Bill.paid == False,
+        Bill.due_date <= today + timedelta(days=BILL_DUE_DAYS),
+        Bill.due_date >= today
+    )
+    if bill_ids is not None:
+        query = query.filter(Bill.id.in_(bill_ids))
+    rows = query.order_by(Bill.due_date, Bill.id).all()
+
+    candidates = []
+    for bill_id, description, due_date, amount in rows:
+        days_left = (due_date - today).days
+        candidates.append({
+            'type': 'bill_due',
+            'title': f'Boleto vencendo em {days_left} dias',
+            'message': f'{description} vence em {due_date.strftime("%d/%m/%Y")}. Valor: R$ {amount:.2f}',
+            'priority': 'urgent' if days_left == 0 else 'high',
+            'link': '/bills',
+            'reference_id': bill_id,
+            'reference_type': 'bill',
+            'period': period_key(due_date.year, due_date.month),
+        })
+    return candidates
+
+
+def _limit_candidates(today: datetime, card_ids=None) -> list[dict]:
+    query = db.session.query(CreditCard.id, CreditCard.name, CreditCard.limit_total).filter(
+        CreditCard.active == True
+    )
+    if card_ids is not None:
+        query = query.filter(CreditCard.id.in_(card_ids))
+    cards = query.order_by(CreditCard.id).all()
+    stats = compute_card_stats([card_id for card_id, _, _ in cards], today.month, today.year)
+
+    candidates = []
+    for card_id, name, limit_total in cards:
+        limit_total = limit_total or 0.0
+        used = stats.get(card_id, {}).get('total_used', 0.0)
+        usage_percent = (used / limit_total) * 100 if limit_total > 0 else 0
+
+        if usage_percent > LIMIT_ALERT_PERCENT:
+            candidates.append({
+                'type': 'limit_alert',
+                'title': 'Limite do cartão alto',
+                'message': f'Você está usando {usage_percent:.1f}% do limite do {name}. Disponível: R$ {limit_total - used:.2f}',
+                'priority': 'normal',
+                'link': '/cards',
+                'reference_id': card_id,
+                'reference_type': 'card',
+                'period': period_key(today.year, today.month),
+            })
+    return candidates
+
+
+def collect_candidates(today: datetime, invoice_ids=None, bill_ids=None, card_ids=None) -> list[dict]:
+    """Linhas de Notification que valem agora (sem checar se já existem).
+
+    *_ids=None considera todos; uma coleção restringe àquelas referências
+    (vazia = pula a categoria). Usado pelo agendador para disparar só o que venceu.
+    """
+    candidates = []
+    if invoice_ids is None or invoice_ids:
+        candidates += _invoice_candidates(today, invoice_ids)
+    if bill_ids is None or bill_ids:
+        candidates += _bill_candidates(today, bill_ids)
+    if card_ids is None or card_ids:
+        candidates += _limit_candidates(today, card_ids)
+    return candidates
+
+
+def insert_notifications(candidates: list[dict]) -> list[Notification]:
+    """INSERT ... ON CONFLICT DO NOTHING dos candidatos. Não faz commit.
+
+    Retorna apenas as notificações efetivamente inseridas (conflitos no índice
+    único são ignorados pelo banco).
+    """
+    if not candidates:
+        return []
+
+    # INSERT em lote via ORM: RETURNING devolve só as linhas inseridas
+    created = db.session.scalars(
+        insert(Notification).on_conflict_do_nothing().returning(Notification),
+        candidates
+    ).all()
+
+    # Bulk insert não passa pelo flush: publica o payload no SSE após o commit
+    queue_new_notifications(db.session, created)
+    return created
+
+
+def generate_due_notifications(now: datetime | None = None) -> list[Notification]:
+    """Cria as notificações automáticas que ainda não existem no período. Não faz commit."""
+    return insert_notifications(collect_candidates(now or datetime.now()))
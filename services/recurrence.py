@@ -1,10 +1,136 @@
 from datetime import datetime
 from calendar import monthrange
 
-from sqlalchemy import extract
+from dateutil.relativedelta import relativedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
 
 from database import db
-from models import Account
+from models import Account, RecurrenceWatermark, period_key
+from services.ledger import apply_account_rows, rebuild_monthly_ledger
+
+
+def virtual_mode_enabled() -> bool:
+    """Modo virtual: leituras calculam ocorrências recorrentes sem gravar filhos.
+
+    Controlado por app.config['RECURRENCE_VIRTUAL'] (default: True).
+    """
+    return bool(current_app.config.get('RECURRENCE_VIRTUAL', True))
+
+
+def _load_origins(account_type: str | None = None) -> list[Account]:
+    query = Account.query.filter(
+        Account.recurring == True,
+        Account.parent_id.is_(None)
+    )
+    if account_type:
+        query = query.filter(Account.type == account_type)
+    return query.all()
+
+
+def _origin_applies_to(origin: Account, year: int, month: int) -> bool:
+    """True se a origem precisa de um filho no mês/ano (não antes do início, nem no próprio mês da origem)."""
+    if not origin.date:
+        return False
+
+    origin_ym = (origin.date.year, origin.date.month)
+    return (year, month) > origin_ym
+
+
+def _child_row(origin: Account, year: int, month: int) -> dict:
+    day = origin.recurring_day or origin.date.day
+    day = min(day, monthrange(year, month)[1])
+
+    return {
+        'description': origin.description,
+        'amount': origin.amount,
+        'type': origin.type,
+        'category': origin.category,
+        'date': datetime(year, month, day),
+        'period': period_key(year, month),
+        'recurring': False,
+        'parent_id': origin.id,
+        'recurring_day': origin.recurring_day,
+        'consolidated': False,
+    }
+
+
+def _existing_child_pairs(periods: list[int]) -> set[tuple[int, int]]:
+    """Uma consulta: todos os (parent_id, period) já materializados entre o menor e o maior período."""
+    if not periods:
+        return set()
+
+    rows = db.session.query(Account.parent_id, Account.period).filter(
+        Account.parent_id.isnot(None),
+        Account.period.between(min(periods), max(periods))
+    ).all()
+    return {(parent_id, period) for parent_id, period in rows}
+
+
+def _months_in_range(start_dt: datetime, end_dt: datetime) -> list[tuple[int, int]]:
+    """Lista (year, month) de start_dt até end_dt (inclusive)."""
+    months = []
+    y, m = start_dt.year, start_dt.month
+    end_ym = (end_dt.year, end_dt.month)
+
+    while (y, m) <= end_ym:
+        months.append((y, m))
+        m += 1
+        if m > 12:
+            m = 1
+            y += 1
+
+    return months
+
+
+def materialize_recurring_for_months(months: list[tuple[int, int]], commit: bool = True) -> int:
+    """Motor set-based de materialização para uma lista de (year, month).
+
+    1. Carrega as origens recorrentes (1 consulta).
+    2. Carrega os pares (parent_id, period) já existentes (1 consulta).
+    3. Insere os filhos faltantes em lote com INSERT OR IGNORE; o índice único
+       (parent_id, period) garante que requisições concorrentes não dupliquem.
+
+    Faz commit apenas se criar algo (e commit=True). Retorna a quantidade de lançamentos criados.
+    """
+    if not months:
+        return 0
+
+    origins = _load_origins()
+    if not origins:
+        return 0
+
+    existing = _existing_child_pairs([period_key(y, m) for y, m in months])
+
+    rows = []
+    for year, month in months:
+        period = period_key(year, month)
+        for origin in origins:
+            if not _origin_applies_to(origin, year, month):
+                continue
+            if (origin.id, period) in existing:
+                continue
+            rows.append(_child_row(origin, year, month))
+
+    if not rows:
+        return 0
+
+    result = db.session.execute(insert(Account.__table__).prefix_with('OR IGNORE'), rows)
+
+    created = result.rowcount
+    if created is None or created < 0:
+        created = len(rows)
+
+    # INSERT em lote não passa pelos eventos do ORM: atualizar o rollup mensal aqui.
+    # Se algo foi ignorado (corrida com outra requisição), recalcula só os meses afetados.
+    if created == len(rows):
+        apply_account_rows(rows)
+    else:
+        rebuild_monthly_ledger({row['period'] for row in rows}, commit=False)
+
+    if commit:
+        db.session.commit()
+    return created
 
 
 def ensure_recurring_materialized_for_month(year: int, month: int) -> int:
@@ -13,63 +139,178 @@ def ensure_recurring_materialized_for_month(year: int, month: int) -> int:
     Regra:
     - Não gera meses anteriores ao mês/ano de início (date) da origem.
     - Se a origem já pertence ao mês/ano alvo, não cria filho (a origem é o lançamento daquele mês).
-    - Evita duplicidade checando por parent_id + (year, month).
+    - Evita duplicidade checando por parent_id + period (year*100+month).
 
     Retorna a quantidade de lançamentos criados.
     """
-    origins = Account.query.filter(
+    return materialize_recurring_for_months([(year, month)])
+
+
+def ensure_recurring_materialized_for_range(start_dt: datetime, end_dt: datetime) -> int:
+    """Materializa recorrências para todos os meses do intervalo (inclusive) em uma passada.
+
+    Monta a grade (origem, mês) em memória, compara com os filhos existentes em
+    uma única consulta e insere a diferença em lote. Mesmas regras do mês único.
+    """
+    if start_dt > end_dt:
+        return 0
+    return materialize_recurring_for_months(_months_in_range(start_dt, end_dt))
+
+
+def materialize_recurring_through(end_dt: datetime) -> int:
+    """Materializa desde a origem mais antiga até end_dt e grava a marca RecurrenceWatermark.
+
+    Tudo numa transação: o DELETE da marca vem primeiro e já toma o lock de
+    escrita, então nenhuma outra escrita em accounts entra entre a leitura das
+    origens e a marca gravada. Retorna a quantidade de lançamentos criados.
+    """
+    db.session.execute(delete(RecurrenceWatermark.__table__))
+
+    first_origin = db.session.query(func.min(Account.date)).filter(
         Account.recurring == True,
         Account.parent_id.is_(None)
-    ).all()
+    ).scalar()
 
     created = 0
-    for origin in origins:
-        if not origin.date:
-            continue
+    if first_origin and first_origin <= end_dt:
+        created = materialize_recurring_for_months(_months_in_range(first_origin, end_dt), commit=False)
 
-        origin_ym = (origin.date.year, origin.date.month)
-        target_ym = (year, month)
+    db.session.execute(insert(RecurrenceWatermark.__table__), [{
+        'id': 1,
+        'materialized_through': period_key(end_dt.year, end_dt.month),
+        'updated_at': datetime.utcnow(),
+    }])
+    db.session.commit()
+    return created
 
-        # Não gerar para meses anteriores ao início da origem
-        if target_ym < origin_ym:
-            continue
 
-        # Se a própria origem já é do mês/ano alvo, não cria filho
-        if origin.date.year == year and origin.date.month == month:
-            continue
+def virtual_occurrence_id(origin_id: int, period: int) -> str:
+    """Identificador estável de uma ocorrência virtual (ex.: 'v12-202610')."""
+    return f"v{origin_id}-{period}"
 
-        day = origin.recurring_day or origin.date.day
-        max_day = monthrange(year, month)[1]
-        day = min(day, max_day)
-        target_date = datetime(year, month, day)
 
-        exists = Account.query.filter(
-            Account.parent_id == origin.id,
-            extract('year', Account.date) == year,
-            extract('month', Account.date) == month
-        ).first()
+def parse_virtual_occurrence_id(value: str) -> tuple[int, int] | None:
+    """Inverso de virtual_occurrence_id: retorna (origin_id, period) ou None se inválido."""
+    try:
+        origin_part, period_part = str(value).lstrip('v').split('-', 1)
+        return int(origin_part), int(period_part)
+    except (ValueError, AttributeError):
+        return None
 
-        if exists:
-            continue
 
-        child = Account(
-            description=origin.description,
-            amount=origin.amount,
-            type=origin.type,
-            category=origin.category,
-            date=target_date,
-            recurring=False,
-            parent_id=origin.id,
-            recurring_day=origin.recurring_day,
-            consolidated=False
-        )
-        db.session.add(child)
-        created += 1
-
-    if created:
-        db.session.commit()
+def _virtual_dict(origin: Account, row: dict) -> dict:
+    """Mesmo formato de Account.to_dict, para uma ocorrência ainda não gravada."""
+    return {
+        'id': virtual_occurrence_id(origin.id, row['period']),
+        'description': row['description'],
+        'amount': row['amount'],
+        'type': row['type'],
+        'category': row['category'],
+        'date': row['date'].strftime('%Y-%m-%d'),
+        'recurring': False,
+        'parent_id': origin.id,
+        'recurring_day': row['recurring_day'],
+        'consolidated': False,
+        'consolidated_date': None,
+        'status': 'Pendente',
+        'is_recurring_origin': False,
+        'is_recurring_child': True,
+        'children_count': 0,
+        'virtual': True,
+    }
 
-    return created
+
+def _materialized_through() -> int | None:
+    """Último período com todos os filhos gravados (RecurrenceWatermark; None = desconhecido)."""
+    return db.session.execute(
+        select(RecurrenceWatermark.materialized_through).where(RecurrenceWatermark.id == 1)
+    ).scalar()
+
+
+def iter_virtual_occurrences(start_dt: datetime | None, end_dt: datetime, account_type: str | None = None):
+    """Gera as ocorrências recorrentes do intervalo [start_dt, end_dt] que ainda não têm filho gravado.
+
+    Nada é escrito no banco: cada origem produz uma ocorrência por mês (mesmas regras
+    da materialização) e os meses que já têm filho são descartados com uma única consulta.
+    start_dt=None começa na origem mais antiga.
+
+    Meses até a marca gravada pelo agendador (todas as origens, desde o início;
+    apagada por triggers quando deixa de valer) são pulados: o custo depende só
+    dos meses além do horizonte, não do tamanho do histórico.
+    """
+    watermark = _materialized_through()
+    if watermark is not None:
+        after = datetime(watermark // 100, watermark % 100, 1) + relativedelta(months=1)
+        if after > end_dt:
+            return
+        if start_dt is None or start_dt < after:
+            start_dt = after
+
+    origins = [o for o in _load_origins(account_type) if o.date]
+    if not origins:
+        return
+
+    if start_dt is None:
+        start_dt = min(o.date for o in origins).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if start_dt > end_dt:
+        return
+
+    months = _months_in_range(start_dt, end_dt)
+    existing = _existing_child_pairs([period_key(y, m) for y, m in months])
+
+    for year, month in months:
+        period = period_key(year, month)
+        for origin in origins:
+            if not _origin_applies_to(origin, year, month):
+                continue
+            if (origin.id, period) in existing:
+                continue
+
+            row = _child_row(origin, year, month)
+            if start_dt <= row['date'] <= end_dt:
+                yield _virtual_dict(origin, row)
+
+
+def virtual_occurrence_totals(start_dt: datetime | None, end_dt: datetime) -> dict:
+    """Somas das ocorrências virtuais do intervalo (sempre pendentes): income, expense e count."""
+    totals = {'income': 0.0, 'expense': 0.0, 'count': 0}
+    for item in iter_virtual_occurrences(start_dt, end_dt):
+        if item['type'] in ('income', 'expense'):
+            totals[item['type']] += float(item['amount'])
+        totals['count'] += 1
+    return totals
+
+
+def materialize_occurrence(origin_id: int, period: int) -> Account | None:
+    """Grava (se ainda não existir) o filho de uma origem para um período e o retorna.
+
+    Usado quando o usuário edita/consolida uma ocorrência virtual. Retorna None se a
+    origem não existir ou não gerar ocorrência nesse mês.
+    """
+    origin = Account.query.get(origin_id)
+    if not origin or not origin.recurring or origin.parent_id:
+        return None
+
+    year, month = divmod(period, 100)
+    if not 1 <= month <= 12:
+        return None
+
+    if origin.date and (origin.date.year, origin.date.month) == (year, month):
+        return origin
+
+    if not _origin_applies_to(origin, year, month):
+        return None
+
+    row = _child_row(origin, year, month)
+    result = db.session.execute(insert(Account.__table__).prefix_with('OR IGNORE'), [row])
+    if result.rowcount:
+        apply_account_rows([row])
+    db.session.commit()
+
+    return Account.query.filter(
+        Account.parent_id == origin.id,
+        Account.period == period
+    ).first()
 
 
 def list_recurring_occurrences_for_month(year: int, month: int, account_type: str) -> list[dict]:
@@ -78,16 +319,23 @@ def list_recurring_occurrences_for_month(year: int, month: int, account_type: st
     Convenção:
     - Se a origem cair no mês alvo, ela mesma é a ocorrência (source='origin').
     - Caso contrário, a ocorrência é o filho materializado (source='child').
+    - No modo virtual, meses sem filho gravado usam a ocorrência calculada (source='virtual').
 
-    A função sempre materializa o mês primeiro para evitar "sumir" recorrências.
+    Fora do modo virtual, a função materializa o mês primeiro para evitar "sumir" recorrências.
     """
-    ensure_recurring_materialized_for_month(year, month)
+    virtual = virtual_mode_enabled()
+    if not virtual:
+        ensure_recurring_materialized_for_month(year, month)
 
-    origins = Account.query.filter(
-        Account.type == account_type,
-        Account.recurring == True,
-        Account.parent_id.is_(None)
+    origins = _load_origins(account_type)
+
+    children = Account.query.filter(
+        Account.parent_id.isnot(None),
+        Account.period == period_key(year, month)
     ).all()
+    child_by_origin = {}
+    for child in children:
+        child_by_origin.setdefault(child.parent_id, child)
 
     items: list[dict] = []
     for origin in origins:
@@ -103,13 +351,21 @@ def list_recurring_occurrences_for_month(year: int, month: int, account_type: st
             acc = origin
             source = 'origin'
         else:
-            acc = Account.query.filter(
-                Account.parent_id == origin.id,
-                extract('year', Account.date) == year,
-                extract('month', Account.date) == month
-            ).first()
+            acc = child_by_origin.get(origin.id)
             source = 'child' if acc else 'missing'
 
+        if not acc and virtual:
+            row = _child_row(origin, year, month)
+            items.append({
+                'source': 'virtual',
+                'origin_id': origin.id,
+                'account_id': None,
+                'description': row['description'],
+                'amount': float(row['amount']),
+                'date': row['date'].strftime('%d/%m/%Y'),
+            })
+            continue
+
         if not acc:
             # Não deveria acontecer se materialização estiver ok
             continue
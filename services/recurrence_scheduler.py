@@ -0,0 +1,120 @@
+import threading
+import traceback
+from datetime import datetime
+from calendar import monthrange
+
+from dateutil.relativedelta import relativedelta
+
+from services.recurrence import materialize_recurring_through
+
+
+class RecurrenceHorizonScheduler:
+    """Thread em background que mantém os filhos recorrentes gravados até um horizonte.
+
+    A cada execução materializa, para todas as origens recorrentes, os meses desde o
+    início de cada origem até mês atual + horizon_months (o passado fica gravado
+    para os relatórios; só meses além do horizonte ficam virtuais). Roda na
+    inicialização, periodicamente (interval_seconds) e quando request_run() é
+    chamado (origem criada/alterada), assim as rotas não precisam gerar meses de
+    forma síncrona. Cada execução grava a marca RecurrenceWatermark (último mês
+    materializado), usada pelas leituras virtuais para pular o histórico.
+
+    Configuração (app.config):
+    - RECURRENCE_SCHEDULER_ENABLED (default True; lido por start_background_jobs)
+    - RECURRENCE_HORIZON_MONTHS (default 12)
+    - RECURRENCE_SCHEDULER_INTERVAL (segundos, default 3600)
+
+    Mesmo padrão de db = SQLAlchemy(): instância global + init_app(app); a
+    thread só sobe em services/background_jobs.start_background_jobs. Duplicatas
+    entre processos são evitadas pelo índice único (parent_id, period) usado
+    pela materialização.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.horizon_months = 12
+        self.interval_seconds = 3600
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.last_run_at = None
+        self.last_created = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.horizon_months = int(app.config.get('RECURRENCE_HORIZON_MONTHS', 12))
+        self.interval_seconds = float(app.config.get('RECURRENCE_SCHEDULER_INTERVAL', 3600))
+
+        app.extensions['recurrence_scheduler'] = self
+
+    def horizon(self, today: datetime | None = None) -> tuple[datetime, datetime]:
+        """Intervalo materializado: início do mês atual até o fim do mês atual + horizonte."""
+        today = today or datetime.now()
+        start = datetime(today.year, today.month, 1)
+        end_ref = start + relativedelta(months=self.horizon_months)
+        end = datetime(end_ref.year, end_ref.month, monthrange(end_ref.year, end_ref.month)[1], 23, 59, 59)
+        return start, end
+
+    def run_once(self) -> int:
+        """Materializa o horizonte agora (na thread atual). Retorna quantos lançamentos criou."""
+        with self._lock:
+            with self.app.app_context():
+                _, end = self.horizon()
+                created = materialize_recurring_through(end)
+
+            self.last_run_at = datetime.now()
+            self.last_created = created
+
+        if created:
+            print(f"🔁 Recorrência: {created} lançamentos gerados até {end.strftime('%m/%Y')}")
+        return created
+
+    def request_run(self):
+        """Pede uma execução assim que possível (sem bloquear a requisição).
+
+        Com a thread periódica ativa, só a acorda; senão (agendador desligado ou
+        ainda não iniciado), roda numa thread avulsa. Até a execução terminar, as
+        leituras calculam como virtuais os meses sem filho (os triggers já apagaram
+        a marca no commit da origem).
+        """
+        if self._thread and self._thread.is_alive():
+            self._wakeup.set()
+        elif self.app is not None:
+            threading.Thread(target=self._run_logged, name='recurrence-horizon-once', daemon=True).start()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='recurrence-horizon', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run_logged(self):
+        try:
+            self.run_once()
+        except Exception as e:
+            print(f"⚠️ Falha no agendador de recorrência: {e}")
+            traceback.print_exc()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._run_logged()
+
+            self._wakeup.wait(self.interval_seconds)
+            self._wakeup.clear()
+
+
+recurrence_scheduler = RecurrenceHorizonScheduler()
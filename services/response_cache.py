@@ -0,0 +1,82 @@
+"""Cache LRU em memória para respostas prontas (bytes), com TTL e contadores.
+
+A chave deve incluir a versão dos dados (services/data_version.py), assim um
+commit relevante invalida as entradas sem varrer o cache; entradas antigas saem
+por LRU ou TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """LRU thread-safe: get/set por chave, maxsize entradas, ttl_seconds de validade.
+
+    Mesmo padrão de db = SQLAlchemy(): instância global + init_app(app), lendo
+    <PREFIX>_SIZE e <PREFIX>_TTL de app.config.
+    """
+
+    def __init__(self, config_prefix: str, maxsize: int = 128, ttl_seconds: float = 60.0):
+        self.config_prefix = config_prefix
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.maxsize = int(app.config.get(f'{self.config_prefix}_SIZE', self.maxsize))
+        self.ttl_seconds = float(app.config.get(f'{self.config_prefix}_TTL', self.ttl_seconds))
+        app.extensions[self.config_prefix.lower()] = self
+        self.clear()
+
+    def get(self, key):
+        """Valor da chave ou None (conta hit/miss; entrada vencida conta como miss)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# /calendar/api/events (CALENDAR_CACHE_SIZE / CALENDAR_CACHE_TTL)
+calendar_events_cache = ResponseCache('CALENDAR_CACHE')
@@ -1,10 +1,9 @@
 # services/recurrence.py
 from datetime import datetime
 from calendar import monthrange
-from sqlalchemy import extract
 
 from database import db
-from models import Account
+from models import Account, period_key
 
 
 def ensure_recurring_materialized_for_month(year: int, month: int) -> int:
@@ -14,7 +13,7 @@ def ensure_recurring_materialized_for_month(year: int, month: int) -> int:
     Regra (mesma do accounts):
     - Não gera meses anteriores ao início da origem.
     - Se a origem já é do mês/ano alvo, não cria filho (a origem vale como ocorrência do mês).
-    - Evita duplicidade checando por parent_id + (year, month).
+    - Evita duplicidade checando por parent_id + period (year*100+month).
     """
     origins = Account.query.filter(
         Account.recurring == True,
@@ -41,8 +40,7 @@ def ensure_recurring_materialized_for_month(year: int, month: int) -> int:
 
         exists = Account.query.filter(
             Account.parent_id == origin.id,
-            extract('year', Account.date) == year,
-            extract('month', Account.date) == month
+            Account.period == period_key(year, month)
         ).first()
 
         if exists:
@@ -97,8 +95,7 @@ def list_recurring_occurrences_for_month(year: int, month: int, account_type: st
         else:
             acc = Account.query.filter(
                 Account.parent_id == origin.id,
-                extract('year', Account.date) == year,
-                extract('month', Account.date) == month
+                Account.period == period_key(year, month)
             ).first()
             source = "child" if acc else "missing"
 
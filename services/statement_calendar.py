@@ -0,0 +1,84 @@
+"""Calendário de faturas do cartão: fechamento, vencimento e próxima fatura por mês.
+
+Fonte única das regras de statement (antes repetidas em models, rotas de
+cartão, faturas e migração). Os meses são calculados uma vez e memorizados
+por (closing_day, due_day, ano, mês): como a chave são os próprios dias do
+cartão, mudar closing_day/due_day leva a outras entradas e nunca devolve
+data antiga (não há o que invalidar à mão). Gerar parcelas em lote ou
+antecipar vira consulta ao cache, sem monthrange/relativedelta por linha.
+
+Aceita qualquer objeto com closing_day/due_day (CreditCard ou linha crua).
+"""
+from calendar import monthrange
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import NamedTuple
+
+
+class Statement(NamedTuple):
+    """Uma fatura do cartão (statement) no mês/ano."""
+    month: int
+    year: int
+    closing_date: datetime
+    due_date: datetime
+    next_month: int
+    next_year: int
+
+
+def _card_days(card) -> tuple[int, int]:
+    """(closing_day, due_day) do cartão; due_day vazio = fechamento + 7 dias."""
+    return card.closing_day, card.due_day or ((card.closing_day or 1) + 7)
+
+
+@lru_cache(maxsize=4096)
+def _statement(closing_day: int, due_day: int, year: int, month: int) -> Statement:
+    days_in_month = monthrange(year, month)[1]
+    closing_date = datetime(year, month, min(closing_day, days_in_month))
+
+    # due_day pode passar do último dia do mês (ex.: fechamento 28 + 7 dias)
+    if due_day <= days_in_month:
+        due_date = datetime(year, month, due_day)
+    else:
+        due_date = datetime(year, month, days_in_month) + timedelta(days=due_day - days_in_month)
+
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return Statement(month, year, closing_date, due_date, next_month, next_year)
+
+
+@lru_cache(maxsize=1024)
+def _statements(closing_day: int, due_day: int, year: int, month: int, count: int) -> tuple[Statement, ...]:
+    statements = []
+    for _ in range(count):
+        statement = _statement(closing_day, due_day, year, month)
+        statements.append(statement)
+        year, month = statement.next_year, statement.next_month
+    return tuple(statements)
+
+
+def statement(card, month: int, year: int) -> Statement:
+    """Fatura do cartão no mês/ano (fechamento, vencimento e próxima)."""
+    return _statement(*_card_days(card), int(year), int(month))
+
+
+def due_date(card, month: int, year: int) -> datetime:
+    """Vencimento da fatura do cartão para um statement (mês/ano)."""
+    return statement(card, month, year).due_date
+
+
+def statement_for_date(card, when: datetime) -> Statement:
+    """Fatura em que cai uma compra feita em `when`: a do mês se ainda não fechou, senão a próxima."""
+    current = statement(card, when.month, when.year)
+    if when >= current.closing_date:
+        return statement(card, current.next_month, current.next_year)
+    return current
+
+
+def statements_from_date(card, when: datetime, count: int) -> tuple[Statement, ...]:
+    """As `count` faturas consecutivas a partir da compra em `when` (uma por parcela)."""
+    first = statement_for_date(card, when)
+    return _statements(*_card_days(card), first.year, first.month, int(count))
+
+
+def cache_info() -> dict:
+    """Estatísticas do cache (acertos/erros/tamanho), para diagnóstico."""
+    return {'statements': _statement.cache_info()._asdict(), 'sequences': _statements.cache_info()._asdict()}
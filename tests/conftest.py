@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import db, init_db  # noqa: E402
+import models  # noqa: E402,F401
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App com banco SQLite temporário (sem threads de background)."""
+    from services.balance import init_balance
+    from services.invoices import init_invoices
+    from services.ledger import init_ledger
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TESTING'] = True
+    init_db(app)
+    init_ledger(app)
+    init_invoices(app)
+    init_balance(app)
+
+    with app.app_context():
+        yield app
+        db.session.remove()
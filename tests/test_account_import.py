@@ -0,0 +1,24 @@
+import io
+
+from models import Account
+from services.account_import import import_statement
+
+
+def _csv(lines):
+    return io.BytesIO(('data;descricao;valor\n' + '\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def test_repeated_movement_out_of_date_order_is_not_deduplicated(app):
+    lines = ['01/10/2026;Cafe;-5,00']
+    lines += [f'{day:02d}/10/2026;Mercado {day};-{day},00' for day in range(2, 10)]
+    lines += ['01/10/2026;Cafe;-5,00']
+
+    result = import_statement(_csv(lines), 'csv')
+    assert result['imported'] == 10
+    assert result['duplicates'] == 0
+    assert Account.query.filter_by(description='Cafe').count() == 2
+
+    # Reimportar o mesmo extrato não duplica nada
+    again = import_statement(_csv(lines), 'csv')
+    assert again['imported'] == 0
+    assert again['duplicates'] == 10
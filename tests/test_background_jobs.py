@@ -0,0 +1,27 @@
+from services import background_jobs
+from services.background_jobs import init_background_jobs
+
+
+def test_jobs_start_once_on_first_request(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(background_jobs, 'start_background_jobs', lambda app: calls.append(app) or [])
+    app.add_url_rule('/ping', 'ping', lambda: 'ok')
+    init_background_jobs(app)
+
+    client = app.test_client()
+    client.get('/ping')
+    client.get('/ping')
+
+    assert calls == [app]
+
+
+def test_autostart_disabled(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(background_jobs, 'start_background_jobs', lambda app: calls.append(app) or [])
+    app.config['BACKGROUND_JOBS_AUTOSTART'] = False
+    app.add_url_rule('/ping', 'ping', lambda: 'ok')
+    init_background_jobs(app)
+
+    app.test_client().get('/ping')
+
+    assert calls == []
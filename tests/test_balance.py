@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import db
+from models import Account, period_key
+from services.balance import _prev_period, closing_balance
+
+
+def _snapshots():
+    return dict(db.session.execute(text("SELECT period, closing_balance FROM balance_snapshots")).fetchall())
+
+
+def _last_closed_period():
+    now = datetime.now()
+    return _prev_period(period_key(now.year, now.month))
+
+
+def test_snapshots_are_written_by_the_writer_commit(app):
+    db.session.add(Account(description='Salário', amount=100.0, type='income', date=datetime(2025, 1, 15)))
+    db.session.commit()
+    assert _snapshots()[_last_closed_period()] == 100.0
+
+    # Escrita num mês antigo: snapshots seguintes invalidados e regravados no mesmo commit
+    db.session.add(Account(description='Mercado', amount=30.0, type='expense', date=datetime(2025, 2, 3)))
+    db.session.commit()
+    snapshots = _snapshots()
+    assert snapshots[period_key(2025, 1)] == 100.0
+    assert snapshots[_last_closed_period()] == 70.0
+    assert closing_balance(_last_closed_period()) == 70.0
+
+
+def test_closing_balance_is_read_only(app):
+    db.session.add(Account(description='Salário', amount=100.0, type='income', date=datetime(2025, 1, 15)))
+    db.session.commit()
+    db.session.execute(text("DELETE FROM balance_snapshots"))
+    db.session.commit()
+
+    assert closing_balance(_last_closed_period()) == 100.0
+    db.session.rollback()
+    assert _snapshots() == {}
@@ -0,0 +1,21 @@
+from sqlalchemy import text
+
+from database import _ensure_indexes, _index_definition, db, get_index_report
+
+
+def test_outdated_and_obsolete_indexes_are_replaced(app):
+    # Banco criado com definições antigas: mesmo nome, outras colunas, e índices removidos do esquema
+    db.session.execute(text("DROP INDEX ix_installments_statement"))
+    db.session.execute(text("CREATE INDEX ix_installments_statement ON installments (transaction_id)"))
+    db.session.execute(text("CREATE INDEX ix_bills_due_paid ON bills (due_date, paid)"))
+    db.session.execute(text("CREATE INDEX ix_accounts_date ON accounts (date)"))
+    db.session.commit()
+
+    _ensure_indexes()
+
+    assert _index_definition('ix_installments_statement') == (
+        'installments', ('statement_period', 'paid', 'transaction_id', 'amount'), False
+    )
+    assert _index_definition('ix_bills_due_paid') is None
+    assert _index_definition('ix_accounts_date') is None
+    assert all(item['exists'] for item in get_index_report())
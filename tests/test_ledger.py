@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from database import db
+from models import CreditCard, Transaction
+from services import ledger
+from services.ledger import check_monthly_ledger
+
+
+def _card(name, closing_day=10, due_day=20):
+    card = CreditCard(name=name, limit_total=5000.0, closing_day=closing_day, due_day=due_day)
+    db.session.add(card)
+    db.session.flush()
+    return card
+
+
+def _purchase(card, amount=150.0, installments_total=3, category=None):
+    tx = Transaction(card_id=card.id, description='Compra', amount=amount,
+                     date=datetime(2026, 10, 2), category=category, installments_total=installments_total)
+    db.session.add(tx)
+    db.session.flush()
+    tx.create_installments()
+    db.session.commit()
+    return tx
+
+
+def test_transaction_card_and_category_change_moves_installments(app):
+    card_a = _card('A')
+    card_b = _card('B')
+    tx = _purchase(card_a)
+    assert check_monthly_ledger() == []
+
+    # Compra carregada (como nas rotas) e movida de cartão/categoria
+    tx = db.session.get(Transaction, tx.id)
+    assert tx.card_id == card_a.id
+    tx.card_id = card_b.id
+    tx.category = 'Mercado'
+    db.session.commit()
+    assert check_monthly_ledger() == []
+
+    tx.category = None
+    db.session.commit()
+    assert check_monthly_ledger() == []
+
+
+def test_expired_update_is_incremental(app, monkeypatch):
+    def _no_rebuild(*args, **kwargs):
+        raise AssertionError('rebuild completo dentro do flush')
+
+    card = _card('A')
+    tx = _purchase(card, installments_total=1)
+    installment = tx.installments[0]
+    db.session.commit()
+    monkeypatch.setattr(ledger, '_rebuild', _no_rebuild)
+
+    # Objetos expirados após o commit: o valor antigo é carregado ao alterar
+    installment.paid = True
+    installment.amount = 99.0
+    tx.date = datetime(2026, 11, 5)
+    db.session.commit()
+    assert check_monthly_ledger() == []
+
+    db.session.delete(tx)
+    db.session.commit()
+    assert check_monthly_ledger() == []
@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete
+
+from database import db
+from models import Account, RecurrenceWatermark
+from services.recurrence import _materialized_through, virtual_occurrence_totals
+from services.recurrence_scheduler import recurrence_scheduler
+
+
+@pytest.fixture
+def scheduler(app):
+    recurrence_scheduler.init_app(app)
+    return recurrence_scheduler
+
+
+@pytest.fixture
+def origin(app):
+    account = Account(description='Aluguel', amount=100.0, type='expense', date=datetime(2024, 1, 5),
+                      recurring=True, recurring_day=5)
+    db.session.add(account)
+    db.session.commit()
+    return account
+
+
+def test_virtual_totals_skip_materialized_months(app, scheduler, origin):
+    # Sem execução do agendador: todos os meses desde a origem são virtuais
+    assert virtual_occurrence_totals(None, datetime(2024, 12, 31))['count'] == 11
+
+    scheduler.run_once()
+    start, end = scheduler.horizon()
+    assert _materialized_through() == end.year * 100 + end.month
+
+    # Tudo até o horizonte gravado: nada virtual antes dele, mesmos totais depois
+    assert virtual_occurrence_totals(None, end)['count'] == 0
+    far_end = datetime(end.year + 2, 12, 31)
+    with_watermark = virtual_occurrence_totals(None, far_end)
+    db.session.execute(delete(RecurrenceWatermark.__table__))
+    db.session.commit()
+    assert virtual_occurrence_totals(None, far_end) == with_watermark
+    assert with_watermark['count'] == (far_end.year - end.year) * 12 + far_end.month - end.month
+
+
+def test_deleted_child_shows_as_virtual(app, scheduler, origin):
+    scheduler.run_once()
+    child = Account.query.filter_by(parent_id=origin.id, period=202406).one()
+
+    db.session.delete(child)
+    db.session.commit()
+
+    assert _materialized_through() is None
+    assert virtual_occurrence_totals(datetime(2024, 6, 1), datetime(2024, 6, 30))['count'] == 1
+
+
+def test_origin_added_by_another_process_clears_watermark(app, scheduler, origin):
+    scheduler.run_once()
+
+    # Outro processo/script gravando direto no arquivo, fora desta sessão
+    other = sqlite3.connect(db.engine.url.database)
+    other.execute(
+        "INSERT INTO accounts (description, amount, type, date, recurring, recurring_day, consolidated) "
+        "VALUES ('Internet', 50.0, 'expense', '2023-06-10 00:00:00', 1, 10, 0)"
+    )
+    other.commit()
+    other.close()
+
+    assert _materialized_through() is None
+    assert virtual_occurrence_totals(datetime(2024, 6, 1), datetime(2024, 6, 30))['count'] == 1
+
+
+def test_unrelated_account_keeps_watermark(app, scheduler, origin):
+    scheduler.run_once()
+    db.session.add(Account(description='Mercado', amount=30.0, type='expense', date=datetime(2024, 6, 2)))
+    db.session.commit()
+
+    assert _materialized_through() is not None
+
+
+def test_request_run_without_thread_runs_in_background(app, scheduler, monkeypatch):
+    ran_in = []
+    monkeypatch.setattr(scheduler, 'run_once', lambda: ran_in.append(threading.current_thread()))
+
+    scheduler.request_run()
+    for thread in threading.enumerate():
+        if thread.name == 'recurrence-horizon-once':
+            thread.join(5)
+
+    assert len(ran_in) == 1
+    assert ran_in[0] is not threading.main_thread()